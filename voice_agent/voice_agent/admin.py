@@ -1,15 +1,21 @@
 from django.contrib import admin
-from .models import Document, ChatMessage
+from .models import Document, ChatMessage, IngestionJob
 
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
     list_display = ('filename', 'content_type', 'timestamp')
-    search_fields = ('filename', 'processed_text')
-    readonly_fields = ('timestamp',)
+    search_fields = ('filename', 'content_hash')
+    readonly_fields = ('timestamp', 'content_hash', 'page_offsets', 'extraction')
 
 @admin.register(ChatMessage)
 class ChatMessageAdmin(admin.ModelAdmin):
     list_display = ('document', 'message', 'timestamp', 'agent_id')
     search_fields = ('message', 'response')
     readonly_fields = ('timestamp',)
-    list_filter = ('agent_id',) 
\ No newline at end of file
+    list_filter = ('agent_id',)
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ('document', 'stage', 'progress', 'attempts', 'created_at', 'updated_at')
+    readonly_fields = ('created_at', 'updated_at')
+    list_filter = ('stage',)
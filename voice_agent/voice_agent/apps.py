@@ -0,0 +1,25 @@
+import os
+import sys
+import threading
+
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class VoiceAgentConfig(AppConfig):
+    name = 'voice_agent'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # Load a local speech model in the background so the first voice request does not pay for it
+        if getattr(settings, 'SPEECH_PREWARM', True) and getattr(settings, 'SPEECH_BACKEND', 'google') in ('vosk', 'whisper'):
+            from .speech import prewarm
+            threading.Thread(target=prewarm, daemon=True, name='speech-prewarm').start()
+
+        # Ingestion jobs live in worker memory; pick up the ones a previous worker left unfinished.
+        # Only when serving: migrate, test, shell and the benchmarks must not start indexing.
+        management_command = os.path.basename(sys.argv[0]) == 'manage.py' and sys.argv[1:2] != ['runserver']
+        if getattr(settings, 'INGESTION_RESUME_ON_START', True) and not management_command:
+            from .ingestion import resume_stale_jobs
+            threading.Thread(target=resume_stale_jobs, daemon=True, name='ingestion-resume').start()
@@ -13,4 +13,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'voice_agent.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after the app registry is ready
+from .voice_stream import voice_websocket  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # Streaming voice input is a plain ASGI WebSocket; everything else is Django
+    if scope['type'] == 'websocket' and scope['path'] == '/ws/voice/':
+        return await voice_websocket(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -0,0 +1,223 @@
+"""Native asyncio versions of the API views, for serving through voice_agent.asgi.
+
+Network calls (query embeddings, the router LLM and the answer completion)
+go through a shared httpx connection pool, so a single process can hold many
+conversations that are waiting on I/O. ffmpeg runs as an asyncio subprocess.
+Blocking work that has no async equivalent (ORM, FAISS, speech recognition)
+is handed to threads with sync_to_async; speech synthesis is awaited on the
+TTS worker pool.
+"""
+import asyncio
+import json
+import logging
+import weakref
+
+import httpx
+import speech_recognition as sr
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from . import embeddings, views
+from .audio import AudioConversionError, adecode_to_pcm
+from .caching import QUERY_EMBEDDING_CACHE, normalize_query
+from .embedding_cache import EMBEDDING_CACHE
+from .index_store import INDEX_STORE
+from .llm_client import GROQ_CLIENT, LLMError, chat_answer
+from .routing import aroute_prompt_with_llm
+from .speech import transcribe_utterances
+from .tts import TTS_POOL, TTSTimeoutError
+from .vad import split_utterances
+
+logger = logging.getLogger(__name__)
+
+ASYNC_HTTP_MAX_CONNECTIONS = getattr(settings, 'ASYNC_HTTP_MAX_CONNECTIONS', 100)
+ASYNC_HTTP_MAX_KEEPALIVE = getattr(settings, 'ASYNC_HTTP_MAX_KEEPALIVE', 20)
+ASYNC_HTTP_TIMEOUT = getattr(settings, 'ASYNC_HTTP_TIMEOUT', 120)
+
+# httpx clients are bound to the event loop they were created on
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """Return the pooled keep-alive client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=ASYNC_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=ASYNC_HTTP_MAX_KEEPALIVE,
+            ),
+            timeout=httpx.Timeout(ASYNC_HTTP_TIMEOUT, connect=5.0),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def aget_query_embedding(query):
+    """Async counterpart of embeddings.get_query_embedding, sharing the same caches."""
+    key = (embeddings.EMBEDDING_MODEL, normalize_query(query))
+    embedding = QUERY_EMBEDDING_CACHE.get(key)
+    if embedding is not None:
+        return embedding
+    cached = await sync_to_async(EMBEDDING_CACHE.get_many, thread_sensitive=False)([key[1]], key[0])
+    if cached:
+        embedding = cached[0]
+    else:
+        embedding = (await embeddings.aembed_batch(get_async_client(), [key[1]], model=key[0]))[0]
+        await sync_to_async(EMBEDDING_CACHE.put_many, thread_sensitive=False)([key[1]], [embedding], key[0])
+    QUERY_EMBEDDING_CACHE.set(key, embedding)
+    return embedding
+
+
+async def agroq_chat(plan):
+    """Send a planned chat completion and return the answer text."""
+    result = await GROQ_CLIENT.achat(get_async_client(), views._chat_payload(plan), label=plan['label'])
+    return chat_answer(result)
+
+
+async def aplan_message_call(data):
+    """views._plan_message_call with the router LLM call awaited on the event loop.
+
+    Document loading and retrieval still run in a thread, one step at a time;
+    no thread waits on the router's upstream round-trip.
+    """
+    advance = sync_to_async(views._advance_plan, thread_sensitive=False)
+    steps = views._plan_message_steps(data)
+    router_args, result = await advance(steps)
+    while router_args is not None:
+        try:
+            decision = await aroute_prompt_with_llm(get_async_client(), *router_args)
+        except LLMError as e:
+            router_args, result = await advance(steps, error=e)
+        else:
+            router_args, result = await advance(steps, decision)
+    return result
+
+
+@csrf_exempt
+@require_POST
+async def process_message(request):
+    message = None
+    try:
+        data = json.loads(request.body)
+        message = data.get('message')
+        document_id = data.get('document_id')
+        # Embed the query on the event loop so retrieval inside the plan is a cache hit
+        if document_id and message and document_id in INDEX_STORE:
+            try:
+                await aget_query_embedding(message)
+            except Exception as e:
+                # Retrieval retries the embedding with backoff on its own
+                logger.warning(f"Async query embedding failed: {str(e)}")
+        plan, early_response = await aplan_message_call(data)
+        if early_response is not None:
+            return early_response
+        answer = await agroq_chat(plan)
+        payload = await sync_to_async(views._finish_message_call, thread_sensitive=False)(plan, answer)
+        return JsonResponse(payload)
+    except Exception as e:
+        logger.error(f"Error processing message: {str(e)}", exc_info=True)
+        return JsonResponse(views._message_error_payload(e, message), status=500)
+
+
+@csrf_exempt
+@require_POST
+async def upload_document(request):
+    try:
+        logger.info("Received document upload request")
+        if 'file' not in request.FILES:
+            logger.error("No file provided in request")
+            return JsonResponse({'error': 'No file provided'}, status=400)
+        document, job = await sync_to_async(views.save_uploaded_document, thread_sensitive=False)(request.FILES['file'])
+        return views.upload_response(document, job)
+    except Exception as e:
+        logger.error(f"Error processing document: {str(e)}", exc_info=True)
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_POST
+async def process_voice_input(request):
+    """Handle voice input and convert to text."""
+    try:
+        if 'audio' not in request.FILES:
+            logger.error("No audio file provided in request")
+            return JsonResponse({'error': 'No audio file provided'}, status=400)
+        audio_file = request.FILES['audio']
+        logger.info(f"Received audio file: {audio_file.name}, size: {audio_file.size} bytes")
+        try:
+            pcm = await adecode_to_pcm(audio_file.read())
+        except AudioConversionError as e:
+            logger.error(f"FFmpeg conversion error: {str(e)}")
+            return JsonResponse({'error': 'Failed to convert audio format'}, status=500)
+        except FileNotFoundError:
+            logger.error("FFmpeg not found. Please install FFmpeg.")
+            return JsonResponse({'error': 'Audio conversion service not available'}, status=500)
+        utterances = await sync_to_async(split_utterances, thread_sensitive=False)(pcm)
+        if not utterances:
+            return JsonResponse({'error': 'No speech detected. Please try speaking again.'}, status=400)
+        text = await sync_to_async(transcribe_utterances, thread_sensitive=False)(utterances)
+        return JsonResponse({'text': text})
+    except sr.UnknownValueError:
+        logger.error("Speech recognition could not understand audio")
+        return JsonResponse({'error': 'Could not understand audio. Please try speaking more clearly.'}, status=400)
+    except sr.RequestError as e:
+        logger.error(f"Could not request results from speech recognition service: {str(e)}")
+        return JsonResponse({'error': 'Speech recognition service error. Please try again.'}, status=500)
+    except Exception as e:
+        logger.error(f"Error processing voice input: {str(e)}", exc_info=True)
+        return JsonResponse({'error': f'Error processing voice input: {str(e)}'}, status=500)
+
+
+@csrf_exempt
+@require_POST
+async def generate_voice_response(request):
+    """Generate voice response on the pyttsx3 worker pool."""
+    try:
+        data = json.loads(request.body)
+        text = data.get('text')
+        try:
+            agent_id = views.voice_agent_id(data)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        logger.info(f"Generating voice response for Agent {agent_id}")
+        if not text:
+            return JsonResponse({'error': 'No text provided'}, status=400)
+        # The pool hands back a concurrent future, so no thread waits on the engine
+        speech = await asyncio.wrap_future(TTS_POOL.submit(text, voice=agent_id))
+        return views.wav_attachment(speech.wav_bytes(), 'response.wav')
+    except TTSTimeoutError as e:
+        logger.error(f"Error generating voice response: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=504)
+    except Exception as e:
+        logger.error(f"Error generating voice response: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_POST
+async def podcast_tts(request):
+    """Generate podcast TTS audio from a script with multi-voice narration."""
+    try:
+        data = json.loads(request.body)
+        script = data.get('script', '')
+        if not script.strip():
+            return JsonResponse({'error': 'No script provided.'}, status=400)
+        turns = views.parse_podcast_script(script)
+        if not turns:
+            return JsonResponse({'error': 'No valid agent turns found in script.'}, status=400)
+        futures = views.submit_podcast_turns(turns)
+        try:
+            speeches = await asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
+        finally:
+            for future in futures:
+                future.cancel()
+        return views.wav_attachment(views.assemble_podcast(speeches), 'podcast.wav')
+    except TTSTimeoutError as e:
+        return JsonResponse({'error': str(e)}, status=504)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
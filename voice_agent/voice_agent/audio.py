@@ -0,0 +1,257 @@
+"""Decoding of recorded voice input to raw PCM, entirely in memory.
+
+Uploads are piped into ffmpeg's stdin and 16-bit mono PCM at the
+recognizer's native 16 kHz is read back from its stdout. A few ffmpeg
+processes are started ahead of time and block on their empty stdin, so a
+request finds a decoder already past fork/exec and start-up. WAV uploads
+that need no container decoding skip ffmpeg altogether. Recordings streamed
+in pieces go through a single ffmpeg process as they arrive. The async views
+run ffmpeg as an asyncio subprocess instead, so no thread waits on it.
+"""
+import asyncio
+import io
+import logging
+import subprocess
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+CHANNELS = 1
+
+FFMPEG_BINARY = getattr(settings, 'FFMPEG_BINARY', 'ffmpeg')
+FFMPEG_TIMEOUT = getattr(settings, 'FFMPEG_TIMEOUT', 30)
+# Idle ffmpeg processes kept waiting for input; 0 starts one per request
+FFMPEG_WARM_PROCESSES = getattr(settings, 'FFMPEG_WARM_PROCESSES', 2)
+
+
+class AudioConversionError(Exception):
+    pass
+
+
+def ffmpeg_pcm_command():
+    """ffmpeg reading any container from stdin and writing raw s16le mono PCM to stdout."""
+    return [
+        FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error',
+        '-i', 'pipe:0',
+        '-f', 's16le',
+        '-acodec', 'pcm_s16le',
+        '-ar', str(SAMPLE_RATE),
+        '-ac', str(CHANNELS),
+        'pipe:1',
+    ]
+
+
+class FFmpegDecoder:
+    """Hands out pre-started ffmpeg processes and starts replacements in the background."""
+
+    def __init__(self, warm_processes=2):
+        self.warm_processes = warm_processes
+        self._idle = []
+        self._lock = threading.Lock()
+        self._spawner = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ffmpeg-warm')
+
+    def _start(self):
+        return subprocess.Popen(ffmpeg_pcm_command(), stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def _refill(self):
+        try:
+            while True:
+                with self._lock:
+                    # Drop processes that died while idle
+                    self._idle = [process for process in self._idle if process.poll() is None]
+                    if len(self._idle) >= self.warm_processes:
+                        return
+                process = self._start()
+                with self._lock:
+                    self._idle.append(process)
+        except FileNotFoundError:
+            # No ffmpeg installed; requests report it when they start their own process
+            pass
+
+    def _acquire(self):
+        with self._lock:
+            while self._idle:
+                process = self._idle.pop()
+                if process.poll() is None:
+                    break
+            else:
+                process = None
+        if self.warm_processes:
+            self._spawner.submit(self._refill)
+        # Raises FileNotFoundError when ffmpeg is missing
+        return process or self._start()
+
+    def decode(self, data):
+        """Decode an encoded audio upload to 16 kHz mono s16le PCM bytes."""
+        process = self._acquire()
+        try:
+            pcm, stderr = process.communicate(input=data, timeout=FFMPEG_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise AudioConversionError(f"ffmpeg did not finish within {FFMPEG_TIMEOUT}s")
+        if process.returncode != 0:
+            raise AudioConversionError(stderr.decode(errors='replace'))
+        return pcm
+
+    def open_stream(self):
+        """Start decoding an upload that arrives in pieces; see StreamingDecode."""
+        return StreamingDecode(self._acquire())
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for process in idle:
+            process.kill()
+            process.wait()
+
+
+class StreamingDecode:
+    """One ffmpeg process fed an encoded stream piece by piece.
+
+    A reader thread collects PCM as ffmpeg produces it, so ``feed`` never
+    blocks on a full stdout pipe and returns whatever PCM is ready so far.
+    """
+
+    def __init__(self, process):
+        self.process = process
+        self._pcm = bytearray()
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read, daemon=True, name='ffmpeg-stream')
+        self._reader.start()
+
+    def _read(self):
+        while True:
+            data = self.process.stdout.read1(64 * 1024)
+            if not data:
+                return
+            with self._lock:
+                self._pcm.extend(data)
+
+    def _take(self):
+        with self._lock:
+            data = bytes(self._pcm)
+            self._pcm.clear()
+        return data
+
+    def feed(self, data):
+        """Send the next piece of the upload and return the PCM decoded so far."""
+        try:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            raise AudioConversionError(self._stderr() or 'ffmpeg exited early')
+        return self._take()
+
+    def finish(self):
+        """Close the input and return the remaining PCM."""
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self._reader.join(FFMPEG_TIMEOUT)
+        try:
+            self.process.wait(timeout=FFMPEG_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.close()
+            raise AudioConversionError(f"ffmpeg did not finish within {FFMPEG_TIMEOUT}s")
+        if self.process.returncode != 0:
+            raise AudioConversionError(self._stderr())
+        return self._take()
+
+    def _stderr(self):
+        self.process.wait()
+        return self.process.stderr.read().decode(errors='replace')
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+
+def _pcm_samples(frames, width):
+    """Little-endian PCM frames of ``width`` bytes per sample as float32 in [-1, 1)."""
+    if width == 1:
+        # 8-bit WAV is unsigned
+        return (np.frombuffer(frames, dtype='u1').astype('float32') - 128) / 128
+    if width == 3:
+        # Shift each 24-bit sample into the top of an int32 to keep its sign
+        padded = np.zeros((len(frames) // 3, 4), dtype='u1')
+        padded[:, 1:] = np.frombuffer(frames, dtype='u1').reshape(-1, 3)
+        frames, width = padded.tobytes(), 4
+    if width in (2, 4):
+        return np.frombuffer(frames, dtype=f'<i{width}').astype('float32') / 2 ** (8 * width - 1)
+    return None
+
+
+def _wav_to_pcm(data):
+    """Convert a PCM WAV file to the target format in-process, or return None if it needs ffmpeg."""
+    try:
+        with wave.open(io.BytesIO(data), 'rb') as wav:
+            if wav.getcomptype() != 'NONE':
+                return None
+            channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError, RuntimeError):
+        # RuntimeError: chunk sizes that run past the end of the data
+        return None
+    if channels not in (1, 2):
+        return None
+    if (channels, width, rate) == (CHANNELS, SAMPLE_WIDTH, SAMPLE_RATE):
+        return frames
+    frames = frames[:len(frames) - len(frames) % (width * channels)]
+    samples = _pcm_samples(frames, width)
+    if samples is None:
+        return None
+    samples = samples.reshape(-1, channels).mean(axis=1)
+    if rate != SAMPLE_RATE:
+        # Linear interpolation, as audioop.ratecv did; speech recognizers do not need better
+        count = len(samples) * SAMPLE_RATE // rate
+        samples = np.interp(np.arange(count) * (rate / SAMPLE_RATE), np.arange(len(samples)), samples)
+    return (np.clip(samples, -1.0, 32767 / 32768) * 32768).astype('<i2').tobytes()
+
+
+def decode_to_pcm(data):
+    """Return the audio upload ``data`` as 16 kHz mono 16-bit PCM bytes."""
+    if data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+        pcm = _wav_to_pcm(data)
+        if pcm is not None:
+            return pcm
+    return FFMPEG_DECODER.decode(data)
+
+
+async def adecode_to_pcm(data):
+    """decode_to_pcm for the event loop: ffmpeg runs as an asyncio subprocess.
+
+    The asyncio process is started per request; the pre-started processes of
+    FFMPEG_DECODER are blocking pipes and stay with the sync views.
+    """
+    if data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+        pcm = await asyncio.to_thread(_wav_to_pcm, data)
+        if pcm is not None:
+            return pcm
+    # Raises FileNotFoundError when ffmpeg is missing
+    process = await asyncio.create_subprocess_exec(
+        *ffmpeg_pcm_command(),
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        pcm, stderr = await asyncio.wait_for(process.communicate(data), FFMPEG_TIMEOUT)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise AudioConversionError(f"ffmpeg did not finish within {FFMPEG_TIMEOUT}s")
+    if process.returncode != 0:
+        raise AudioConversionError(stderr.decode(errors='replace'))
+    return pcm
+
+
+FFMPEG_DECODER = FFmpegDecoder(warm_processes=FFMPEG_WARM_PROCESSES)
@@ -0,0 +1,75 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+def normalize_query(text):
+    """Collapse whitespace so trivially different spellings of a prompt share cache entries."""
+    return re.sub(r'\s+', ' ', text or '').strip()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize=1024, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires_at = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, predicate=None):
+        """Drop every entry whose key matches ``predicate`` (all entries if omitted)."""
+        with self._lock:
+            if predicate is None:
+                self._data.clear()
+                return
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'entries': len(self._data),
+            'max_entries': self.maxsize,
+        }
+
+
+QUERY_CACHE_SIZE = getattr(settings, 'QUERY_CACHE_SIZE', 1024)
+QUERY_CACHE_TTL = getattr(settings, 'QUERY_CACHE_TTL', 600)
+
+# normalized query -> query embedding
+QUERY_EMBEDDING_CACHE = TTLCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+# (document_id, index version, normalized query, top_k) -> chunk ids
+SEARCH_RESULT_CACHE = TTLCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+
+
+def invalidate_document_results(document_id):
+    SEARCH_RESULT_CACHE.invalidate(lambda key: key[0] == document_id)
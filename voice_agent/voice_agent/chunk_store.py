@@ -0,0 +1,65 @@
+import mmap
+import os
+from collections.abc import Sequence
+
+import numpy as np
+
+BLOB_FILENAME = 'chunks.bin'
+OFFSETS_FILENAME = 'chunk_offsets.npy'
+
+
+class ChunkStore(Sequence):
+    """Read-only chunk texts stored as one UTF-8 blob plus an offsets array.
+
+    Chunk ``i`` is ``blob[offsets[i]:offsets[i + 1]]``. Opened from disk both
+    files are memory-mapped, so every worker process reads the same page-cache
+    pages and only the chunks actually returned are decoded into ``str``.
+    """
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._view = memoryview(blob)
+        self._offsets = offsets
+
+    @classmethod
+    def from_texts(cls, texts):
+        encoded = [text.encode('utf-8') for text in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype='int64')
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        return cls(b''.join(encoded), offsets)
+
+    @classmethod
+    def open(cls, directory):
+        offsets = np.load(os.path.join(directory, OFFSETS_FILENAME), mmap_mode='r')
+        with open(os.path.join(directory, BLOB_FILENAME), 'rb') as f:
+            # mmap rejects empty files
+            blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if offsets[-1] else b''
+        return cls(blob, offsets)
+
+    def write_blob(self, path):
+        with open(path, 'wb') as f:
+            f.write(self._view)
+
+    def write_offsets(self, path):
+        with open(path, 'wb') as f:
+            np.save(f, np.asarray(self._offsets, dtype='int64'))
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def raw(self, i):
+        """Zero-copy memoryview of chunk ``i``'s UTF-8 bytes."""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('chunk index out of range')
+        return self._view[int(self._offsets[i]):int(self._offsets[i + 1])]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return str(self.raw(i), 'utf-8')
+
+    @property
+    def nbytes(self):
+        return int(self._offsets[-1])
@@ -0,0 +1,142 @@
+"""Streaming chunker for document text.
+
+Chunks are built from a stream of pages (as yielded by
+``extraction.iter_document_pages``) and are themselves yielded one at a time,
+so memory use does not grow with document size. Strategies:
+
+- ``sentence``: pack whole sentences up to ``chunk_size`` tokens.
+- ``token``: fixed windows of ``chunk_size`` tokens, ignoring sentence ends.
+- ``heading``: like ``sentence``, but a Markdown heading (or a DOCX heading,
+  which the extractor renders as one) always starts a new chunk and is
+  repeated at the top of every chunk of its section.
+
+Consecutive chunks share up to ``overlap`` tokens of trailing sentences (or
+words, for ``token``), so a fact on a chunk boundary is retrievable from both.
+"""
+import os
+import re
+
+from django.conf import settings
+
+from .context import count_tokens, iter_sentences
+
+SENTENCE = 'sentence'
+TOKEN = 'token'
+HEADING = 'heading'
+STRATEGIES = (SENTENCE, TOKEN, HEADING)
+
+# 'auto' uses 'heading' for Markdown/DOCX and 'sentence' for everything else
+CHUNK_STRATEGY = getattr(settings, 'CHUNK_STRATEGY', 'auto')
+CHUNK_SIZE_TOKENS = getattr(settings, 'CHUNK_SIZE_TOKENS', 512)
+CHUNK_OVERLAP_TOKENS = getattr(settings, 'CHUNK_OVERLAP_TOKENS', 64)
+
+HEADING_RE = re.compile(r'^\s{0,3}(#{1,6})\s+(.+?)\s*#*\s*$')
+SENTENCE_END_RE = re.compile(r'[.!?]["\')\]]*\s*$')
+
+
+def strategy_for(file_path, strategy=None):
+    strategy = strategy or CHUNK_STRATEGY
+    if strategy in STRATEGIES:
+        return strategy
+    return HEADING if os.path.splitext(file_path)[1].lower() in ('.md', '.docx') else SENTENCE
+
+
+def _iter_units(pages):
+    """Yield ``('heading', text)`` and ``('sentence', text)`` units from a stream of pages.
+
+    Lines inside a paragraph are joined (PDF text breaks lines mid-sentence) and
+    a sentence left unfinished at the end of a page is carried into the next one,
+    unless the page ends with a blank line (as every DOCX paragraph does).
+    """
+    carry = ''
+    for page in pages:
+        paragraph = [carry] if carry else []
+        carry = ''
+        lines = page.split('\n')
+        if lines and not lines[-1]:
+            # A page's closing newline is not a paragraph break...
+            lines.pop()
+        # ...but any blank line after its text is
+        ends_paragraph = bool(lines) and not lines[-1].strip()
+        while lines and not lines[-1].strip():
+            lines.pop()
+        for line in lines:
+            heading = HEADING_RE.match(line)
+            if heading or not line.strip():
+                if paragraph:
+                    yield from (('sentence', s) for s in iter_sentences(' '.join(paragraph)))
+                    paragraph = []
+                if heading:
+                    yield 'heading', heading.group(2)
+                continue
+            paragraph.append(line.strip())
+        if paragraph:
+            sentences = list(iter_sentences(' '.join(paragraph)))
+            if sentences and not ends_paragraph and not SENTENCE_END_RE.search(sentences[-1]):
+                carry = sentences.pop()
+            yield from (('sentence', s) for s in sentences)
+    if carry:
+        yield 'sentence', carry
+
+
+def _split_oversized(text, chunk_size):
+    """Split a single unit longer than a chunk into word windows."""
+    words, used = [], 0
+    for word in text.split():
+        cost = count_tokens(word)
+        if words and used + cost > chunk_size:
+            yield ' '.join(words)
+            words, used = [], 0
+        words.append(word)
+        used += cost
+    if words:
+        yield ' '.join(words)
+
+
+def iter_chunks(pages, strategy=SENTENCE, chunk_size=None, overlap=None):
+    """Yield chunk texts from an iterable of page texts."""
+    chunk_size = chunk_size or CHUNK_SIZE_TOKENS
+    overlap = CHUNK_OVERLAP_TOKENS if overlap is None else overlap
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown chunking strategy: {strategy}")
+
+    current = []  # (text, tokens) of the chunk being built
+    current_tokens = 0
+    fresh = False  # whether current holds anything beyond the overlap from the previous chunk
+    section = None
+
+    def emit():
+        body = ' '.join(text for text, _ in current)
+        return f"{section}\n{body}" if section else body
+
+    for kind, text in _iter_units(pages):
+        if kind == 'heading':
+            if strategy == HEADING:
+                if fresh:
+                    yield emit()
+                # Sections do not overlap each other
+                current, current_tokens, fresh = [], 0, False
+                section = text
+                continue
+            kind = 'sentence'
+        pieces = text.split() if strategy == TOKEN else [text]
+        for piece in pieces:
+            cost = count_tokens(piece)
+            for part in (_split_oversized(piece, chunk_size) if cost > chunk_size else [piece]):
+                part_cost = count_tokens(part) if part is not piece else cost
+                if current and current_tokens + part_cost > chunk_size:
+                    if fresh:
+                        yield emit()
+                    # Carry the trailing units that fit in the overlap into the next chunk
+                    tail, tail_tokens = [], 0
+                    for unit in reversed(current):
+                        if tail_tokens + unit[1] > overlap or tail_tokens + unit[1] + part_cost > chunk_size:
+                            break
+                        tail.insert(0, unit)
+                        tail_tokens += unit[1]
+                    current, current_tokens, fresh = tail, tail_tokens, False
+                current.append((part, part_cost))
+                current_tokens += part_cost
+                fresh = True
+    if fresh:
+        yield emit()
@@ -0,0 +1,103 @@
+"""Token-budgeted packing of retrieved text into prompts.
+
+Token counts use a local approximation of a BPE tokenizer (one token per
+punctuation mark, about four characters per word piece), which is close
+enough for English to keep prompts inside a budget without a tokenizer
+dependency.
+"""
+import logging
+import math
+import re
+
+from django.conf import settings
+
+from .caching import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# Per-call context budgets, in approximate tokens
+CONTEXT_BUDGET_AGENT = getattr(settings, 'CONTEXT_BUDGET_AGENT', 3000)
+CONTEXT_BUDGET_SUMMARY = getattr(settings, 'CONTEXT_BUDGET_SUMMARY', 2000)
+CONTEXT_BUDGET_PODCAST = getattr(settings, 'CONTEXT_BUDGET_PODCAST', 2000)
+CONTEXT_BUDGET_PODCAST_QA = getattr(settings, 'CONTEXT_BUDGET_PODCAST_QA', 500)
+
+TOKEN_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+# A sentence ends at . ! ? (plus closing quotes/brackets) followed by whitespace, or at a line break
+SENTENCE_RE = re.compile(r"[^\n]*?(?:[.!?]+[\"')\]]*(?=\s)|\n|$)")
+ABBREVIATIONS = frozenset(['dr', 'mr', 'mrs', 'ms', 'prof', 'st', 'jr', 'sr', 'vs', 'etc', 'e.g', 'i.e', 'no',
+                           'fig', 'inc', 'ltd', 'co', 'approx', 'dept', 'est'])
+
+
+def count_tokens(text):
+    """Approximate the number of LLM tokens in ``text``."""
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in TOKEN_PIECE_RE.findall(text))
+
+
+def iter_sentences(text):
+    """Yield the non-empty sentences of ``text`` lazily, in order."""
+    pending = ''
+    for match in SENTENCE_RE.finditer(text):
+        sentence = match.group(0).strip()
+        if not sentence:
+            continue
+        if pending:
+            sentence = f"{pending} {sentence}"
+        # "Dr. Smith" or "e.g. pumps" does not end a sentence
+        if sentence.endswith('.') and sentence.rsplit(None, 1)[-1][:-1].lower() in ABBREVIATIONS:
+            pending = sentence
+            continue
+        pending = ''
+        yield sentence
+    if pending:
+        yield pending
+
+
+def _clip_words(sentence, budget):
+    words = []
+    used = 0
+    for word in sentence.split():
+        cost = count_tokens(word)
+        if used + cost > budget:
+            break
+        words.append(word)
+        used += cost
+    return ' '.join(words), used
+
+
+def pack_context(chunks, budget, separator='\n\n'):
+    """Pack chunks, most relevant first, into at most ``budget`` tokens.
+
+    Sentences already packed (overlapping or duplicate chunks) are skipped and
+    a chunk that does not fit is cut at a sentence boundary. The only cut
+    inside a sentence is when the very first sentence alone exceeds the
+    budget, e.g. text extracted without punctuation.
+    """
+    parts = []
+    seen = set()
+    used = 0
+    exhausted = False
+    for chunk in chunks:
+        kept = []
+        complete = True
+        for sentence in iter_sentences(chunk):
+            key = normalize_query(sentence).lower()
+            if key in seen:
+                complete = False
+                continue
+            cost = count_tokens(sentence)
+            if used + cost > budget:
+                if not parts and not kept:
+                    clipped, cost = _clip_words(sentence, budget - used)
+                    kept.append(clipped)
+                    used += cost
+                exhausted = True
+                break
+            seen.add(key)
+            kept.append(sentence)
+            used += cost
+        if kept:
+            parts.append(chunk.strip() if complete and not exhausted else ' '.join(kept))
+        if exhausted:
+            break
+    logger.debug(f"Packed {len(parts)} chunks into ~{used} tokens (budget {budget})")
+    return separator.join(parts)
@@ -0,0 +1,226 @@
+"""Server-side orchestration of multi-agent discussions.
+
+The frontend used to drive a discussion with one process_message request per
+agent turn. The discussion endpoint routes the prompt once and then runs the
+whole exchange in a single streamed response: independent per-agent answers
+run concurrently, dependent discussion turns run back to back, and every turn
+is sent to the client as a Server-Sent Event as soon as it is done.
+"""
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.decorators import api_view
+
+from . import views
+from .llm_client import GROQ_CLIENT, LLMError, chat_answer
+from .routing import route_prompt_locally, route_prompt_with_llm
+
+logger = logging.getLogger(__name__)
+
+DISCUSSION_WORKERS = getattr(settings, 'DISCUSSION_WORKERS', 4)
+# Agent turns plus the closing summary, same default as the frontend's discussion limit
+DISCUSSION_DEFAULT_LIMIT = getattr(settings, 'DISCUSSION_DEFAULT_LIMIT', 5)
+DISCUSSION_MAX_LIMIT = getattr(settings, 'DISCUSSION_MAX_LIMIT', 15)
+
+_executor = ThreadPoolExecutor(max_workers=DISCUSSION_WORKERS, thread_name_prefix='discussion')
+
+
+class TurnError(Exception):
+    def __init__(self, payload, status=500):
+        super().__init__(payload.get('error', 'Turn failed'))
+        self.payload = payload
+        self.status = status
+
+
+def route_discussion(message, discussion_history):
+    """Route a prompt once for the whole discussion, local grammar first."""
+    route = route_prompt_locally(message)
+    if route is None:
+        route = route_prompt_with_llm(message, discussion_history)
+    if route is None:
+        return {'discussion_required': False, 'initiator_agent_id': 1,
+                'responding_agent_ids': [1], 'revised_prompt': message}
+    route = dict(route)
+    if not route.get('initiator_agent_id'):
+        route['initiator_agent_id'] = 1
+    if not route.get('responding_agent_ids'):
+        route['responding_agent_ids'] = [1, 2] if route.get('discussion_required') else [route['initiator_agent_id']]
+    return route
+
+
+def agent_prompt(route, agent_id, message):
+    revised_prompt = route.get('revised_prompt') or message
+    if isinstance(revised_prompt, dict):
+        return revised_prompt.get(str(agent_id)) or message
+    return revised_prompt
+
+
+def run_turn(data):
+    """Plan, call and persist one agent turn; returns the process_message payload."""
+    started = time.perf_counter()
+    try:
+        plan, early_response = views._plan_message_call(data)
+        if early_response is not None:
+            payload = json.loads(early_response.content)
+            if early_response.status_code != 200:
+                raise TurnError(payload, early_response.status_code)
+            return payload
+        answer = chat_answer(GROQ_CLIENT.chat(views._chat_payload(plan), label=plan['label']))
+        payload = views._finish_message_call(plan, answer)
+        payload['timings'] = {'total': round(time.perf_counter() - started, 3)}
+        return payload
+    finally:
+        close_old_connections()
+
+
+def agent_models(data):
+    """Map agent id to model type from the request's ``agents`` list; raises ValueError on malformed input."""
+    agents = data.get('agents') or [{'id': 1}, {'id': 2}]
+    default_model = data.get('agent_model_type', 'critical')
+    if not isinstance(agents, list):
+        raise ValueError("agents must be a list")
+    models = {}
+    for agent in agents:
+        try:
+            models[int(agent['id'])] = agent.get('model') or default_model
+        except (TypeError, KeyError, ValueError, AttributeError):
+            raise ValueError(f"Invalid agent: {agent!r}; expected an object with a numeric id")
+    return models
+
+
+def discussion_limit(data):
+    """Turns to run, clamped to [2, DISCUSSION_MAX_LIMIT]; raises ValueError when not a number."""
+    try:
+        limit = int(data.get('discussion_limit') or DISCUSSION_DEFAULT_LIMIT)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid discussion_limit: {data.get('discussion_limit')!r}")
+    return max(2, min(limit, DISCUSSION_MAX_LIMIT))
+
+
+class DiscussionOrchestrator:
+    """Runs a routed prompt to completion, yielding SSE events.
+
+    Raises ValueError for a malformed ``agents`` list or ``discussion_limit``.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.message = data.get('message') or ''
+        self.document_id = data.get('document_id')
+        self.history = list(data.get('discussion_history') or [])
+        self.agent_models = agent_models(data)
+        self.limit = discussion_limit(data)
+
+    def _turn_request(self, agent_id, message, **flags):
+        return {
+            'document_id': self.document_id,
+            'message': message,
+            'agent_id': agent_id,
+            'agent_model_type': self.agent_models.get(agent_id, 'critical'),
+            'discussion_history': list(self.history),
+            'is_single_agent': False,
+            'is_routed': True,
+            **flags,
+        }
+
+    @staticmethod
+    def _history_entry(agent_id, payload):
+        return f"Agent {agent_id}: {payload.get('response', '')}"
+
+    def _turn_event(self, turn, agent_id, payload, **extra):
+        self.history.append(self._history_entry(agent_id, payload))
+        return views._sse_event('turn', {'turn': turn, 'agent_id': agent_id, **extra, **payload})
+
+    def events(self):
+        started = time.perf_counter()
+        try:
+            self.history.append(f"User: {self.message}")
+            route = route_discussion(self.message, self.history[:-1])
+            yield views._sse_event('route', route)
+            if route.get('discussion_required'):
+                yield from self._discussion_turns(route)
+            else:
+                yield from self._independent_turns(route)
+            yield views._sse_event('done', {
+                'discussion_history': self.history,
+                'timings': {'total': round(time.perf_counter() - started, 3)},
+            })
+        except TurnError as e:
+            yield views._sse_event('error', {**e.payload, 'status': e.status})
+        except LLMError as e:
+            logger.error(f"Discussion LLM error: {str(e)}")
+            yield views._sse_event('error', views._message_error_payload(e, self.message))
+        except Exception as e:
+            logger.error(f"Error running discussion: {str(e)}", exc_info=True)
+            yield views._sse_event('error', views._message_error_payload(e, self.message))
+
+    def _independent_turns(self, route):
+        # Separate instructions for each agent do not depend on each other, so run them concurrently
+        futures = {}
+        for turn, agent_id in enumerate(route['responding_agent_ids']):
+            request = self._turn_request(agent_id, agent_prompt(route, agent_id, self.message))
+            futures[_executor.submit(run_turn, request)] = (turn, agent_id)
+        # Each turn is streamed as soon as it is done, but recorded in planned order
+        # so the transcript does not depend on which call returned first
+        entries = {}
+        try:
+            for future in as_completed(futures):
+                turn, agent_id = futures[future]
+                payload = future.result()
+                entries[turn] = self._history_entry(agent_id, payload)
+                yield views._sse_event('turn', {'turn': turn, 'agent_id': agent_id, **payload})
+        finally:
+            for future in futures:
+                future.cancel()
+        self.history.extend(entries[turn] for turn in sorted(entries))
+
+    def _discussion_turns(self, route):
+        initiator_id = route['initiator_agent_id']
+        agent_ids = sorted(set(self.agent_models) | set(route['responding_agent_ids']))
+        # Initiator speaks first, then the others in id order, as the frontend does
+        speakers = [initiator_id] + [agent_id for agent_id in agent_ids if agent_id != initiator_id]
+        for turn in range(self.limit - 1):
+            agent_id = speakers[turn % len(speakers)]
+            if turn == 0:
+                message = agent_prompt(route, agent_id, self.message)
+            else:
+                message = "Continue the discussion. The current conversation is:\n" + '\n'.join(self.history)
+            payload = run_turn(self._turn_request(agent_id, message))
+            yield self._turn_event(turn, agent_id, payload)
+        summary_request = self._turn_request(
+            initiator_id,
+            "Continue the discussion. The current conversation is:\n" + '\n'.join(self.history),
+            is_final_summary=True,
+            is_last_turn=True,
+            master_agent_id=initiator_id,
+        )
+        yield self._turn_event(self.limit - 1, initiator_id, run_turn(summary_request), is_final_summary=True)
+
+
+@api_view(['POST'])
+def discussion(request):
+    """Run a multi-agent exchange server-side and stream it as Server-Sent Events.
+
+    Emits a ``route`` event with the routing decision, one ``turn`` event per
+    agent answer (the final one carries the master agent's summary) and a
+    ``done`` event with the updated discussion history.
+    """
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    if not data.get('document_id') or not data.get('message'):
+        return JsonResponse({'error': 'Missing document_id or message'}, status=400)
+    try:
+        orchestrator = DiscussionOrchestrator(data)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    response = StreamingHttpResponse(orchestrator.events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
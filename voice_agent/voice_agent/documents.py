@@ -0,0 +1,100 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import numpy as np
+from django.conf import settings
+
+from .caching import SEARCH_RESULT_CACHE, normalize_query
+from .embeddings import EmbeddingPipeline, get_query_embedding
+from .global_index import GLOBAL_INDEX
+from .index_store import INDEX_STORE
+from .lexical import reciprocal_rank_fusion
+from .vector_index import build_index
+
+logger = logging.getLogger(__name__)
+
+# 'hybrid' fuses BM25 and FAISS hits; 'dense' or 'lexical' use one retriever
+RETRIEVAL_MODE = getattr(settings, 'RETRIEVAL_MODE', 'hybrid')
+RRF_K = getattr(settings, 'RRF_K', 60)
+HYBRID_CANDIDATES = getattr(settings, 'HYBRID_CANDIDATES', 20)
+# Past this many seconds hybrid search answers from BM25 alone (the embedding still lands in the cache)
+QUERY_EMBEDDING_TIMEOUT = getattr(settings, 'QUERY_EMBEDDING_TIMEOUT', 2.0)
+
+_query_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='query-embed')
+
+# Helper: Build FAISS index for a list of chunk texts
+def build_faiss_index(chunks, progress_callback=None):
+    embeddings = EmbeddingPipeline().run(chunks, progress_callback=progress_callback)
+    index = build_index(embeddings)
+    return index, embeddings
+
+# Helper: Search FAISS for top_k similar chunks
+# Passing document_id/version memoizes the hit ids until the document is re-indexed
+def search_faiss(query, index, chunks, top_k=3, document_id=None, version=None):
+    cache_key = (document_id, version, normalize_query(query), top_k) if document_id is not None else None
+    chunk_ids = SEARCH_RESULT_CACHE.get(cache_key) if cache_key else None
+    if chunk_ids is None:
+        query_emb = np.array([get_query_embedding(query)]).astype('float32')
+        D, I = index.search(query_emb, top_k)
+        # FAISS pads with -1 when the index holds fewer than top_k vectors
+        chunk_ids = [int(i) for i in I[0] if i >= 0]
+        if cache_key:
+            SEARCH_RESULT_CACHE.set(cache_key, chunk_ids)
+    return [chunks[i] for i in chunk_ids]
+
+# Helper: Hybrid search: BM25 and FAISS candidates merged with reciprocal rank fusion
+# Exact names, codes and numbers come from BM25; when the embedding server is slow or down
+# the lexical hits are used on their own
+def search_hybrid(query, indexed_document, top_k=3):
+    cache_key = (indexed_document.document_id, indexed_document.version, normalize_query(query), top_k, RETRIEVAL_MODE)
+    chunk_ids = SEARCH_RESULT_CACHE.get(cache_key)
+    if chunk_ids is not None:
+        return [indexed_document.chunks[i] for i in chunk_ids]
+
+    n_candidates = max(top_k * 4, HYBRID_CANDIDATES)
+    lexical_ids = []
+    if RETRIEVAL_MODE != 'dense':
+        lexical_ids = [i for i, _ in indexed_document.lexical.search(query, n_candidates)]
+    dense_ids = []
+    degraded = False
+    if RETRIEVAL_MODE != 'lexical':
+        future = _query_executor.submit(get_query_embedding, query)
+        try:
+            # Without lexical hits there is nothing to fall back on, so wait (and raise) as before
+            query_vector = future.result(timeout=QUERY_EMBEDDING_TIMEOUT if lexical_ids else None)
+        except FutureTimeoutError:
+            logger.warning(f"Query embedding took over {QUERY_EMBEDDING_TIMEOUT}s, using lexical hits only")
+            query_vector = None
+        except Exception as e:
+            if not lexical_ids:
+                raise
+            logger.warning(f"Query embedding failed ({str(e)}), using lexical hits only")
+            query_vector = None
+        if query_vector is None:
+            degraded = True
+        else:
+            D, I = indexed_document.index.search(np.array([query_vector], dtype='float32'), n_candidates)
+            dense_ids = [int(i) for i in I[0] if i >= 0]
+
+    chunk_ids = reciprocal_rank_fusion(dense_ids, lexical_ids, k=RRF_K)[:top_k]
+    if not degraded:
+        SEARCH_RESULT_CACHE.set(cache_key, chunk_ids)
+    return [indexed_document.chunks[i] for i in chunk_ids]
+
+# Helper: Search chunks across documents with one call to the global index
+# document_ids limits the search to those documents (None searches everything)
+def search_documents(query, document_ids=None, top_k=5):
+    hits = GLOBAL_INDEX.search(get_query_embedding(query), top_k=top_k, document_ids=document_ids)
+    results = []
+    for distance, document_id, ordinal in hits:
+        indexed_document = INDEX_STORE.get(document_id)
+        if indexed_document is None or ordinal >= len(indexed_document.chunks):
+            continue
+        results.append({
+            'document_id': document_id,
+            'chunk_index': ordinal,
+            'distance': distance,
+            'text': indexed_document.chunks[ordinal],
+        })
+    return results
@@ -0,0 +1,151 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(text, model):
+    """Content hash identifying an embedding: the same text and model always map to the same key."""
+    return hashlib.sha256(f"{model}\0{text}".encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache persisted in SQLite.
+
+    Vectors are stored as raw float32 blobs keyed by ``content_key``. When the
+    table grows past ``max_entries`` the least recently used tenth is evicted.
+    Rows are only counted when this process's writes since the last count could
+    have reached the cap, or every tenth of the cap to catch other processes'
+    writes, so most inserts skip the full-table COUNT.
+    ``last_used`` is only refreshed once it is ``touch_interval`` seconds old,
+    so repeated hits stay reads and do not queue for the write lock. The file
+    is shared by every worker process; each thread gets its own connection.
+    """
+
+    def __init__(self, path, max_entries=200_000, touch_interval=3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._initialized = False
+        # Rows at the last count, and rows written by this process since
+        self._count_lock = threading.Lock()
+        self._counted = None
+        self._written = 0
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if not self._initialized:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS embeddings ('
+                    'key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)'
+                )
+                conn.execute('CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)')
+                conn.commit()
+                self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, texts, model):
+        """Return {position: embedding} for every text already in the cache."""
+        keys = [content_key(text, model) for text in texts]
+        found = {}
+        stale = []
+        now = time.time()
+        conn = self._connection()
+        # Stay below SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            rows = conn.execute(f'SELECT key, vector, last_used FROM embeddings WHERE key IN ({placeholders})', batch)
+            for key, vector, last_used in rows:
+                found[key] = vector
+                if last_used < now - self.touch_interval:
+                    stale.append(key)
+        if stale:
+            # Eviction only needs last_used to the nearest touch_interval
+            conn.executemany('UPDATE embeddings SET last_used = ? WHERE key = ?', [(now, key) for key in stale])
+            conn.commit()
+        result = {
+            i: np.frombuffer(found[key], dtype='float32').tolist()
+            for i, key in enumerate(keys) if key in found
+        }
+        with self._stats_lock:
+            self.hits += len(result)
+            self.misses += len(keys) - len(result)
+        return result
+
+    def put_many(self, texts, embeddings, model):
+        now = time.time()
+        rows = [
+            (content_key(text, model), np.asarray(embedding, dtype='float32').tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        conn = self._connection()
+        conn.executemany('INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)', rows)
+        conn.commit()
+        self._evict(conn, len(rows))
+
+    def _evict(self, conn, written):
+        with self._count_lock:
+            self._written += written
+            if (self._counted is not None and self._counted + self._written <= self.max_entries
+                    and self._written < max(1, self.max_entries // 10)):
+                return
+            count = conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+            self._counted, self._written = count, 0
+            if count <= self.max_entries:
+                return
+            excess = count - int(self.max_entries * 0.9)
+            conn.execute(
+                'DELETE FROM embeddings WHERE key IN '
+                '(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)', (excess,)
+            )
+            conn.commit()
+            self._counted = count - excess
+        with self._stats_lock:
+            self.evictions += excess
+        logger.info(f"Evicted {excess} embeddings from cache")
+
+    def clear(self):
+        conn = self._connection()
+        conn.execute('DELETE FROM embeddings')
+        conn.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        try:
+            entries = self._connection().execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': entries,
+            'max_entries': self.max_entries,
+        }
+
+
+EMBEDDING_CACHE = EmbeddingCache(
+    path=getattr(settings, 'EMBEDDING_CACHE_PATH', os.path.join(settings.BASE_DIR, 'embedding_cache.sqlite3')),
+    max_entries=getattr(settings, 'EMBEDDING_CACHE_MAX_ENTRIES', 200_000),
+    touch_interval=getattr(settings, 'EMBEDDING_CACHE_TOUCH_INTERVAL', 3600),
+)
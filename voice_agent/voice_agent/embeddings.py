@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import httpx
+import numpy as np
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .caching import QUERY_EMBEDDING_CACHE, normalize_query
+from .embedding_cache import EMBEDDING_CACHE
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_API_URL = getattr(settings, 'OLLAMA_API_URL', 'http://localhost:11434/api')
+EMBEDDING_MODEL = getattr(settings, 'EMBEDDING_MODEL', 'nomic-embed-text')
+EMBEDDING_BATCH_SIZE = getattr(settings, 'EMBEDDING_BATCH_SIZE', 32)
+EMBEDDING_CONCURRENCY = getattr(settings, 'EMBEDDING_CONCURRENCY', 4)
+EMBEDDING_MAX_RETRIES = getattr(settings, 'EMBEDDING_MAX_RETRIES', 3)
+# (connect, read) timeouts in seconds
+EMBEDDING_TIMEOUT = getattr(settings, 'EMBEDDING_TIMEOUT', (3.05, 120))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class EmbeddingError(Exception):
+    pass
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the shared keep-alive session used for all embedding requests."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(EMBEDDING_CONCURRENCY, 1) * 2)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def _embed_request(texts, api_url=None, model=None):
+    """URL and JSON body of an Ollama /api/embed request for ``texts``."""
+    return f"{api_url or OLLAMA_API_URL}/embed", {"model": model or EMBEDDING_MODEL, "input": list(texts)}
+
+
+def _legacy_embed_request(text, api_url=None, model=None):
+    """URL and JSON body of a single-text request to the older /api/embeddings endpoint."""
+    return f"{api_url or OLLAMA_API_URL}/embeddings", {"model": model or EMBEDDING_MODEL, "prompt": text}
+
+
+def _check_embed_response(response):
+    if response.status_code in RETRYABLE_STATUS_CODES:
+        raise EmbeddingError(f"Embedding server returned {response.status_code}: {response.text[:200]}")
+    response.raise_for_status()
+
+
+def _parse_embed_response(response, count):
+    """Return the embeddings in a requests or httpx response, raising EmbeddingError when worth retrying."""
+    _check_embed_response(response)
+    embeddings = response.json().get("embeddings", [])
+    if len(embeddings) != count:
+        raise EmbeddingError(f"Expected {count} embeddings, got {len(embeddings)}")
+    return embeddings
+
+
+def _parse_legacy_embed_response(response):
+    _check_embed_response(response)
+    embedding = response.json().get("embedding")
+    if not embedding:
+        raise EmbeddingError("Embedding server returned no embedding")
+    return embedding
+
+
+# Ollama before 0.3.4 has no /api/embed; set once /api/embed answered 404 and /api/embeddings worked
+_use_legacy_endpoint = False
+
+
+def _switch_to_legacy_endpoint():
+    global _use_legacy_endpoint
+    if not _use_legacy_endpoint:
+        logger.warning("Ollama has no /api/embed endpoint, embedding one text per request through /api/embeddings")
+        _use_legacy_endpoint = True
+
+
+def _retry_delay(error, attempt, max_retries, backoff, count):
+    """Jittered exponential backoff before retrying a failed batch; re-raises ``error`` once retries run out."""
+    if attempt >= max_retries:
+        raise error
+    delay = backoff * (2 ** attempt) * (1 + random.random())
+    logger.warning(f"Embedding batch of {count} failed ({str(error)}), retrying in {delay:.2f}s")
+    return delay
+
+
+def embed_batch(texts, api_url=None, model=None, session=None):
+    """Embed a list of texts with a single request to the Ollama /api/embed endpoint.
+
+    Falls back to one /api/embeddings request per text on servers without /api/embed.
+    """
+    session = session or get_session()
+    if not _use_legacy_endpoint:
+        url, body = _embed_request(texts, api_url, model)
+        response = session.post(url, json=body, timeout=EMBEDDING_TIMEOUT)
+        if response.status_code != 404:
+            return _parse_embed_response(response, len(texts))
+    embeddings = []
+    for text in texts:
+        url, body = _legacy_embed_request(text, api_url, model)
+        embeddings.append(_parse_legacy_embed_response(session.post(url, json=body, timeout=EMBEDDING_TIMEOUT)))
+    _switch_to_legacy_endpoint()
+    return embeddings
+
+
+async def _aembed_once(http_client, texts, api_url, model):
+    timeout = httpx.Timeout(EMBEDDING_TIMEOUT[1], connect=EMBEDDING_TIMEOUT[0])
+    if not _use_legacy_endpoint:
+        url, body = _embed_request(texts, api_url, model)
+        response = await http_client.post(url, json=body, timeout=timeout)
+        if response.status_code != 404:
+            return _parse_embed_response(response, len(texts))
+    embeddings = []
+    for text in texts:
+        url, body = _legacy_embed_request(text, api_url, model)
+        embeddings.append(_parse_legacy_embed_response(await http_client.post(url, json=body, timeout=timeout)))
+    _switch_to_legacy_endpoint()
+    return embeddings
+
+
+async def aembed_batch(http_client, texts, api_url=None, model=None, max_retries=None, backoff=0.5):
+    """embed_batch over an httpx.AsyncClient, retried like EmbeddingPipeline batches."""
+    max_retries = EMBEDDING_MAX_RETRIES if max_retries is None else max_retries
+    attempt = 0
+    while True:
+        try:
+            return await _aembed_once(http_client, texts, api_url, model)
+        except (EmbeddingError, httpx.TransportError) as e:
+            await asyncio.sleep(_retry_delay(e, attempt, max_retries, backoff, len(texts)))
+            attempt += 1
+
+
+# Helper: Get embedding from Ollama nomic-embed-text, checking the embedding cache first
+def get_embedding_ollama(text):
+    cached = EMBEDDING_CACHE.get_many([text], EMBEDDING_MODEL)
+    if cached:
+        return cached[0]
+    embedding = embed_batch([text])[0]
+    EMBEDDING_CACHE.put_many([text], [embedding], EMBEDDING_MODEL)
+    return embedding
+
+
+# Helper: Embed a search query, memoized in memory so repeated retrievals skip the round trip
+def get_query_embedding(query):
+    key = (EMBEDDING_MODEL, normalize_query(query))
+    embedding = QUERY_EMBEDDING_CACHE.get(key)
+    if embedding is None:
+        embedding = get_embedding_ollama(key[1])
+        QUERY_EMBEDDING_CACHE.set(key, embedding)
+    return embedding
+
+
+@dataclass
+class EmbeddingStats:
+    chunks: int = 0
+    cached: int = 0
+    batches: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+
+    @property
+    def chunks_per_sec(self):
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {
+            'chunks': self.chunks,
+            'cached': self.cached,
+            'batches': self.batches,
+            'retries': self.retries,
+            'seconds': round(self.seconds, 3),
+            'chunks_per_sec': round(self.chunks_per_sec, 2),
+        }
+
+
+class EmbeddingPipeline:
+    """Embeds chunks in batches over a bounded pool of concurrent requests.
+
+    Chunks already in the embedding cache, and repeats within the same input,
+    are never sent. Batches share one pooled keep-alive session. Each batch is
+    retried on its own with jittered exponential backoff, so one slow or failed
+    batch does not restart the others. Results come back in input order.
+    """
+
+    def __init__(self, batch_size=None, concurrency=None, max_retries=None,
+                 backoff=0.5, api_url=None, model=None, session=None, cache=EMBEDDING_CACHE):
+        self.batch_size = batch_size or EMBEDDING_BATCH_SIZE
+        self.concurrency = concurrency or EMBEDDING_CONCURRENCY
+        self.max_retries = EMBEDDING_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = backoff
+        self.api_url = api_url
+        self.model = model
+        self.session = session
+        self.cache = cache
+        self.stats = EmbeddingStats()
+        self._stats_lock = threading.Lock()
+
+    def _embed_with_retry(self, batch):
+        attempt = 0
+        while True:
+            try:
+                return embed_batch(batch, api_url=self.api_url, model=self.model, session=self.session)
+            except (EmbeddingError, requests.ConnectionError, requests.Timeout) as e:
+                delay = _retry_delay(e, attempt, self.max_retries, self.backoff, len(batch))
+                with self._stats_lock:
+                    self.stats.retries += 1
+                time.sleep(delay)
+                attempt += 1
+
+    def run(self, chunks, progress_callback=None):
+        """Embed all chunks and return them as an (n, dimension) float32 matrix in input order."""
+        chunks = list(chunks)
+        model = self.model or EMBEDDING_MODEL
+        start = time.perf_counter()
+        cached = self.cache.get_many(chunks, model) if self.cache is not None else {}
+        pending = list(dict.fromkeys(chunk for i, chunk in enumerate(chunks) if i not in cached))
+        if progress_callback and cached:
+            progress_callback(len(chunks) - len(pending), len(chunks))
+
+        batches = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+        results = [None] * len(batches)
+        done = len(chunks) - len(pending)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='embed') as executor:
+            futures = {executor.submit(self._embed_with_retry, batch): i for i, batch in enumerate(batches)}
+            for future in futures:
+                i = futures[future]
+                results[i] = future.result()
+                if self.cache is not None:
+                    self.cache.put_many(batches[i], results[i], model)
+                done += len(batches[i])
+                if progress_callback:
+                    progress_callback(min(done, len(chunks)), len(chunks))
+        embedded = {text: embedding for batch, batch_results in zip(batches, results)
+                    for text, embedding in zip(batch, batch_results)}
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self.stats.chunks += len(chunks)
+            self.stats.cached += len(cached)
+            self.stats.batches += len(batches)
+            self.stats.seconds += elapsed
+        logger.info(
+            f"Embedded {len(chunks)} chunks ({len(cached)} from cache, {len(pending)} sent in "
+            f"{len(batches)} batches) in {elapsed:.2f}s "
+            f"({len(chunks) / elapsed if elapsed else 0:.1f} chunks/sec)"
+        )
+        # Fill one contiguous matrix instead of keeping a list of Python float lists
+        matrix = None
+        for i, chunk in enumerate(chunks):
+            vector = cached[i] if i in cached else embedded[chunk]
+            if matrix is None:
+                matrix = np.empty((len(chunks), len(vector)), dtype='float32')
+            matrix[i] = vector
+        return matrix if matrix is not None else np.empty((0, 0), dtype='float32')
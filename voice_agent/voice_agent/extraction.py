@@ -0,0 +1,174 @@
+"""Streaming text extraction for uploaded documents.
+
+``iter_document_pages`` yields a document's text piece by piece (PDF pages,
+DOCX paragraphs, blocks of a text file) so callers never hold the whole text.
+Large PDFs are split into page ranges extracted by a process pool, with
+results still yielded in page order. Text files are decoded in one pass after
+sniffing the encoding from a bounded prefix.
+
+This module is imported by the pool's worker processes. Besides the limits
+read from django.conf.settings (configured from the DJANGO_SETTINGS_MODULE the
+workers inherit) it imports nothing from the app, so no models or app
+registry are loaded in the workers.
+"""
+import codecs
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import chardet
+import docx
+import PyPDF2
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Plain-text files are streamed to the chunker in blocks of about this many characters
+TEXT_BLOCK_SIZE = getattr(settings, 'TEXT_BLOCK_SIZE', 64 * 1024)
+# Bytes of a text file handed to chardet when it is not valid UTF-8
+ENCODING_SNIFF_BYTES = getattr(settings, 'ENCODING_SNIFF_BYTES', 64 * 1024)
+PDF_EXTRACTION_WORKERS = getattr(settings, 'PDF_EXTRACTION_WORKERS', min(4, os.cpu_count() or 1))
+PDF_PAGES_PER_TASK = getattr(settings, 'PDF_PAGES_PER_TASK', 8)
+# Smaller PDFs are extracted in-process; the pool only pays off once a file has several tasks' worth of pages
+PDF_PARALLEL_MIN_PAGES = getattr(settings, 'PDF_PARALLEL_MIN_PAGES', 24)
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+def _get_pdf_pool():
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # spawn, not fork: forking a threaded server can copy held locks into the child
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_EXTRACTION_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return _pdf_pool
+
+
+def _reset_pdf_pool():
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is not None:
+            _pdf_pool.shutdown(wait=False, cancel_futures=True)
+        _pdf_pool = None
+
+
+def _extract_pdf_pages(file_path, start, stop):
+    """Extract pages [start, stop) of a PDF. Runs in a pool worker."""
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [(pdf_reader.pages[number].extract_text() or '') + "\n" for number in range(start, stop)]
+
+
+def _iter_pdf_pages(file_path, workers):
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        page_count = len(pdf_reader.pages)
+        if workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+            for page in pdf_reader.pages:
+                yield (page.extract_text() or '') + "\n"
+            return
+
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, page_count))
+              for start in range(0, page_count, PDF_PAGES_PER_TASK)]
+    pool = _get_pdf_pool()
+    pending = deque()
+    done = 0
+    try:
+        # Keep a bounded window of ranges in flight so a slow consumer does not buffer the whole file
+        for start, stop in ranges:
+            pending.append(pool.submit(_extract_pdf_pages, file_path, start, stop))
+            if len(pending) >= workers * 2:
+                pages = pending.popleft().result()
+                done += len(pages)
+                yield from pages
+        while pending:
+            pages = pending.popleft().result()
+            done += len(pages)
+            yield from pages
+    except BrokenProcessPool:
+        logger.warning(f"PDF extraction pool died, extracting {file_path} in-process from page {done}")
+        _reset_pdf_pool()
+        for start, stop in ranges:
+            if stop > done:
+                yield from _extract_pdf_pages(file_path, max(start, done), stop)
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _heading_level(style_name):
+    if style_name == 'Title':
+        return 1
+    if style_name.startswith('Heading '):
+        level = style_name[len('Heading '):]
+        return min(int(level), 6) if level.isdigit() else 0
+    return 0
+
+
+def _iter_docx_paragraphs(file_path):
+    doc = docx.Document(file_path)
+    # Paragraph.style resolves the default style with an XPath query on every call,
+    # so map the style ids to heading levels once and read each paragraph's id directly
+    levels = {style.style_id: _heading_level(style.name or '') for style in doc.styles}
+    for paragraph in doc.paragraphs:
+        level = levels.get(paragraph._p.style, 0)
+        # Headings are rendered as Markdown headings so the chunker can see them, and
+        # paragraphs end with a blank line so one without a full stop is not run into the next
+        if level and paragraph.text.strip():
+            yield f"{'#' * level} {paragraph.text.strip()}\n"
+        else:
+            yield paragraph.text + "\n\n"
+
+
+def sniff_encoding(prefix):
+    """Guess the encoding of a file from its first bytes."""
+    for bom, encoding in ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'),
+                          (codecs.BOM_UTF16_BE, 'utf-16')):
+        if prefix.startswith(bom):
+            return encoding
+    try:
+        # final=False tolerates a multi-byte character cut off at the end of the prefix
+        codecs.getincrementaldecoder('utf-8')().decode(prefix, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    detected = chardet.detect(prefix)
+    return detected['encoding'] or 'utf-8'
+
+
+def _iter_text_blocks(file_path):
+    with open(file_path, 'rb') as raw:
+        encoding = sniff_encoding(raw.read(ENCODING_SNIFF_BYTES))
+        raw.seek(0)
+        # Characters the prefix did not predict are replaced rather than failing the upload
+        file = io.TextIOWrapper(raw, encoding=encoding, errors='replace')
+        while True:
+            block = file.read(TEXT_BLOCK_SIZE)
+            if not block:
+                return
+            # Finish the current line so blocks split between lines
+            yield block + file.readline()
+
+
+def iter_document_pages(file_path, pdf_workers=None):
+    """Yield a document's text piece by piece: PDF pages, DOCX paragraphs or text blocks.
+
+    Errors are raised, not returned. ``pdf_workers`` overrides
+    PDF_EXTRACTION_WORKERS; 0 or 1 extracts PDFs in-process.
+    """
+    file_extension = os.path.splitext(file_path)[1].lower()
+    if file_extension == '.pdf':
+        workers = PDF_EXTRACTION_WORKERS if pdf_workers is None else pdf_workers
+        yield from _iter_pdf_pages(file_path, workers)
+    elif file_extension == '.docx':
+        yield from _iter_docx_paragraphs(file_path)
+    else:
+        # Text files, and anything else read as text with encoding detection
+        yield from _iter_text_blocks(file_path)
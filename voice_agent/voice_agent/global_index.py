@@ -0,0 +1,250 @@
+"""One vector index over the chunks of every document.
+
+Vector ids encode ``(Document.id, chunk ordinal)`` as
+``document_id << ID_SHIFT | ordinal``, so hits map straight back to a chunk
+without a lookup table and a document's vectors form one contiguous id range.
+Documents are spread over a fixed number of shards by ``document_id``; a
+search restricted to some documents only visits the shards that hold them and
+filters inside FAISS with an id-range selector.
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import faiss
+import numpy as np
+from django.conf import settings
+
+from .vector_index import FLAT, HNSW, IVF, build_index, choose_index_type, configure_search, ivf_training_size
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ID_SHIFT = 20
+MAX_CHUNKS_PER_DOCUMENT = 1 << ID_SHIFT
+
+# IVF shards are retrained once they hold this many times the vectors their centroids were trained for
+GLOBAL_INDEX_RETRAIN_GROWTH = getattr(settings, 'GLOBAL_INDEX_RETRAIN_GROWTH', 4)
+
+
+def vector_id(document_id, ordinal):
+    return (document_id << ID_SHIFT) | ordinal
+
+
+def split_vector_id(value):
+    """Return ``(document_id, chunk ordinal)`` for a global vector id."""
+    return value >> ID_SHIFT, value & (MAX_CHUNKS_PER_DOCUMENT - 1)
+
+
+def _document_range(document_id):
+    return faiss.IDSelectorRange(vector_id(document_id, 0), vector_id(document_id + 1, 0))
+
+
+class GlobalVectorIndex:
+    """Sharded FAISS index of all documents, persisted under ``root``.
+
+    Shards start as exact IndexIDMap2(IndexFlatL2) indexes and are rebuilt as
+    IVF once they outgrow ANN_FLAT_MAX_VECTORS, then retrained each time they
+    grow GLOBAL_INDEX_RETRAIN_GROWTH-fold. Each shard file's mtime is its
+    version, so workers reload shards another process has changed.
+    """
+
+    def __init__(self, root, shard_count=8):
+        self.root = root
+        self.shard_count = shard_count
+        self._shards = {}
+        self._lock = threading.RLock()
+
+    def shard_for(self, document_id):
+        return document_id % self.shard_count
+
+    def _shard_path(self, shard):
+        return os.path.join(self.root, f'shard_{shard:03d}.faiss')
+
+    def _shard_version(self, shard):
+        try:
+            return os.stat(self._shard_path(shard)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _get_shard(self, shard):
+        version = self._shard_version(shard)
+        with self._lock:
+            if version is None:
+                self._shards.pop(shard, None)
+                return None
+            cached = self._shards.get(shard)
+            if cached is not None and cached[1] == version:
+                return cached[0]
+            index = configure_search(faiss.read_index(self._shard_path(shard)))
+            self._shards[shard] = (index, version)
+            return index
+
+    def _save_shard(self, shard, index):
+        os.makedirs(self.root, exist_ok=True)
+        path = self._shard_path(shard)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            faiss.write_index(index, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        self._shards[shard] = (index, self._shard_version(shard))
+
+    @contextmanager
+    def _write_lock(self):
+        """Serialize shard updates across threads and, where supported, processes."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.root, exist_ok=True)
+            with open(os.path.join(self.root, '.lock'), 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def add_document(self, document_id, embeddings):
+        """Add (or replace) a document's chunk vectors."""
+        vectors = np.ascontiguousarray(embeddings, dtype='float32')
+        if len(vectors) == 0:
+            return
+        if len(vectors) > MAX_CHUNKS_PER_DOCUMENT:
+            raise ValueError(f"Document {document_id} has more than {MAX_CHUNKS_PER_DOCUMENT} chunks")
+        ids = np.arange(len(vectors), dtype='int64') | (np.int64(document_id) << ID_SHIFT)
+        shard = self.shard_for(document_id)
+        start = time.perf_counter()
+        with self._write_lock():
+            index = self._get_shard(shard)
+            if index is None:
+                index = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+            else:
+                index.remove_ids(_document_range(document_id))
+            index.add_with_ids(vectors, ids)
+            index = self._maybe_upgrade(index)
+            self._save_shard(shard, index)
+        logger.info(f"Added {len(vectors)} vectors of document {document_id} to global shard {shard} "
+                    f"in {time.perf_counter() - start:.3f}s")
+
+    def remove_document(self, document_id):
+        """Drop a document's vectors; returns how many were removed."""
+        shard = self.shard_for(document_id)
+        with self._write_lock():
+            index = self._get_shard(shard)
+            if index is None:
+                return 0
+            removed = index.remove_ids(_document_range(document_id))
+            if removed:
+                self._save_shard(shard, index)
+        logger.info(f"Removed {removed} vectors of document {document_id} from global shard {shard}")
+        return removed
+
+    def _maybe_upgrade(self, index):
+        """Rebuild a shard whose index no longer suits its size.
+
+        Flat shards become IVF once they are large enough to need ANN search.
+        IVF centroids stay those of the vectors the shard was trained on, so as
+        documents are added the lists grow long and uneven and each probe scans
+        more vectors; the shard is retrained on all its vectors once it holds
+        GLOBAL_INDEX_RETRAIN_GROWTH times its training size.
+        """
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is None:
+            if choose_index_type(index.ntotal) == FLAT:
+                return index
+        elif index.ntotal <= GLOBAL_INDEX_RETRAIN_GROWTH * ivf_training_size(ivf.nlist):
+            return index
+        index_type = choose_index_type(index.ntotal)
+        if index_type == HNSW:
+            # HNSW cannot remove vectors, which deleting a document requires
+            index_type = IVF
+        vectors, ids = _shard_vectors(index)
+        logger.info(f"Rebuilding global shard of {index.ntotal} vectors as {index_type}")
+        return build_index(vectors, index_type=index_type, ids=ids)
+
+    def search(self, query_vector, top_k=5, document_ids=None):
+        """Nearest chunks as ``(distance, document_id, ordinal)``, best first.
+
+        ``document_ids`` restricts the search to those documents.
+        """
+        query = np.ascontiguousarray([query_vector], dtype='float32')
+        if document_ids is None:
+            shards = {shard: None for shard in range(self.shard_count)}
+        else:
+            shards = {}
+            for document_id in set(document_ids):
+                shards.setdefault(self.shard_for(document_id), []).append(document_id)
+        hits = []
+        for shard, shard_documents in sorted(shards.items()):
+            index = self._get_shard(shard)
+            if index is None or index.ntotal == 0:
+                continue
+            params = None
+            if shard_documents:
+                selector, keepalive = _documents_selector(shard_documents)
+                params = _search_params(index, selector)
+            distances, ids = index.search(query, top_k, params=params)
+            hits.extend((float(d), int(i)) for d, i in zip(distances[0], ids[0]) if i >= 0)
+        hits.sort()
+        return [(distance, *split_vector_id(value)) for distance, value in hits[:top_k]]
+
+    def stats(self):
+        shards = {}
+        for shard in range(self.shard_count):
+            index = self._get_shard(shard)
+            if index is not None:
+                shards[shard] = {'vectors': index.ntotal, 'index_type': type(index).__name__}
+        return {'shard_count': self.shard_count, 'vectors': sum(s['vectors'] for s in shards.values()), 'shards': shards}
+
+
+def _shard_vectors(index):
+    """Return a shard's ``(vectors, ids)``; IVF-PQ vectors come back from their lossy codes."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return faiss.downcast_index(index.index).reconstruct_n(0, index.ntotal), faiss.vector_to_array(index.id_map)
+    invlists = ivf.invlists
+    ids = np.concatenate([faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no)).copy()
+                          for list_no in range(ivf.nlist) if invlists.list_size(list_no)])
+    # Global ids are sparse, so look vectors up through a hash table rather than an array
+    ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    try:
+        return ivf.reconstruct_batch(ids), ids
+    finally:
+        ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+
+
+def _documents_selector(document_ids):
+    """Selector matching any of the documents, plus every selector it is built from.
+
+    FAISS selectors reference each other by raw pointer, so the caller must keep
+    the returned list alive until the search is done.
+    """
+    selectors = [_document_range(document_id) for document_id in document_ids]
+    selector = selectors[0]
+    for other in selectors[1:len(document_ids)]:
+        selector = faiss.IDSelectorOr(selector, other)
+        selectors.append(selector)
+    return selector, selectors
+
+
+def _search_params(index, selector):
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        # SearchParametersIVF overrides the index's nprobe, so carry it over
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+GLOBAL_INDEX = GlobalVectorIndex(
+    root=getattr(settings, 'GLOBAL_INDEX_ROOT', os.path.join(settings.MEDIA_ROOT, 'faiss_global')),
+    shard_count=getattr(settings, 'GLOBAL_INDEX_SHARDS', 8),
+)
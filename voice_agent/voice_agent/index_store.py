@@ -0,0 +1,220 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+
+import faiss
+import numpy as np
+from django.conf import settings
+
+from .caching import invalidate_document_results
+from .chunk_store import BLOB_FILENAME, OFFSETS_FILENAME, ChunkStore
+from .lexical import LEXICAL_FILENAME, BM25Index
+from .vector_index import configure_search
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = 'index.faiss'
+# Written by older versions; still read when a document has no chunk blob yet
+CHUNKS_FILENAME = 'chunks.json'
+EMBEDDINGS_FILENAME = 'embeddings.npy'
+META_FILENAME = 'meta.json'
+
+# float16 halves the on-disk and page-cache footprint; the FAISS index keeps its own float32 copy
+EMBEDDING_STORAGE_DTYPE = getattr(settings, 'EMBEDDING_STORAGE_DTYPE', 'float16')
+
+
+@dataclass
+class IndexedDocument:
+    """A document's FAISS index together with its chunk texts and metadata."""
+    document_id: int
+    index: faiss.Index
+    # ChunkStore over the memory-mapped chunk blob (a plain list for pre-blob indexes)
+    chunks: Sequence
+    # Read-only memory map of the on-disk matrix (EMBEDDING_STORAGE_DTYPE), not a heap copy
+    embeddings: np.ndarray
+    # BM25 inverted index over the same chunks
+    lexical: BM25Index = None
+    metadata: dict = field(default_factory=dict)
+    # mtime of meta.json when this entry was loaded, used to spot re-indexing by other workers
+    version: int = 0
+
+
+class IndexStore:
+    """Persists FAISS indexes under MEDIA_ROOT and keeps a bounded LRU of them in memory.
+
+    Each document lives in its own directory keyed by ``Document.id``. ``meta.json`` is
+    written last, so a directory without it is an incomplete write and is ignored.
+    """
+
+    def __init__(self, root, max_documents=32):
+        self.root = root
+        self.max_documents = max_documents
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _document_dir(self, document_id):
+        return os.path.join(self.root, str(document_id))
+
+    def _meta_path(self, document_id):
+        return os.path.join(self._document_dir(document_id), META_FILENAME)
+
+    def _meta_version(self, document_id):
+        try:
+            return os.stat(self._meta_path(document_id)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def save(self, document_id, index, chunks, embeddings, metadata=None):
+        """Write the index, chunks and embeddings to disk and cache the loaded entry."""
+        document_dir = self._document_dir(document_id)
+        os.makedirs(document_dir, exist_ok=True)
+        metadata = dict(metadata or {})
+        metadata.update({
+            'document_id': document_id,
+            'chunk_count': len(chunks),
+            'dimension': index.d,
+            'index_type': type(index).__name__,
+            'embedding_dtype': EMBEDDING_STORAGE_DTYPE,
+            'indexed_at': time.time(),
+        })
+        embeddings = np.asarray(embeddings, dtype=EMBEDDING_STORAGE_DTYPE)
+
+        # Remove the marker first so readers never pair a new index with stale metadata
+        meta_path = self._meta_path(document_id)
+        if os.path.exists(meta_path):
+            os.unlink(meta_path)
+        self._write_atomic(os.path.join(document_dir, INDEX_FILENAME),
+                           lambda path: faiss.write_index(index, path))
+        chunk_store = ChunkStore.from_texts(chunks)
+        self._write_atomic(os.path.join(document_dir, BLOB_FILENAME), chunk_store.write_blob)
+        self._write_atomic(os.path.join(document_dir, OFFSETS_FILENAME), chunk_store.write_offsets)
+        lexical = BM25Index.from_texts(chunks)
+        self._write_atomic(os.path.join(document_dir, LEXICAL_FILENAME), lexical.write)
+        self._write_atomic(os.path.join(document_dir, EMBEDDINGS_FILENAME),
+                           lambda path: _write_npy(path, embeddings))
+        self._write_atomic(meta_path, lambda path: _write_json(path, metadata))
+
+        entry = IndexedDocument(
+            document_id=document_id,
+            index=index,
+            chunks=ChunkStore.open(document_dir),
+            lexical=lexical,
+            embeddings=_load_npy(os.path.join(document_dir, EMBEDDINGS_FILENAME)),
+            metadata=metadata,
+            version=self._meta_version(document_id),
+        )
+        self._put(document_id, entry)
+        invalidate_document_results(document_id)
+        logger.info(f"Persisted FAISS index for document {document_id} ({len(chunks)} chunks) to {document_dir}")
+        return entry
+
+    def get(self, document_id):
+        """Return the IndexedDocument for a document, loading it from disk if needed."""
+        version = self._meta_version(document_id)
+        if version is None:
+            with self._lock:
+                self._cache.pop(document_id, None)
+            return None
+        with self._lock:
+            entry = self._cache.get(document_id)
+            if entry is not None and entry.version == version:
+                self._cache.move_to_end(document_id)
+                return entry
+        entry = self._load(document_id, version)
+        if entry is not None:
+            self._put(document_id, entry)
+        return entry
+
+    def __contains__(self, document_id):
+        return self._meta_version(document_id) is not None
+
+    def delete(self, document_id):
+        """Drop a document's index from memory and disk."""
+        with self._lock:
+            self._cache.pop(document_id, None)
+        invalidate_document_results(document_id)
+        shutil.rmtree(self._document_dir(document_id), ignore_errors=True)
+
+    def _load(self, document_id, version):
+        document_dir = self._document_dir(document_id)
+        start = time.perf_counter()
+        try:
+            with open(self._meta_path(document_id), 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+            index = configure_search(faiss.read_index(os.path.join(document_dir, INDEX_FILENAME)))
+            chunks = _load_chunks(document_dir)
+            lexical = _load_lexical(document_dir, chunks)
+            embeddings = _load_npy(os.path.join(document_dir, EMBEDDINGS_FILENAME))
+        except Exception as e:
+            logger.error(f"Failed to load FAISS index for document {document_id}: {str(e)}")
+            return None
+        logger.info(f"Loaded FAISS index for document {document_id} from disk in {time.perf_counter() - start:.3f}s")
+        return IndexedDocument(
+            document_id=document_id,
+            index=index,
+            chunks=chunks,
+            lexical=lexical,
+            embeddings=embeddings,
+            metadata=metadata,
+            version=version,
+        )
+
+    def _put(self, document_id, entry):
+        with self._lock:
+            self._cache[document_id] = entry
+            self._cache.move_to_end(document_id)
+            while len(self._cache) > self.max_documents:
+                evicted_id, _ = self._cache.popitem(last=False)
+                logger.debug(f"Evicted FAISS index for document {evicted_id} from memory")
+
+    @staticmethod
+    def _write_atomic(path, writer):
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            writer(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+
+def _write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def _write_npy(path, array):
+    with open(path, 'wb') as f:
+        np.save(f, array)
+
+
+def _load_chunks(document_dir):
+    if os.path.exists(os.path.join(document_dir, BLOB_FILENAME)):
+        return ChunkStore.open(document_dir)
+    with open(os.path.join(document_dir, CHUNKS_FILENAME), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _load_lexical(document_dir, chunks):
+    path = os.path.join(document_dir, LEXICAL_FILENAME)
+    if os.path.exists(path):
+        return BM25Index.load(path)
+    # Indexed before BM25 was added: build it in memory from the chunks
+    return BM25Index.from_texts(chunks)
+
+
+def _load_npy(path):
+    # Memory-mapped, so workers share the pages instead of each holding a copy
+    return np.load(path, mmap_mode='r')
+
+
+INDEX_STORE = IndexStore(
+    root=getattr(settings, 'FAISS_INDEX_ROOT', os.path.join(settings.MEDIA_ROOT, 'faiss_indices')),
+    max_documents=getattr(settings, 'FAISS_INDEX_CACHE_SIZE', 32),
+)
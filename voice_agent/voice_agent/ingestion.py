@@ -0,0 +1,223 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connections
+from django.db.models import F
+from django.utils import timezone
+
+from .chunking import iter_chunks, strategy_for
+from .documents import build_faiss_index
+from .global_index import GLOBAL_INDEX
+from .index_store import INDEX_STORE
+from .models import Document, IngestionJob
+from .text_cache import iter_document_text
+
+logger = logging.getLogger(__name__)
+
+INGESTION_WORKERS = getattr(settings, 'INGESTION_WORKERS', 2)
+# Jobs run in this process's executor, so a restarted or recycled worker leaves its jobs unfinished.
+# A running job's updated_at is refreshed every INGESTION_HEARTBEAT seconds whatever it is doing, so a
+# job with no update for INGESTION_STALE_AFTER seconds has lost the process that was running it
+INGESTION_HEARTBEAT = getattr(settings, 'INGESTION_HEARTBEAT', 30)
+INGESTION_STALE_AFTER = getattr(settings, 'INGESTION_STALE_AFTER', 300)
+INGESTION_MAX_ATTEMPTS = getattr(settings, 'INGESTION_MAX_ATTEMPTS', 2)
+
+# Share of the overall progress bar covered by the end of each stage
+STAGE_PROGRESS = {
+    IngestionJob.STAGE_EXTRACTING: 10,
+    IngestionJob.STAGE_CHUNKING: 15,
+    IngestionJob.STAGE_EMBEDDING: 90,
+    IngestionJob.STAGE_INDEXING: 100,
+}
+
+_executor = ThreadPoolExecutor(max_workers=INGESTION_WORKERS, thread_name_prefix='ingest')
+
+
+def submit_ingestion(document):
+    """Queue extraction, chunking and indexing of a document and return its IngestionJob."""
+    job = IngestionJob.objects.create(document=document)
+    _executor.submit(_run_ingestion, job.id, document.id, job.attempts)
+    logger.info(f"Queued ingestion job {job.id} for document {document.id}")
+    return job
+
+
+def _is_stale(job):
+    return not job.is_finished and job.updated_at < timezone.now() - timedelta(seconds=INGESTION_STALE_AFTER)
+
+
+def resume_if_stale(job):
+    """Re-queue a job orphaned by an exited worker, or fail it after INGESTION_MAX_ATTEMPTS runs.
+
+    Returns True when this call changed the job. The update is conditional on
+    ``updated_at``, so when several workers see the same stale job only one
+    of them claims it. Claiming bumps ``attempts``, which fences off the
+    previous run should it still be alive after all.
+    """
+    if not _is_stale(job):
+        return False
+    claim = IngestionJob.objects.filter(id=job.id, stage=job.stage, updated_at=job.updated_at)
+    if job.attempts >= INGESTION_MAX_ATTEMPTS:
+        error = f"Interrupted during {job.stage} by a server restart {job.attempts} times; upload the document again."
+        if claim.update(stage=IngestionJob.STAGE_FAILED, error=error, updated_at=timezone.now()):
+            logger.warning(f"Ingestion job {job.id} failed after {job.attempts} interrupted runs")
+            return True
+        return False
+    if not claim.update(stage=IngestionJob.STAGE_QUEUED, progress=0, attempts=F('attempts') + 1,
+                        updated_at=timezone.now()):
+        return False
+    _executor.submit(_run_ingestion, job.id, job.document_id, job.attempts + 1)
+    logger.warning(f"Re-queued ingestion job {job.id} for document {job.document_id}, "
+                   f"interrupted during {job.stage}")
+    return True
+
+
+def resume_stale_jobs():
+    """Recover every orphaned job; run in the background when the app starts."""
+    cutoff = timezone.now() - timedelta(seconds=INGESTION_STALE_AFTER)
+    try:
+        jobs = list(IngestionJob.objects
+                    .exclude(stage__in=(IngestionJob.STAGE_DONE, IngestionJob.STAGE_FAILED))
+                    .filter(updated_at__lt=cutoff))
+        resumed = sum(resume_if_stale(job) for job in jobs)
+        if resumed:
+            logger.info(f"Recovered {resumed} interrupted ingestion job(s)")
+    except DatabaseError as e:
+        # Tables not migrated yet (e.g. during manage.py migrate)
+        logger.debug(f"Skipped ingestion job recovery: {str(e)}")
+    finally:
+        close_old_connections()
+
+
+class _Superseded(Exception):
+    pass
+
+
+def _update_job(job_id, attempt, **fields):
+    """Update a job on behalf of its run number ``attempt``; raise _Superseded once it has been re-queued."""
+    if not IngestionJob.objects.filter(id=job_id, attempts=attempt).update(updated_at=timezone.now(), **fields):
+        raise _Superseded(f"Ingestion job {job_id} was re-queued after run {attempt}")
+
+
+class _Heartbeat:
+    """Refresh a running job's updated_at from a side thread, so long extraction, chunking or a
+    slow embedding batch are not mistaken for an orphaned job."""
+
+    def __init__(self, job_id, attempt, interval=None):
+        self.job_id = job_id
+        self.attempt = attempt
+        self.interval = interval or INGESTION_HEARTBEAT
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f'ingest-heartbeat-{job_id}')
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                (IngestionJob.objects.filter(id=self.job_id, attempts=self.attempt)
+                 .exclude(stage__in=(IngestionJob.STAGE_DONE, IngestionJob.STAGE_FAILED))
+                 .update(updated_at=timezone.now()))
+        except DatabaseError as e:
+            logger.error(f"Heartbeat of ingestion job {self.job_id} stopped: {str(e)}")
+        finally:
+            connections.close_all()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def _timed(iterable, timings, key):
+    """Yield from iterable, adding the time spent producing items to timings[key]."""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            timings[key] = timings.get(key, 0.0) + time.perf_counter() - start
+        yield item
+
+
+def _run_ingestion(job_id, document_id, attempt=1):
+    timings = {}
+    started = time.perf_counter()
+
+    def start_stage(stage):
+        _update_job(job_id, attempt, stage=stage, timings=timings)
+        return time.perf_counter()
+
+    def finish_stage(stage, stage_started):
+        timings[stage] = round(time.perf_counter() - stage_started, 3)
+        _update_job(job_id, attempt, progress=STAGE_PROGRESS[stage], timings=timings)
+
+    try:
+        with _Heartbeat(job_id, attempt):
+            # Pages stream from the extractor (or the extracted-text cache on a re-index)
+            # straight into the chunker, so only the chunk texts are held in memory;
+            # time spent producing pages is reported as extraction, the rest as chunking
+            stage_started = start_stage(IngestionJob.STAGE_EXTRACTING)
+            document = Document.objects.get(id=document_id)
+            extraction = {}
+            pages = _timed(iter_document_text(document), extraction, 'seconds')
+            chunks = list(iter_chunks(pages, strategy=strategy_for(document.file.name)))
+            if not chunks:
+                raise ValueError('No valid text chunks in document.')
+            elapsed = time.perf_counter() - stage_started
+            timings[IngestionJob.STAGE_EXTRACTING] = round(extraction['seconds'], 3)
+            timings[IngestionJob.STAGE_CHUNKING] = round(elapsed - extraction['seconds'], 3)
+            _update_job(job_id, attempt, stage=IngestionJob.STAGE_CHUNKING,
+                        progress=STAGE_PROGRESS[IngestionJob.STAGE_CHUNKING], timings=timings)
+
+            stage_started = start_stage(IngestionJob.STAGE_EMBEDDING)
+            start_pct = STAGE_PROGRESS[IngestionJob.STAGE_CHUNKING]
+            span = STAGE_PROGRESS[IngestionJob.STAGE_EMBEDDING] - start_pct
+
+            def on_progress(done, total):
+                _update_job(job_id, attempt, progress=round(start_pct + span * done / total, 1))
+
+            index, embeddings = build_faiss_index(chunks, progress_callback=on_progress)
+            finish_stage(IngestionJob.STAGE_EMBEDDING, stage_started)
+
+            stage_started = start_stage(IngestionJob.STAGE_INDEXING)
+            INDEX_STORE.save(document_id, index, chunks, embeddings)
+            GLOBAL_INDEX.add_document(document_id, embeddings)
+            finish_stage(IngestionJob.STAGE_INDEXING, stage_started)
+
+            timings['total'] = round(time.perf_counter() - started, 3)
+            _update_job(job_id, attempt, stage=IngestionJob.STAGE_DONE, progress=100, timings=timings)
+            logger.info(f"Ingestion job {job_id} indexed document {document_id} ({len(chunks)} chunks) in {timings['total']}s")
+    except _Superseded as e:
+        # Another worker took the job over; leave the index writes to it
+        logger.warning(f"{str(e)}; abandoning this run")
+    except Exception as e:
+        logger.error(f"Ingestion job {job_id} failed: {str(e)}", exc_info=True)
+        timings['total'] = round(time.perf_counter() - started, 3)
+        try:
+            _update_job(job_id, attempt, stage=IngestionJob.STAGE_FAILED, error=str(e), timings=timings)
+        except _Superseded:
+            pass
+    finally:
+        close_old_connections()
+
+
+def job_status(job):
+    return {
+        'job_id': job.id,
+        'document_id': job.document_id,
+        'stage': job.stage,
+        'progress': job.progress,
+        'finished': job.is_finished,
+        'error': job.error or None,
+        'timings': job.timings,
+        'created_at': job.created_at.isoformat(),
+        'updated_at': job.updated_at.isoformat(),
+    }
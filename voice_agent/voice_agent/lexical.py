@@ -0,0 +1,106 @@
+import math
+import re
+
+import numpy as np
+
+LEXICAL_FILENAME = 'bm25.npz'
+
+# Keep codes, versions and hyphenated names ("XJ-42", "3.5", "api_key") as single tokens
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_.'][a-z0-9]+)*")
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have how i in is it its of on or that the this to was were what
+when where which who why will with you your do does did can could should would about into than then there
+these those they them their our we us me my not no so if
+""".split())
+
+# Longer runs are hashes, base64 or URLs: never typed in a query, and the fixed-width
+# terms array is as wide as its longest entry
+MAX_TOKEN_LENGTH = 64
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower())
+            if token not in STOPWORDS and len(token) <= MAX_TOKEN_LENGTH]
+
+
+class BM25Index:
+    """Okapi BM25 over a document's chunks, stored as a compact inverted index.
+
+    Terms are kept sorted with one postings slice per term
+    (``postings[offsets[t]:offsets[t + 1]]``), so lookups are a binary search
+    and scoring is vectorized over the postings arrays.
+    """
+
+    def __init__(self, terms, offsets, postings, frequencies, lengths, k1=1.5, b=0.75):
+        self.terms = terms
+        self.offsets = offsets
+        self.postings = postings
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.k1 = k1
+        self.b = b
+        self.average_length = float(lengths.mean()) if len(lengths) else 0.0
+
+    @classmethod
+    def from_texts(cls, texts):
+        counts = {}
+        lengths = []
+        for chunk_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for token in tokens:
+                chunk_counts = counts.setdefault(token, {})
+                chunk_counts[chunk_id] = chunk_counts.get(chunk_id, 0) + 1
+        terms = sorted(counts)
+        offsets = np.zeros(len(terms) + 1, dtype='int64')
+        np.cumsum([len(counts[term]) for term in terms], out=offsets[1:])
+        postings = np.fromiter((c for term in terms for c in counts[term]), dtype='int32', count=int(offsets[-1]))
+        frequencies = np.fromiter((f for term in terms for f in counts[term].values()), dtype='float32',
+                                  count=int(offsets[-1]))
+        return cls(np.array(terms, dtype=str), offsets, postings, frequencies, np.array(lengths, dtype='int32'))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['terms'], data['offsets'], data['postings'], data['frequencies'], data['lengths'])
+
+    def write(self, path):
+        with open(path, 'wb') as f:
+            np.savez(f, terms=self.terms, offsets=self.offsets, postings=self.postings,
+                     frequencies=self.frequencies, lengths=self.lengths)
+
+    def _postings(self, term):
+        i = int(np.searchsorted(self.terms, term))
+        if i == len(self.terms) or self.terms[i] != term:
+            return None
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def search(self, query, top_k=10):
+        """Return up to ``top_k`` ``(chunk_id, score)`` pairs with a positive score, best first."""
+        n_chunks = len(self.lengths)
+        if not n_chunks:
+            return []
+        scores = np.zeros(n_chunks, dtype='float32')
+        norms = self.k1 * (1 - self.b + self.b * self.lengths / max(self.average_length, 1e-9))
+        for term in set(tokenize(query)):
+            span = self._postings(term)
+            if span is None:
+                continue
+            chunk_ids = self.postings[span]
+            tf = self.frequencies[span]
+            idf = math.log(1 + (n_chunks - len(chunk_ids) + 0.5) / (len(chunk_ids) + 0.5))
+            scores[chunk_ids] += idf * tf * (self.k1 + 1) / (tf + norms[chunk_ids])
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        ranked = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(int(i), float(scores[i])) for i in ranked]
+
+
+def reciprocal_rank_fusion(*rankings, k=60):
+    """Fuse ranked lists of ids: each id scores sum(1 / (k + rank)) over the lists it appears in."""
+    fused = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(fused, key=lambda item: -fused[item])
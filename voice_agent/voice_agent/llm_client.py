@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import defaultdict, deque
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    def __init__(self, message, status_code=None, body=''):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+
+
+class CircuitOpenError(LLMError):
+    pass
+
+
+class CircuitBreaker:
+    """Fails fast after ``failure_threshold`` consecutive failures.
+
+    After ``reset_timeout`` seconds a single trial call is let through
+    (half-open) while everyone else keeps failing fast; its success closes the
+    circuit, its failure re-opens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+            if self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"LLM circuit opened after {self.failures} consecutive failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class LLMMetrics:
+    """Per-label call counts, latency percentiles and token usage."""
+
+    def __init__(self, window=500):
+        self._lock = threading.Lock()
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+        self._counters = defaultdict(lambda: defaultdict(int))
+
+    def record(self, label, latency=None, **counters):
+        with self._lock:
+            if latency is not None:
+                self._latencies[label].append(latency)
+            for name, value in counters.items():
+                self._counters[label][name] += value
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for label in set(self._latencies) | set(self._counters):
+                latencies = sorted(self._latencies[label])
+                entry = dict(self._counters[label])
+                if latencies:
+                    entry['latency_p50'] = round(latencies[len(latencies) // 2], 3)
+                    entry['latency_p95'] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3)
+                    entry['latency_max'] = round(latencies[-1], 3)
+                result[label] = entry
+            return result
+
+
+class LLMClient:
+    """Shared client for an OpenAI-compatible chat completions endpoint.
+
+    Keeps a keep-alive connection pool, applies connect/read timeouts, retries
+    429/5xx and connection errors with jittered exponential backoff (honouring
+    Retry-After), and trips a circuit breaker while the upstream is down.
+    """
+
+    def __init__(self, api_url, api_key, pool_size=20, connect_timeout=5, read_timeout=120,
+                 max_retries=3, backoff=0.5, breaker=None):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = LLMMetrics()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def headers(self):
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def _retry_delay(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return min(float(retry_after), 30.0)
+            except ValueError:
+                pass
+        return self.backoff * (2 ** attempt) * (1 + random.random())
+
+    def _check_circuit(self, label):
+        if not self.breaker.allow():
+            self.metrics.record(label, short_circuited=1)
+            raise CircuitOpenError("LLM upstream unavailable (circuit open)")
+
+    def _record_usage(self, label, result):
+        usage = result.get('usage') or {}
+        self.metrics.record(
+            label,
+            prompt_tokens=usage.get('prompt_tokens', 0),
+            completion_tokens=usage.get('completion_tokens', 0),
+        )
+
+    def _after_attempt(self, label, attempt, response, error, latency):
+        """Apply the retry policy to one attempt's outcome.
+
+        Returns None when ``response`` succeeded and the delay to wait before
+        the next attempt otherwise; raises LLMError once the call has failed
+        for good. Shared by the sync and async transports.
+        """
+        if response is not None and response.status_code == 200:
+            self.breaker.record_success()
+            self.metrics.record(label, latency=latency, calls=1)
+            logger.info(f"LLM {label} call succeeded in {latency:.3f}s (attempt {attempt + 1})")
+            return None
+        if response is not None:
+            error = LLMError(f"Groq API error: {response.text}", response.status_code, response.text)
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                # The upstream is healthy, the request itself was rejected
+                self.breaker.record_success()
+                self.metrics.record(label, latency=latency, calls=1, failures=1)
+                raise error
+        self.breaker.record_failure()
+        if attempt >= self.max_retries or not self.breaker.allow():
+            self.metrics.record(label, latency=latency, calls=1, failures=1)
+            raise error
+        delay = self._retry_delay(attempt, response.headers.get('Retry-After') if response is not None else None)
+        logger.warning(f"LLM {label} call failed ({str(error)[:200]}), retrying in {delay:.2f}s")
+        self.metrics.record(label, retries=1)
+        return delay
+
+    def post_chat(self, payload, stream=False, label='chat'):
+        """POST a chat completion and return the successful requests.Response."""
+        self._check_circuit(label)
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            response, error = None, None
+            try:
+                response = self.session.post(self.api_url, headers=self.headers, json=payload,
+                                             timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = LLMError(f"LLM request failed: {str(e)}")
+            delay = self._after_attempt(label, attempt, response, error, time.perf_counter() - start)
+            if delay is None:
+                return response
+            time.sleep(delay)
+            attempt += 1
+
+    def chat(self, payload, label='chat'):
+        """POST a chat completion and return the decoded JSON result."""
+        result = self.post_chat(payload, label=label).json()
+        self._record_usage(label, result)
+        return result
+
+    async def achat(self, http_client, payload, label='chat'):
+        """Async counterpart of chat() using an httpx.AsyncClient."""
+        self._check_circuit(label)
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            response, error = None, None
+            try:
+                response = await http_client.post(self.api_url, headers=self.headers, json=payload,
+                                                  timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]))
+            except httpx.HTTPError as e:
+                error = LLMError(f"LLM request failed: {str(e)}")
+            delay = self._after_attempt(label, attempt, response, error, time.perf_counter() - start)
+            if delay is None:
+                result = response.json()
+                self._record_usage(label, result)
+                return result
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self):
+        return {
+            'circuit_state': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'calls': self.metrics.snapshot(),
+        }
+
+
+def chat_answer(result):
+    """Extract the assistant text from a chat completion result."""
+    return result["choices"][0]["message"]["content"].strip() if "choices" in result and result["choices"] else ''
+
+
+GROQ_CLIENT = LLMClient(
+    api_url=settings.GROQ_API_URL,
+    api_key=settings.GROQ_API_KEY,
+    pool_size=getattr(settings, 'LLM_POOL_SIZE', 20),
+    connect_timeout=getattr(settings, 'LLM_CONNECT_TIMEOUT', 5),
+    read_timeout=getattr(settings, 'LLM_READ_TIMEOUT', 120),
+    max_retries=getattr(settings, 'LLM_MAX_RETRIES', 3),
+    breaker=CircuitBreaker(
+        failure_threshold=getattr(settings, 'LLM_CIRCUIT_FAILURE_THRESHOLD', 5),
+        reset_timeout=getattr(settings, 'LLM_CIRCUIT_RESET_TIMEOUT', 30),
+    ),
+)
@@ -0,0 +1,65 @@
+import time
+
+import faiss
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from voice_agent.vector_index import INDEX_TYPES, build_index, configure_search
+
+
+def synthetic_corpus(n_vectors, dimension, n_queries, clusters=64, seed=0):
+    """Clustered Gaussian vectors, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype('float32')
+    labels = rng.integers(0, clusters, size=n_vectors + n_queries)
+    points = centers[labels] + 0.35 * rng.standard_normal((n_vectors + n_queries, dimension)).astype('float32')
+    return np.ascontiguousarray(points[:n_vectors]), np.ascontiguousarray(points[n_vectors:])
+
+
+def recall_at_k(found, truth, k):
+    hits = sum(len(set(f[:k]) & set(t[:k])) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+class Command(BaseCommand):
+    help = "Compare recall@k, QPS, build time and size of the FAISS index types on a synthetic corpus."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vectors', type=int, default=50_000)
+        parser.add_argument('--dimension', type=int, default=768)
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--types', nargs='+', choices=INDEX_TYPES, default=list(INDEX_TYPES))
+        parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 16, 64], help='IVF probes to try')
+        parser.add_argument('--ef-search', type=int, nargs='+', default=[32, 64, 128], help='HNSW efSearch values to try')
+
+    def handle(self, *args, **options):
+        k = options['k']
+        vectors, queries = synthetic_corpus(options['vectors'], options['dimension'], options['queries'])
+        exact = faiss.IndexFlatL2(vectors.shape[1])
+        exact.add(vectors)
+        _, truth = exact.search(queries, k)
+
+        self.stdout.write(f"{options['vectors']} vectors, dimension {options['dimension']}, {len(queries)} queries, k={k}")
+        self.stdout.write(f"{'type':>6} {'knob':>12} {'recall@k':>9} {'qps':>10} {'build s':>8} {'size MB':>8}")
+        for index_type in options['types']:
+            start = time.perf_counter()
+            index = build_index(vectors, index_type=index_type)
+            build_seconds = time.perf_counter() - start
+            size_mb = faiss.serialize_index(index).nbytes / 1e6
+            if index_type in ('ivf', 'ivfpq'):
+                knobs = [('nprobe', value, {'nprobe': value}) for value in options['nprobe']]
+            elif index_type == 'hnsw':
+                knobs = [('efSearch', value, {'ef_search': value}) for value in options['ef_search']]
+            else:
+                knobs = [('-', '', {})]
+            for name, value, kwargs in knobs:
+                configure_search(index, **kwargs)
+                start = time.perf_counter()
+                _, found = index.search(queries, k)
+                seconds = time.perf_counter() - start
+                knob = f"{name}={value}" if value != '' else name
+                self.stdout.write(
+                    f"{index_type:>6} {knob:>12} {recall_at_k(found, truth, k):>9.3f} "
+                    f"{len(queries) / seconds:>10.0f} {build_seconds:>8.2f} {size_mb:>8.1f}"
+                )
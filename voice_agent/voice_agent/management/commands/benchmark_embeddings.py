@@ -0,0 +1,42 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from voice_agent.embeddings import EmbeddingPipeline
+
+WORDS = (
+    "pipeline refinery crude storage pressure valve safety audit revenue margin "
+    "compliance inspection capacity throughput maintenance schedule report quarter"
+).split()
+
+
+class Command(BaseCommand):
+    help = "Measure embedding throughput (chunks/sec) against an Ollama-compatible server."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default=None, help='Embedding API base URL, e.g. http://localhost:11434/api')
+        parser.add_argument('--model', default=None)
+        parser.add_argument('--chunks', type=int, default=256)
+        parser.add_argument('--words', type=int, default=500, help='Words per synthetic chunk')
+        parser.add_argument('--batch-size', type=int, nargs='+', default=[1, 16, 32])
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4])
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        chunks = [' '.join(rng.choices(WORDS, k=options['words'])) for _ in range(options['chunks'])]
+        self.stdout.write(f"{'batch':>6} {'conc':>5} {'chunks/s':>10} {'seconds':>9} {'retries':>8}")
+        for batch_size in options['batch_size']:
+            for concurrency in options['concurrency']:
+                pipeline = EmbeddingPipeline(
+                    batch_size=batch_size,
+                    concurrency=concurrency,
+                    api_url=options['url'],
+                    model=options['model'],
+                    cache=None,
+                )
+                pipeline.run(chunks)
+                stats = pipeline.stats
+                self.stdout.write(
+                    f"{batch_size:>6} {concurrency:>5} {stats.chunks_per_sec:>10.1f} "
+                    f"{stats.seconds:>9.2f} {stats.retries:>8}"
+                )
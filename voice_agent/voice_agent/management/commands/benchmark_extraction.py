@@ -0,0 +1,112 @@
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import docx
+from django.core.management.base import BaseCommand
+
+from voice_agent.extraction import PDF_EXTRACTION_WORKERS, iter_document_pages
+
+WORDS = ('pump valve audit revenue pressure quarter safety operator filter sensor '
+         'report budget turbine schedule network latency invoice customer warranty').split()
+
+
+def synthetic_lines(count, seed=0):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 14))).capitalize() + '.'
+
+
+def _pdf_escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_pdf(path, pages, lines_per_page=45):
+    """Write a minimal text-only PDF (Helvetica, one content stream per page)."""
+    lines = synthetic_lines(pages * lines_per_page)
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', None,
+               b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    page_ids = []
+    for _ in range(pages):
+        body = ' T* '.join(f'({_pdf_escape(next(lines))}) Tj' for _ in range(lines_per_page))
+        stream = f'BT /F1 10 Tf 12 TL 40 800 Td {body} ET'.encode('latin-1')
+        objects.append(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream))
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+                       b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % len(objects))
+        page_ids.append(len(objects))
+    kids = ' '.join(f'{number} 0 R' for number in page_ids).encode()
+    objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, pages)
+
+    with open(path, 'wb') as f:
+        f.write(b'%PDF-1.4\n')
+        offsets = []
+        for number, obj in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b'%d 0 obj\n%s\nendobj\n' % (number, obj))
+        xref = f.tell()
+        f.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b'%010d 00000 n \n' % offset)
+        f.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref))
+
+
+def write_docx(path, pages, paragraphs_per_page=12):
+    document = docx.Document()
+    lines = synthetic_lines(pages * paragraphs_per_page * 4)
+    for page in range(pages):
+        document.add_heading(f'Section {page + 1}', level=2)
+        for _ in range(paragraphs_per_page):
+            document.add_paragraph(' '.join(next(lines) for _ in range(4)))
+    document.save(path)
+
+
+def write_txt(path, pages, encoding, lines_per_page=45):
+    with open(path, 'w', encoding=encoding) as f:
+        for line in synthetic_lines(pages * lines_per_page):
+            f.write(line + (' café' if encoding != 'ascii' else '') + '\n')
+
+
+class Command(BaseCommand):
+    help = "Measure text extraction throughput per format on generated PDF, DOCX and text files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=200, help='Pages of text per generated document')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per format; the best is reported')
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, PDF_EXTRACTION_WORKERS],
+                            help='PDF extraction worker counts to compare (1 = in-process)')
+
+    def handle(self, *args, **options):
+        pages = options['pages']
+        workdir = tempfile.mkdtemp(prefix='extraction-bench-')
+        try:
+            cases = []
+            pdf_path = os.path.join(workdir, 'doc.pdf')
+            write_pdf(pdf_path, pages)
+            for workers in dict.fromkeys(options['workers']):
+                cases.append((f'pdf x{workers}', pdf_path, workers))
+            docx_path = os.path.join(workdir, 'doc.docx')
+            write_docx(docx_path, pages)
+            cases.append(('docx', docx_path, None))
+            for encoding in ('utf-8', 'latin-1'):
+                txt_path = os.path.join(workdir, f'doc-{encoding}.txt')
+                write_txt(txt_path, pages, encoding)
+                cases.append((f'txt {encoding}', txt_path, None))
+
+            self.stdout.write(f"{pages} pages per document, best of {options['repeat']}")
+            self.stdout.write(f"{'format':>12} {'size MB':>8} {'seconds':>8} {'pieces':>7} {'chars':>10} {'MB/s':>8}")
+            for name, path, workers in cases:
+                best = None
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    pieces = chars = 0
+                    for piece in iter_document_pages(path, pdf_workers=workers):
+                        pieces += 1
+                        chars += len(piece)
+                    seconds = time.perf_counter() - start
+                    best = seconds if best is None else min(best, seconds)
+                size_mb = os.path.getsize(path) / 1e6
+                self.stdout.write(f"{name:>12} {size_mb:>8.2f} {best:>8.3f} {pieces:>7} {chars:>10} {size_mb / best:>8.2f}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
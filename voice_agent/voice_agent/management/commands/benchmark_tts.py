@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from voice_agent.tts import TTS_BACKEND, TTS_WORKERS, TTSPool
+from voice_agent.views import PODCAST_PAUSE_SECONDS, assemble_podcast
+
+LINES = (
+    "Welcome back to the show, today we are digging into the quarterly safety report.",
+    "Right, and the headline is that pressure incidents on the turbine line went down.",
+    "Which is interesting, because the maintenance budget was cut at the same time.",
+    "The report credits the new sensor network and the revised valve schedule.",
+)
+
+
+def podcast_script(turns):
+    return [(f"Agent {turn % 2 + 1}", LINES[turn % len(LINES)]) for turn in range(turns)]
+
+
+class Command(BaseCommand):
+    help = "Measure podcast synthesis wall-clock time across TTS worker pool sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--turns', type=int, default=24, help='Agent turns in the generated script')
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, TTS_WORKERS],
+                            help='Pool sizes to compare')
+        parser.add_argument('--backend', default=TTS_BACKEND, help="TTS engine ('pyttsx3' or 'stub')")
+
+    def handle(self, *args, **options):
+        turns = podcast_script(options['turns'])
+        self.stdout.write(f"{len(turns)} turns, {options['backend']} engine")
+        self.stdout.write(f"{'workers':>8} {'start s':>8} {'seconds':>8} {'audio s':>8} {'speedup':>8}")
+        baseline = None
+        for workers in dict.fromkeys(options['workers']):
+            pool = TTSPool(workers=workers, backend=options['backend'])
+            try:
+                # Engine start-up is paid once per process, not per podcast, so it is timed apart
+                start = time.perf_counter()
+                for future in [pool.submit('warm up') for _ in range(workers)]:
+                    future.result()
+                started = time.perf_counter() - start
+
+                start = time.perf_counter()
+                futures = [pool.submit(text, voice=2 if agent == 'Agent 2' else 1) for agent, text in turns]
+                speeches = [future.result() for future in futures]
+                assemble_podcast(speeches)
+                seconds = time.perf_counter() - start
+            finally:
+                pool.shutdown()
+            audio_seconds = sum(speech.duration for speech in speeches) + PODCAST_PAUSE_SECONDS * (len(speeches) - 1)
+            baseline = baseline or seconds
+            self.stdout.write(f"{workers:>8} {started:>8.2f} {seconds:>8.3f} {audio_seconds:>8.1f} {baseline / seconds:>8.2f}")
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+MOCK_ANSWER = "Agent here. This is a mock answer.\n- first point\n- second point"
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local OpenAI/Ollama-compatible mock server for exercising the LLM client and "
+        "embedding pipeline (point GROQ_API_URL / OLLAMA_API_URL at it)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.05, help='Seconds to wait before answering')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of requests that fail')
+        parser.add_argument('--failure-status', type=int, default=503)
+        parser.add_argument('--dimension', type=int, default=768, help='Embedding dimension')
+
+    def handle(self, *args, **options):
+        command = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, content_type='application/json'):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                time.sleep(options['latency'])
+                if random.random() < options['failure_rate']:
+                    self._send(options['failure_status'], b'{"error": "mock failure"}')
+                    return
+                if self.path.rstrip('/').endswith('/embed'):
+                    self._send(200, json.dumps({'embeddings': [
+                        command.embed(text, options['dimension']) for text in payload.get('input', [])
+                    ]}).encode())
+                elif payload.get('stream'):
+                    self.stream_answer()
+                else:
+                    prompt_chars = sum(len(m.get('content', '')) for m in payload.get('messages', []))
+                    self._send(200, json.dumps({
+                        'choices': [{'message': {'role': 'assistant', 'content': MOCK_ANSWER}}],
+                        'usage': {'prompt_tokens': prompt_chars // 4, 'completion_tokens': len(MOCK_ANSWER) // 4},
+                    }).encode())
+
+            def stream_answer(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for i in range(0, len(MOCK_ANSWER), 6):
+                    delta = {'choices': [{'delta': {'content': MOCK_ANSWER[i:i + 6]}}]}
+                    self.write_chunk(f"data: {json.dumps(delta)}\n\n".encode())
+                    time.sleep(0.01)
+                self.write_chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def write_chunk(self, data):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+        server = ThreadingHTTPServer((options['host'], options['port']), Handler)
+        self.stdout.write(f"Mock LLM server listening on http://{options['host']}:{options['port']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+    @staticmethod
+    def embed(text, dimension):
+        # Deterministic per text, so repeated runs and cache checks line up
+        seed = int(hashlib.sha256(text.encode('utf-8')).hexdigest()[:8], 16)
+        vector = np.random.default_rng(seed).standard_normal(dimension)
+        return (vector / np.linalg.norm(vector)).astype('float32').tolist()
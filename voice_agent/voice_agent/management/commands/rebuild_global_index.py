@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from voice_agent.global_index import GLOBAL_INDEX
+from voice_agent.index_store import INDEX_STORE
+from voice_agent.models import Document
+
+
+class Command(BaseCommand):
+    help = "Add every indexed document to the cross-document global index (e.g. after upgrading)."
+
+    def handle(self, *args, **options):
+        added = 0
+        for document_id in Document.objects.values_list('id', flat=True).order_by('id'):
+            indexed_document = INDEX_STORE.get(document_id)
+            if indexed_document is None:
+                continue
+            GLOBAL_INDEX.add_document(document_id, indexed_document.embeddings)
+            added += 1
+        self.stdout.write(f"Indexed {added} documents: {GLOBAL_INDEX.stats()}")
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voice_agent', '0009_rename_created_at_chatmessage_timestamp_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(choices=[('queued', 'Queued'), ('extracting', 'Extracting text'), ('chunking', 'Chunking'), ('embedding', 'Embedding'), ('indexing', 'Building index'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('progress', models.FloatField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('timings', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingestion_jobs', to='voice_agent.document')),
+            ],
+        ),
+    ]
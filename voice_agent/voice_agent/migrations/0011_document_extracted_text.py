@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voice_agent', '0010_ingestionjob'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='document',
+            name='processed_text',
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='extraction',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='page_offsets',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voice_agent', '0011_document_extracted_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+    ]
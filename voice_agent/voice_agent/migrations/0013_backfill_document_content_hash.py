@@ -0,0 +1,36 @@
+import hashlib
+import logging
+
+from django.db import migrations
+
+logger = logging.getLogger(__name__)
+
+
+def backfill_content_hash(apps, schema_editor):
+    """Record the SHA-256 of documents uploaded before content hashes existed.
+
+    Files that are gone are left blank; text_cache hashes a document on first
+    access otherwise, so this only moves the work out of the first request.
+    """
+    Document = apps.get_model('voice_agent', 'Document')
+    for document in Document.objects.filter(content_hash='').iterator():
+        digest = hashlib.sha256()
+        try:
+            with document.file.open('rb') as f:
+                for chunk in f.chunks():
+                    digest.update(chunk)
+        except (FileNotFoundError, ValueError):
+            logger.warning(f"Cannot hash document {document.id}: file {document.file.name!r} is missing")
+            continue
+        Document.objects.filter(id=document.id).update(content_hash=digest.hexdigest())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voice_agent', '0012_ingestionjob_attempts'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+    ]
@@ -11,7 +11,11 @@ class Document(models.Model):
     file = models.FileField(upload_to='documents/')
     filename = models.CharField(max_length=255)
     content_type = models.CharField(max_length=100)
-    processed_text = models.TextField(blank=True)
+    # SHA-256 of the file; names the extracted-text sidecar (see text_cache.py)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    # Character offset of each page (PDF page, DOCX paragraph, text block) in the extracted text
+    page_offsets = models.JSONField(default=list, blank=True)
+    extraction = models.JSONField(default=dict, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     
@@ -26,4 +30,39 @@ class ChatMessage(models.Model):
     agent_id = models.IntegerField(default=1)
     
     def __str__(self):
-        return f"Message on {self.document.filename} at {self.timestamp}" 
\ No newline at end of file
+        return f"Message on {self.document.filename} at {self.timestamp}"
+
+class IngestionJob(models.Model):
+    STAGE_QUEUED = 'queued'
+    STAGE_EXTRACTING = 'extracting'
+    STAGE_CHUNKING = 'chunking'
+    STAGE_EMBEDDING = 'embedding'
+    STAGE_INDEXING = 'indexing'
+    STAGE_DONE = 'done'
+    STAGE_FAILED = 'failed'
+    STAGE_CHOICES = [
+        (STAGE_QUEUED, 'Queued'),
+        (STAGE_EXTRACTING, 'Extracting text'),
+        (STAGE_CHUNKING, 'Chunking'),
+        (STAGE_EMBEDDING, 'Embedding'),
+        (STAGE_INDEXING, 'Building index'),
+        (STAGE_DONE, 'Done'),
+        (STAGE_FAILED, 'Failed'),
+    ]
+
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='ingestion_jobs')
+    stage = models.CharField(max_length=20, choices=STAGE_CHOICES, default=STAGE_QUEUED)
+    progress = models.FloatField(default=0)
+    error = models.TextField(blank=True)
+    timings = models.JSONField(default=dict, blank=True)
+    # Runs started, counting re-queues after the worker running the job exited
+    attempts = models.PositiveSmallIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def is_finished(self):
+        return self.stage in (self.STAGE_DONE, self.STAGE_FAILED)
+
+    def __str__(self):
+        return f"Ingestion of {self.document.filename}: {self.stage} ({self.progress:.0f}%)"
@@ -0,0 +1,359 @@
+"""Prompt routing for multi-agent messages.
+
+Most prompts name their agents explicitly ("Agent 2 ask Agent 1 ...",
+"both agents ...") or name none at all, so they can be routed with a small
+regex grammar. Only prompts the grammar cannot classify are sent to the
+router LLM.
+"""
+import hashlib
+import json
+import logging
+import re
+import time
+
+from django.conf import settings
+
+from .caching import TTLCache, normalize_query
+from .llm_client import GROQ_CLIENT, LLMMetrics
+
+logger = logging.getLogger(__name__)
+
+ROUTER_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
+ROUTER_PROMPT_MODE = getattr(settings, 'ROUTER_PROMPT_MODE', 'compact')
+ROUTER_HISTORY_TURNS = getattr(settings, 'ROUTER_HISTORY_TURNS', 4)
+ROUTER_HISTORY_TURN_CHARS = getattr(settings, 'ROUTER_HISTORY_TURN_CHARS', 200)
+# Rough size of a token, used to report what compact router prompts save
+BYTES_PER_TOKEN = 4
+
+# Agents the frontend can address; anything else is left to the router LLM
+ROUTABLE_AGENT_IDS = (1, 2)
+
+MENTION_RE = re.compile(r'\b[Aa]gent\s+(\d+)\b')
+# Words that ask for a multi-turn exchange regardless of who is mentioned
+DISCUSSION_RE = re.compile(
+    r'\b(discuss\w*|debat\w*|argu\w*|conversation|converse|back and forth|each other|one another)\b',
+    re.IGNORECASE,
+)
+# Verbs that make the second mentioned agent the target of the first
+INTERACTION_RE = re.compile(
+    r'\b(ask\w*|question\w*|challeng\w*|respond\w*|repl\w*|counter\w*|rebut\w*|critiqu\w*|'
+    r'quiz\w*|interview\w*|talk\w*|chat\w*|start\w*|begin|open\w*|engage\w*)\b',
+    re.IGNORECASE,
+)
+GROUP_RE = re.compile(
+    r'\b(both\s+(agents|of\s+you)|you\s+(both|two)|(each|every|other)\s+agent|all\s+agents)\b',
+    re.IGNORECASE,
+)
+# Polite or imperative lead-ins allowed before the first mention
+LEAD_IN_RE = re.compile(r'^\s*(?:(?:please|ok|okay|hey|now|so|let|have|make|can|could|would|will)\b[\s,]*)*$',
+                        re.IGNORECASE)
+CLAUSE_BOUNDARY_RE = re.compile(r'(?:[,;.:!?]|\band|\bthen|\bwhile|\bwhereas|\bmeanwhile)\s*$', re.IGNORECASE)
+
+ROUTER_SYSTEM_PROMPT = (
+    "You are a prompt router for a multi-agent AI system. Given a user prompt and the recent discussion, answer ONLY in strict JSON format:\n"
+    "{\n"
+    "  \"discussion_required\": true/false,\n"
+    "  \"initiator_agent_id\": 1 or 2,\n"
+    "  \"responding_agent_ids\": <list of agent numbers>,\n"
+    "  \"revised_prompt\": <string, or an object mapping agent numbers to instructions>\n"
+    "}\n"
+    "Rules:\n"
+    "- If the user wants a discussion or one agent to ask another, set discussion_required to true and specify the initiator.\n"
+    "- The initiator_agent_id should be the agent who is being asked to start the discussion, ask a question, or take the first action, NOT the agent being asked about.\n"
+    "- If the user says 'Agent X ask Agent Y...', then Agent X is the initiator_agent_id.\n"
+    "- If the user gives multiple separate instructions to different agents (e.g., 'Agent 1 ... and Agent 2 ...'), this is NOT a discussion, but a set of individual queries. Set discussion_required to false, initiator_agent_id to the first agent mentioned, and responding_agent_ids to the list of all agents who should answer in order. The revised_prompt should be a JSON object (dict) mapping each agent's number (as a string) to their specific instruction, e.g. {\"1\": \"Agent 1's instruction\", \"2\": \"Agent 2's instruction\"}. Each agent should answer ONLY their part, with no discussion.\n"
+    "- If the user just wants a direct answer (no agent mentioned), set discussion_required to false and initiator_agent_id to 1, responding_agent_ids to [1], and revised_prompt to the user prompt.\n"
+    "- If the user directly addresses a single agent (e.g., 'Agent 2, could you...'), set discussion_required to false, initiator_agent_id to that agent's number, and responding_agent_ids to a list with that agent's number. revised_prompt should be the instruction for that agent.\n"
+    "- If the user mentions only one agent in any form, treat it as a direct question to that agent (not a discussion).\n"
+    "- If the user says 'Agent 1 and Agent 2 discuss ...' or 'Let the agents discuss ...', set discussion_required to true, initiator_agent_id to the first agent mentioned, and responding_agent_ids to the list of all agents in the order mentioned. revised_prompt should be the discussion topic.\n"
+    "- If the user says 'Let Agent 2 start a discussion with Agent 1 about ...', set discussion_required to true, initiator_agent_id to 2, responding_agent_ids to [2,1], and revised_prompt to the discussion topic.\n"
+    "- If the user says 'Both agents ...', treat it as a discussion if the user requests a discussion, otherwise as separate instructions.\n"
+    "- If the user prompt is ambiguous, make your best guess and explain your reasoning in the revised_prompt.\n"
+    "- If the user prompt doesn't mention any Agent, then let Agent 1 give the answer for it (default agent).\n"
+    "- Always output valid JSON, no extra text.\n"
+    "Examples:\n"
+    "User: Agent 2 ask Agent 1 about the findings.\n"
+    "Output: {\"discussion_required\": true, \"initiator_agent_id\": 2, \"responding_agent_ids\": [2,1], \"revised_prompt\": \"Agent 2 should ask Agent 1 about the findings.\"}\n"
+    "User: Agent 1 and Agent 2 discuss the document.\n"
+    "Output: {\"discussion_required\": true, \"initiator_agent_id\": 1, \"responding_agent_ids\": [1,2], \"revised_prompt\": \"Agent 1 and Agent 2 discuss the document.\"}\n"
+    "User: Who wrote this document?\n"
+    "Output: {\"discussion_required\": false, \"initiator_agent_id\": 1, \"responding_agent_ids\": [1], \"revised_prompt\": \"Who wrote this document?\"}\n"
+    "User: Agent 1 give me 3 key points from the document and Agent 2 tell me the future consequences of AI.\n"
+    "Output: {\"discussion_required\": false, \"initiator_agent_id\": 1 , \"responding_agent_ids\": [1,2], \"revised_prompt\": {\"1\": \"Give me 3 key points from the document.\", \"2\": \"Tell me the future consequences of AI.\"}}\n"
+    "User: Agent 1 give me 3 key points from the document.\n"
+    "Output: {\"discussion_required\": false, \"initiator_agent_id\": 1, \"responding_agent_ids\": [1], \"revised_prompt\": \"Give me 3 key points from the document.\"}\n"
+    "User: Agent 2 could you give me few more examples reinforcing your views?\n"
+    "Output: {\"discussion_required\": false, \"initiator_agent_id\": 2, \"responding_agent_ids\": [2], \"revised_prompt\": \"Give me a few more examples reinforcing your views.\"}\n"
+    "User: Let Agent 2 start a discussion with Agent 1 about the main findings.\n"
+    "Output: {\"discussion_required\": true, \"initiator_agent_id\": 2, \"responding_agent_ids\": [2,1], \"revised_prompt\": \"Start a discussion about the main findings.\"}\n"
+    "User: Both agents summarize the document.\n"
+    "Output: {\"discussion_required\": false, \"initiator_agent_id\": 1, \"responding_agent_ids\": [1,2], \"revised_prompt\": {\"1\": \"Summarize the document.\", \"2\": \"Summarize the document.\"}}\n"
+    "User: Let the agents discuss the implications of AI.\n"
+    "Output: {\"discussion_required\": true, \"initiator_agent_id\": 1, \"responding_agent_ids\": [1,2], \"revised_prompt\": \"Discuss the implications of AI.\"}\n"
+    "User: Agent 1, what are your thoughts?\n"
+    "Output: {\"discussion_required\": false, \"initiator_agent_id\": 1, \"responding_agent_ids\": [1], \"revised_prompt\": \"What are your thoughts?\"}\n"
+    "User: Agent 2, could you explain your reasoning?\n"
+    "Output: {\"discussion_required\": false, \"initiator_agent_id\": 2, \"responding_agent_ids\": [2], \"revised_prompt\": \"Could you explain your reasoning?\"}\n"
+    "User: Summarize the document.\n"
+    "Output: {\"discussion_required\": false, \"initiator_agent_id\": 1, \"responding_agent_ids\": [1], \"revised_prompt\": \"Summarize the document.\"}\n"
+    "User: Agent 1 add more points reinforcing your views.\n"
+    "Output: {\"discussion_required\": false, \"initiator_agent_id\": 1, \"responding_agent_ids\": [1], \"revised_prompt\": \"Add more points reinforcing your views.\"}\n"
+    "User: Agent 2 add more points reinforcing your views.\n"
+    "Output: {\"discussion_required\": false, \"initiator_agent_id\": 2, \"responding_agent_ids\": [2], \"revised_prompt\": \"Add more points reinforcing your views.\"}\n"
+)
+
+# 'local' counts prompts routed by the grammar, 'llm_fallback' those handed to the router LLM,
+# 'router_prompt' the size of router LLM prompts and what compact mode saved
+ROUTING_METRICS = LLMMetrics()
+# normalized prompt and context hash (route_cache_key) -> router LLM decision
+ROUTE_CACHE = TTLCache(
+    maxsize=getattr(settings, 'ROUTER_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'ROUTER_CACHE_TTL', 600),
+)
+
+
+def parse_agent_mentions(message: str) -> dict:
+    """Parses the message for agent mentions (e.g., 'Agent 1', 'Agent 2') and returns their IDs along with their specific instructions.
+    If no specific agent is mentioned, returns an empty dictionary.
+    """
+    agent_instructions = {}
+
+    # Use re.finditer to get all matches and their spans
+    agent_mention_matches = list(re.finditer(r'[Aa]gent\s+(\d+)', message))
+
+    if not agent_mention_matches:
+        return {}
+
+    # Extract instructions based on the spans of agent mentions
+    for i, match in enumerate(agent_mention_matches):
+        agent_id = int(match.group(1))
+        start_index = match.end()
+
+        if i + 1 < len(agent_mention_matches):
+            end_index = agent_mention_matches[i+1].start()
+            instruction = message[start_index:end_index].strip()
+        else:
+            instruction = message[start_index:].strip()
+
+        # Clean up the instruction by removing leading/trailing conjunctions or empty phrases
+        instruction = re.sub(r'^(and|then|also)\s+', '', instruction, flags=re.IGNORECASE).strip()
+        instruction = re.sub(r'\s+(and|then|also)$\s*', '', instruction, flags=re.IGNORECASE).strip()
+        
+        if instruction:
+            agent_instructions[agent_id] = instruction
+            
+    return agent_instructions
+
+
+def _route(discussion_required, initiator_agent_id, responding_agent_ids, revised_prompt):
+    return {
+        'discussion_required': discussion_required,
+        'initiator_agent_id': initiator_agent_id,
+        'responding_agent_ids': responding_agent_ids,
+        'revised_prompt': revised_prompt,
+    }
+
+
+def _instruction(text):
+    """Tidy the text following an agent mention into a standalone instruction."""
+    text = re.sub(r'^[\s,:;\-]+', '', text)
+    text = re.sub(r'^(and|then|also)\s+', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'[\s,;]+(and|then|also)?\s*$', '', text, flags=re.IGNORECASE).strip()
+    return text[:1].upper() + text[1:]
+
+
+def _is_possessive(message, match):
+    return bool(re.match(r"['’]s?\b", message[match.end():]))
+
+
+def _match_route(message):
+    mentions = list(MENTION_RE.finditer(message))
+    agent_ids = [int(m.group(1)) for m in mentions]
+    if any(agent_id not in ROUTABLE_AGENT_IDS for agent_id in agent_ids):
+        return None
+    wants_discussion = bool(DISCUSSION_RE.search(message))
+    addresses_group = bool(GROUP_RE.search(message))
+
+    if not mentions:
+        if addresses_group and wants_discussion:
+            return _route(True, 1, [1, 2], message)
+        if addresses_group:
+            return _route(False, 1, [1, 2], message)
+        if wants_discussion:
+            # "Start a discussion" without naming anyone: let the LLM pick the initiator
+            return None
+        return _route(False, 1, [1], message)
+
+    first = mentions[0]
+    if not LEAD_IN_RE.match(message[:first.start()]) or _is_possessive(message, first):
+        return None
+
+    if len(mentions) == 1:
+        if addresses_group or wants_discussion:
+            return None
+        instruction = _instruction(message[first.end():])
+        if not instruction:
+            return None
+        return _route(False, agent_ids[0], [agent_ids[0]], instruction)
+
+    if len(mentions) != 2 or agent_ids[0] == agent_ids[1]:
+        return None
+    second = mentions[1]
+    between = message[first.end():second.start()]
+    after = message[second.end():]
+    initiator_id, other_id = agent_ids
+
+    # "Agent 1 and Agent 2 discuss X"
+    if re.fullmatch(r'[\s,]*(and|&)[\s,]*', between, re.IGNORECASE):
+        if DISCUSSION_RE.search(after):
+            return _route(True, initiator_id, [initiator_id, other_id], _instruction(after))
+        return None
+    # "Agent 2 ask Agent 1 about X", "Agent 1, start a discussion with Agent 2 on X".
+    # A verb before a clause break ("Agent 1 answer, then Agent 2 ...") is not aimed at the second agent.
+    clause_break = CLAUSE_BOUNDARY_RE.search(between) and not re.search(r'\b(with|to)\s*$', between, re.IGNORECASE)
+    if (INTERACTION_RE.search(between) or DISCUSSION_RE.search(between)) and not clause_break:
+        return _route(True, initiator_id, [initiator_id, other_id], _instruction(message[first.end():]))
+    # "Agent 1 summarize X and Agent 2 critique it"
+    if clause_break and not wants_discussion and not _is_possessive(message, second):
+        instructions = parse_agent_mentions(message)
+        if len(instructions) != 2:
+            return None
+        return _route(False, initiator_id, [initiator_id, other_id],
+                      {str(agent_id): _instruction(text) for agent_id, text in instructions.items()})
+    return None
+
+
+def route_prompt_locally(message):
+    """Route a prompt with the keyword grammar.
+
+    Returns a dict shaped like the router LLM's JSON answer, or None when the
+    prompt is ambiguous and should go to the router LLM.
+    """
+    start = time.perf_counter()
+    route = _match_route(message or '')
+    elapsed = time.perf_counter() - start
+    ROUTING_METRICS.record('local' if route is not None else 'llm_fallback', prompts=1)
+    if route is not None:
+        logger.info(f"Routed prompt locally in {elapsed * 1e6:.0f}us: {route}")
+    return route
+
+
+def parse_router_output(content):
+    """Extract the JSON object from a router LLM answer, or None if there is none."""
+    match = re.search(r'\{[\s\S]*\}', content or '')
+    if not match:
+        logger.error(f"Router LLM did not return valid JSON: {content}")
+        return None
+    try:
+        router_json = json.loads(match.group(0))
+    except ValueError as e:
+        logger.error(f"Router JSON parse error: {e}")
+        return None
+    if not isinstance(router_json, dict):
+        logger.error(f"Router JSON parse error: expected an object, got {router_json!r}")
+        return None
+    return router_json
+
+
+def history_digest(discussion_history, turns=None, max_chars=None):
+    """Last few discussion turns, whitespace-collapsed and clipped, for the router prompt."""
+    turns = turns or ROUTER_HISTORY_TURNS
+    max_chars = max_chars or ROUTER_HISTORY_TURN_CHARS
+    lines = []
+    for turn in (discussion_history or [])[-turns:]:
+        turn = normalize_query(str(turn))
+        if len(turn) > max_chars:
+            turn = turn[:max_chars].rsplit(' ', 1)[0] + '...'
+        lines.append(turn)
+    return '\n'.join(lines)
+
+
+def router_context(discussion_history, document_content='', discussion_context='', mode=None):
+    """The part of the router user message that precedes the prompt."""
+    if (mode or ROUTER_PROMPT_MODE) == 'full':
+        return f"Document: {document_content}\nDiscussion: {discussion_context}\n"
+    digest = history_digest(discussion_history)
+    return f"Discussion: {digest}\n" if digest else ''
+
+
+def route_cache_key(message, context):
+    """Normalized prompt plus a hash of the context the router sees with it.
+
+    "tell me more" routes differently from one conversation (or document) to
+    the next, so a decision is only reused for the same prompt in the same
+    context.
+    """
+    return f"{normalize_query(message)}\0{hashlib.sha256(context.encode('utf-8')).hexdigest()[:16]}"
+
+
+def build_router_messages(message, discussion_history, document_content='', discussion_context='', mode=None):
+    """Build the router LLM messages.
+
+    Returns ``(messages, full_size)`` where full_size is the byte size of the
+    user message the 'full' mode would send, for reporting savings.
+    """
+    full_content = f"Document: {document_content}\nDiscussion: {discussion_context}\nPrompt: {message}"
+    user_content = router_context(discussion_history, document_content, discussion_context, mode) + f"Prompt: {message}"
+    messages = [
+        {"role": "system", "content": ROUTER_SYSTEM_PROMPT},
+        {"role": "user", "content": user_content},
+    ]
+    return messages, len(full_content.encode('utf-8'))
+
+
+def _prepare_router_call(message, discussion_history, document_content, discussion_context):
+    """Return ``(cache_key, cached_decision, payload)``; the payload is None on a cache hit."""
+    key = route_cache_key(message, router_context(discussion_history, document_content, discussion_context))
+    cached = ROUTE_CACHE.get(key)
+    if cached is not None:
+        logger.info(f"Router decision cache hit for prompt: {normalize_query(message)[:80]}")
+        return key, dict(cached), None
+
+    router_messages, full_size = build_router_messages(message, discussion_history, document_content, discussion_context)
+    user_size = len(router_messages[1]['content'].encode('utf-8'))
+    bytes_saved = max(full_size - user_size, 0)
+    ROUTING_METRICS.record(
+        'router_prompt',
+        prompts=1,
+        bytes_sent=user_size,
+        bytes_saved=bytes_saved,
+        estimated_tokens_saved=bytes_saved // BYTES_PER_TOKEN,
+    )
+    # Log prompt size
+    prompt_size = sum(len(m['content']) for m in router_messages)
+    logger.info(f"Router LLM prompt size: {prompt_size} characters ({bytes_saved} bytes saved)")
+    return key, None, {
+        "model": ROUTER_MODEL,
+        "messages": router_messages,
+        "temperature": 0.0,
+        "top_p": 1.0
+    }
+
+
+def _router_decision(key, router_result):
+    logger.info(f"Router LLM response: {router_result}")
+    router_content = router_result.get('choices', [{}])[0].get('message', {}).get('content', '')
+    router_json = parse_router_output(router_content)
+    if router_json is not None:
+        ROUTE_CACHE.set(key, dict(router_json))
+    return router_json
+
+
+def route_prompt_with_llm(message, discussion_history, document_content='', discussion_context=''):
+    """Route a prompt with the router LLM, memoized per normalized prompt and context.
+
+    Returns the decision dict, or None if the LLM answer held no JSON object.
+    Raises LLMError when the LLM call fails.
+    """
+    key, cached, payload = _prepare_router_call(message, discussion_history, document_content, discussion_context)
+    if payload is None:
+        return cached
+    return _router_decision(key, GROQ_CLIENT.chat(payload, label='router'))
+
+
+async def aroute_prompt_with_llm(http_client, message, discussion_history, document_content='', discussion_context=''):
+    """Async counterpart of route_prompt_with_llm over an httpx.AsyncClient, sharing its cache."""
+    key, cached, payload = _prepare_router_call(message, discussion_history, document_content, discussion_context)
+    if payload is None:
+        return cached
+    return _router_decision(key, await GROQ_CLIENT.achat(http_client, payload, label='router'))
@@ -140,6 +140,151 @@ CORS_ALLOW_METHODS = ['*']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Document retrieval
+# Serialized FAISS indexes and chunk texts, one directory per Document.id
+FAISS_INDEX_ROOT = os.path.join(MEDIA_ROOT, 'faiss_indices')
+# Maximum number of document indexes each worker keeps loaded in memory
+FAISS_INDEX_CACHE_SIZE = 32
+# Precision of the per-document embedding matrices kept next to each index ('float16' or 'float32')
+EMBEDDING_STORAGE_DTYPE = 'float16'
+# Index type: 'auto' picks by size (flat up to ANN_FLAT_MAX_VECTORS, then ANN_MIDSIZE_TYPE,
+# IVF-PQ from ANN_PQ_MIN_VECTORS); 'flat', 'ivf', 'hnsw' or 'ivfpq' force one
+ANN_INDEX_TYPE = 'auto'
+ANN_FLAT_MAX_VECTORS = 5_000
+ANN_MIDSIZE_TYPE = 'ivf'
+ANN_PQ_MIN_VECTORS = 500_000
+# Recall/latency knobs, applied whenever an index is loaded
+ANN_IVF_NPROBE = 16
+ANN_HNSW_M = 32
+ANN_HNSW_EF_CONSTRUCTION = 80
+ANN_HNSW_EF_SEARCH = 64
+ANN_PQ_M = 32
+ANN_PQ_NBITS = 8
+# Retrieval: 'hybrid' fuses BM25 and vector hits with reciprocal rank fusion, 'dense' or 'lexical' use one
+RETRIEVAL_MODE = 'hybrid'
+RRF_K = 60
+HYBRID_CANDIDATES = 20
+# Seconds to wait for a query embedding before answering from BM25 hits alone
+QUERY_EMBEDDING_TIMEOUT = 2.0
+# Prompt context budgets in approximate tokens, filled by relevance rank at sentence boundaries
+CONTEXT_BUDGET_AGENT = 3000
+CONTEXT_BUDGET_SUMMARY = 2000
+CONTEXT_BUDGET_PODCAST = 2000
+CONTEXT_BUDGET_PODCAST_QA = 500
+# Cross-document index: every document's chunks, spread over shards by Document.id
+GLOBAL_INDEX_ROOT = os.path.join(MEDIA_ROOT, 'faiss_global')
+GLOBAL_INDEX_SHARDS = 8
+# IVF shards are retrained on all their vectors after growing this many times past their training size
+GLOBAL_INDEX_RETRAIN_GROWTH = 4
+
+# Embeddings (Ollama-compatible server)
+OLLAMA_API_URL = 'http://localhost:11434/api'
+EMBEDDING_MODEL = 'nomic-embed-text'
+EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_CONCURRENCY = 4
+EMBEDDING_MAX_RETRIES = 3
+EMBEDDING_TIMEOUT = (3.05, 120)
+# Content-addressed embedding cache shared by all workers
+EMBEDDING_CACHE_PATH = os.path.join(BASE_DIR, 'embedding_cache.sqlite3')
+EMBEDDING_CACHE_MAX_ENTRIES = 200_000
+# Seconds before a cache hit rewrites the entry's last_used (the LRU clock); hits in between are read-only
+EMBEDDING_CACHE_TOUCH_INTERVAL = 3600
+# In-process caches of query embeddings and search hits
+QUERY_CACHE_SIZE = 1024
+QUERY_CACHE_TTL = 600
+
+# Background document ingestion threads per worker process
+INGESTION_WORKERS = 2
+# A running job refreshes its updated_at every INGESTION_HEARTBEAT seconds. Unfinished jobs not updated
+# for INGESTION_STALE_AFTER seconds were orphaned by a worker that exited; they are re-queued at startup
+# or when polled, and failed once they have been started INGESTION_MAX_ATTEMPTS times
+INGESTION_HEARTBEAT = 30
+INGESTION_STALE_AFTER = 300
+INGESTION_MAX_ATTEMPTS = 2
+INGESTION_RESUME_ON_START = True
+# Chunking: 'sentence', 'token' or 'heading' (sections of Markdown/DOCX); 'auto' picks by file type
+CHUNK_STRATEGY = 'auto'
+CHUNK_SIZE_TOKENS = 512
+# Tokens of trailing text repeated at the start of the next chunk
+CHUNK_OVERLAP_TOKENS = 64
+# Characters per block when streaming plain-text files into the chunker
+TEXT_BLOCK_SIZE = 64 * 1024
+# Encoding is guessed from this many leading bytes instead of the whole file
+ENCODING_SNIFF_BYTES = 64 * 1024
+# PDFs of PDF_PARALLEL_MIN_PAGES or more are extracted by a process pool, PDF_PAGES_PER_TASK pages per task
+PDF_EXTRACTION_WORKERS = min(4, os.cpu_count() or 1)
+PDF_PAGES_PER_TASK = 8
+PDF_PARALLEL_MIN_PAGES = 24
+# Extracted text is stored once per file content, gzip-compressed, named by SHA-256
+TEXT_CACHE_ROOT = os.path.join(MEDIA_ROOT, 'extracted_text')
+DOCUMENT_TEXT_CACHE_SIZE = 16
+DOCUMENT_TEXT_CACHE_TTL = 600
+
+# Voice input: uploads are decoded to 16 kHz mono PCM by ffmpeg over pipes
+FFMPEG_BINARY = 'ffmpeg'
+FFMPEG_TIMEOUT = 30
+# ffmpeg processes started ahead of requests and left waiting on stdin
+FFMPEG_WARM_PROCESSES = 2
+# Speech recognition: 'google' (network), 'vosk' or 'whisper' (offline, optional packages) or 'stub' (tests)
+SPEECH_BACKEND = os.environ.get('SPEECH_BACKEND', 'google')
+SPEECH_LANGUAGE = 'en-US'
+VOSK_MODEL_PATH = os.environ.get('VOSK_MODEL_PATH')
+WHISPER_MODEL = 'base.en'
+# Load offline models at startup instead of on the first voice request
+SPEECH_PREWARM = True
+# Seconds of new audio between partial transcripts (whisper/stub)
+SPEECH_PARTIAL_INTERVAL = 1.0
+# Utterances of one recording sent to the recognizer in parallel
+SPEECH_UTTERANCE_WORKERS = 4
+# Voice activity detection: silence is trimmed and recordings split at pauses before recognition
+VAD_FRAME_MS = 30
+VAD_MIN_ENERGY = 300
+VAD_NOISE_RATIO = 3.0
+VAD_MIN_SPEECH_MS = 150
+VAD_MIN_SILENCE_MS = 600
+VAD_PADDING_MS = 200
+VAD_MAX_UTTERANCE_MS = 30_000
+# Streaming voice input (/api/voice-stream/, /ws/voice/)
+VOICE_STREAM_IDLE_TIMEOUT = 60
+VOICE_PREFETCH_MIN_WORDS = 3
+# Speech synthesis: long-lived worker processes, each with one engine ('pyttsx3', or 'stub' for tests)
+TTS_BACKEND = os.environ.get('TTS_BACKEND', 'pyttsx3')
+TTS_WORKERS = 2
+# Seconds before a synthesis job fails and its worker is replaced; crashed workers are retried this many times
+TTS_JOB_TIMEOUT = 60
+TTS_START_TIMEOUT = 30
+TTS_MAX_RETRIES = 1
+
+# LLM (OpenAI-compatible chat completions endpoint)
+GROQ_API_URL = os.environ.get('GROQ_API_URL', 'https://api.groq.com/openai/v1/chat/completions')
+# WARNING: Storing API keys in code is a major security risk. Set GROQ_API_KEY in the environment.
+GROQ_API_KEY = os.environ.get('GROQ_API_KEY', 'SECRET_KEY')
+LLM_POOL_SIZE = 20
+LLM_CONNECT_TIMEOUT = 5
+LLM_READ_TIMEOUT = 120
+LLM_MAX_RETRIES = 3
+# Consecutive failures before failing fast, and seconds before trying the upstream again
+LLM_CIRCUIT_FAILURE_THRESHOLD = 5
+LLM_CIRCUIT_RESET_TIMEOUT = 30
+
+# Router LLM: 'compact' sends only the prompt and a short history digest, 'full' also sends the document
+ROUTER_PROMPT_MODE = 'compact'
+ROUTER_HISTORY_TURNS = 4
+ROUTER_HISTORY_TURN_CHARS = 200
+# Router decisions memoized per normalized prompt and the discussion (or document) it came with
+ROUTER_CACHE_SIZE = 1024
+ROUTER_CACHE_TTL = 600
+
+# Server-side discussions: concurrent agent calls per worker, default and maximum turns (summary included)
+DISCUSSION_WORKERS = 4
+DISCUSSION_DEFAULT_LIMIT = 5
+DISCUSSION_MAX_LIMIT = 15
+
+# Shared httpx pool used by the async views
+ASYNC_HTTP_MAX_CONNECTIONS = 100
+ASYNC_HTTP_MAX_KEEPALIVE = 20
+ASYNC_HTTP_TIMEOUT = 120
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -0,0 +1,22 @@
+import logging
+
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .global_index import GLOBAL_INDEX
+from .index_store import INDEX_STORE
+from .models import Document
+from .text_cache import remove_document_text
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_delete, sender=Document)
+def remove_document_indexes(sender, instance, **kwargs):
+    """Drop a deleted document's vectors from its own index and the global one, and its cached text."""
+    INDEX_STORE.delete(instance.id)
+    remove_document_text(instance)
+    try:
+        GLOBAL_INDEX.remove_document(instance.id)
+    except Exception as e:
+        logger.error(f"Failed to remove document {instance.id} from the global index: {str(e)}")
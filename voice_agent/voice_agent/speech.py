@@ -0,0 +1,296 @@
+"""Speech recognition backends.
+
+Every backend takes 16 kHz mono 16-bit PCM (see audio.py) and raises the
+``speech_recognition`` exceptions the views already handle:
+``UnknownValueError`` for audio with no recognizable speech and
+``RequestError`` for a failing engine. Backends:
+
+- ``google``: the Google Web Speech API through ``speech_recognition``. It
+  needs the network and produces no partial transcripts.
+- ``vosk``: an offline Kaldi model (``pip install vosk``, VOSK_MODEL_PATH),
+  with native streaming partials.
+- ``whisper``: offline faster-whisper (``pip install faster-whisper``). Partial
+  results come from re-transcribing the buffered audio every
+  SPEECH_PARTIAL_INTERVAL seconds.
+- ``stub``: deterministic transcripts derived from the audio length, for tests.
+
+Engines are loaded once per process; ``prewarm`` loads them ahead of the
+first request.
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import speech_recognition as sr
+from django.conf import settings
+
+from .audio import SAMPLE_RATE, SAMPLE_WIDTH
+from .llm_client import LLMMetrics
+
+logger = logging.getLogger(__name__)
+
+SPEECH_BACKEND = getattr(settings, 'SPEECH_BACKEND', 'google')
+SPEECH_LANGUAGE = getattr(settings, 'SPEECH_LANGUAGE', 'en-US')
+VOSK_MODEL_PATH = getattr(settings, 'VOSK_MODEL_PATH', None)
+WHISPER_MODEL = getattr(settings, 'WHISPER_MODEL', 'base.en')
+WHISPER_COMPUTE_TYPE = getattr(settings, 'WHISPER_COMPUTE_TYPE', 'int8')
+# Seconds of new audio between partial transcripts for backends without native streaming
+SPEECH_PARTIAL_INTERVAL = getattr(settings, 'SPEECH_PARTIAL_INTERVAL', 1.0)
+
+# Utterances of one recording recognized at the same time
+SPEECH_UTTERANCE_WORKERS = getattr(settings, 'SPEECH_UTTERANCE_WORKERS', 4)
+
+# Per-backend recognition latency and audio processed, plus the 'vad' stage
+SPEECH_METRICS = LLMMetrics()
+
+_utterance_executor = ThreadPoolExecutor(max_workers=SPEECH_UTTERANCE_WORKERS, thread_name_prefix='speech')
+
+BYTES_PER_SECOND = SAMPLE_RATE * SAMPLE_WIDTH
+
+
+def pcm_seconds(pcm):
+    return len(pcm) / BYTES_PER_SECOND
+
+
+class RecognitionStream:
+    """Incremental recognition of one utterance.
+
+    ``accept`` takes the next PCM bytes and returns the current partial
+    transcript; ``finish`` returns the final one. The base class buffers the
+    audio and transcribes it once at the end.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.buffer = bytearray()
+        self.partial = ''
+
+    def accept(self, pcm):
+        self.buffer.extend(pcm)
+        return self.partial
+
+    def finish(self):
+        return self.backend.transcribe(bytes(self.buffer))
+
+
+class RecognizerBackend:
+    name = None
+
+    def load(self):
+        """Load the engine; called once before the first recognition."""
+
+    def recognize(self, pcm):
+        raise NotImplementedError
+
+    def transcribe(self, pcm):
+        """Recognize a whole clip, recording latency in SPEECH_METRICS."""
+        start = time.perf_counter()
+        try:
+            text = self.recognize(pcm)
+        except sr.UnknownValueError:
+            text = ''
+        latency = time.perf_counter() - start
+        if not text:
+            SPEECH_METRICS.record(self.name, latency=latency, calls=1, no_speech=1)
+            raise sr.UnknownValueError()
+        SPEECH_METRICS.record(self.name, latency=latency, calls=1, audio_ms=round(pcm_seconds(pcm) * 1000))
+        return text
+
+    def stream(self):
+        return RecognitionStream(self)
+
+
+class GoogleBackend(RecognizerBackend):
+    name = 'google'
+
+    def recognize(self, pcm):
+        return sr.Recognizer().recognize_google(sr.AudioData(pcm, SAMPLE_RATE, SAMPLE_WIDTH),
+                                                language=SPEECH_LANGUAGE)
+
+
+class StubBackend(RecognizerBackend):
+    """Transcribes any audio as a fixed phrase naming its duration; silence is no speech."""
+    name = 'stub'
+
+    def recognize(self, pcm):
+        if not pcm or not np.frombuffer(pcm, dtype='<i2').any():
+            return ''
+        return f"stub transcript of {pcm_seconds(pcm):.1f} seconds"
+
+    def stream(self):
+        return _RetranscribingStream(self)
+
+
+class _RetranscribingStream(RecognitionStream):
+    """Partials by re-transcribing the whole buffer every SPEECH_PARTIAL_INTERVAL seconds of audio."""
+
+    def __init__(self, backend):
+        super().__init__(backend)
+        self._transcribed_bytes = 0
+
+    def accept(self, pcm):
+        self.buffer.extend(pcm)
+        if len(self.buffer) - self._transcribed_bytes >= SPEECH_PARTIAL_INTERVAL * BYTES_PER_SECOND:
+            self._transcribed_bytes = len(self.buffer)
+            start = time.perf_counter()
+            self.partial = self.backend.recognize(bytes(self.buffer)) or self.partial
+            SPEECH_METRICS.record(self.backend.name, latency=time.perf_counter() - start, partials=1)
+        return self.partial
+
+
+class VoskBackend(RecognizerBackend):
+    name = 'vosk'
+
+    def __init__(self):
+        self._model = None
+
+    def load(self):
+        if self._model is None:
+            try:
+                import vosk
+            except ImportError as e:
+                raise sr.RequestError("The vosk backend needs the vosk package (pip install vosk)") from e
+            if not VOSK_MODEL_PATH:
+                raise sr.RequestError("Set VOSK_MODEL_PATH to a downloaded Vosk model directory")
+            vosk.SetLogLevel(-1)
+            self._model = vosk.Model(VOSK_MODEL_PATH)
+        return self._model
+
+    def _recognizer(self):
+        import vosk
+        return vosk.KaldiRecognizer(self.load(), SAMPLE_RATE)
+
+    def recognize(self, pcm):
+        recognizer = self._recognizer()
+        recognizer.AcceptWaveform(pcm)
+        return json.loads(recognizer.FinalResult()).get('text', '')
+
+    def stream(self):
+        return _VoskStream(self)
+
+
+class _VoskStream(RecognitionStream):
+
+    def __init__(self, backend):
+        super().__init__(backend)
+        self._recognizer = backend._recognizer()
+        self._final_parts = []
+        self._audio_bytes = 0
+        # Time spent inside the engine, not the time the user spent speaking
+        self._busy = 0.0
+
+    def accept(self, pcm):
+        start = time.perf_counter()
+        self._audio_bytes += len(pcm)
+        if self._recognizer.AcceptWaveform(pcm):
+            # Vosk closed a segment at a pause
+            self._final_parts.append(json.loads(self._recognizer.Result()).get('text', ''))
+            current = ''
+        else:
+            current = json.loads(self._recognizer.PartialResult()).get('partial', '')
+        self.partial = ' '.join(part for part in self._final_parts + [current] if part)
+        self._busy += time.perf_counter() - start
+        return self.partial
+
+    def finish(self):
+        start = time.perf_counter()
+        self._final_parts.append(json.loads(self._recognizer.FinalResult()).get('text', ''))
+        text = ' '.join(part for part in self._final_parts if part)
+        latency = self._busy + time.perf_counter() - start
+        if not text:
+            SPEECH_METRICS.record(self.backend.name, latency=latency, calls=1, no_speech=1)
+            raise sr.UnknownValueError()
+        SPEECH_METRICS.record(self.backend.name, latency=latency, calls=1,
+                              audio_ms=round(self._audio_bytes / BYTES_PER_SECOND * 1000))
+        return text
+
+
+class WhisperBackend(RecognizerBackend):
+    name = 'whisper'
+
+    def __init__(self):
+        self._model = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._model is None:
+            try:
+                from faster_whisper import WhisperModel
+            except ImportError as e:
+                raise sr.RequestError("The whisper backend needs faster-whisper (pip install faster-whisper)") from e
+            self._model = WhisperModel(WHISPER_MODEL, device='cpu', compute_type=WHISPER_COMPUTE_TYPE)
+        return self._model
+
+    def recognize(self, pcm):
+        audio = np.frombuffer(pcm, dtype='<i2').astype(np.float32) / 32768.0
+        model = self.load()
+        # One model instance; CTranslate2 parallelizes each call internally
+        with self._lock:
+            segments, _ = model.transcribe(audio, language=SPEECH_LANGUAGE.split('-')[0], beam_size=1)
+            return ' '.join(segment.text.strip() for segment in segments).strip()
+
+    def stream(self):
+        return _RetranscribingStream(self)
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (GoogleBackend, StubBackend, VoskBackend, WhisperBackend)
+}
+
+_recognizers = {}
+_recognizers_lock = threading.Lock()
+
+
+def get_recognizer(name=None):
+    """Return the shared backend instance for ``name`` (SPEECH_BACKEND by default)."""
+    name = name or SPEECH_BACKEND
+    with _recognizers_lock:
+        recognizer = _recognizers.get(name)
+        if recognizer is None:
+            if name not in BACKENDS:
+                raise ValueError(f"Unknown speech backend: {name}")
+            recognizer = _recognizers[name] = BACKENDS[name]()
+    return recognizer
+
+
+def prewarm(name=None):
+    """Load the configured engine now rather than on the first request."""
+    recognizer = get_recognizer(name)
+    start = time.perf_counter()
+    try:
+        recognizer.load()
+    except sr.RequestError as e:
+        logger.error(f"Could not load speech backend {recognizer.name}: {str(e)}")
+        return
+    logger.info(f"Speech backend {recognizer.name} ready in {time.perf_counter() - start:.2f}s")
+
+
+def transcribe(pcm):
+    """Recognize a whole 16 kHz mono PCM clip with the configured backend."""
+    text = get_recognizer().transcribe(pcm)
+    logger.info(f"Recognized text: {text}")
+    return text
+
+
+def transcribe_utterances(utterances):
+    """Recognize the utterances of one recording, concurrently, and join their texts in order."""
+    if len(utterances) == 1:
+        return transcribe(utterances[0])
+    recognizer = get_recognizer()
+
+    def attempt(pcm):
+        try:
+            return recognizer.transcribe(pcm)
+        except sr.UnknownValueError:
+            # A cough or noise burst the VAD kept; the other utterances still count
+            return ''
+
+    text = ' '.join(text for text in _utterance_executor.map(attempt, utterances) if text)
+    if not text:
+        raise sr.UnknownValueError()
+    logger.info(f"Recognized text from {len(utterances)} utterances: {text}")
+    return text
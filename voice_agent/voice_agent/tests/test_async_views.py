@@ -0,0 +1,102 @@
+import asyncio
+import os
+import tempfile
+from unittest import mock
+
+import httpx
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase
+
+from voice_agent import async_views, audio, embeddings
+from voice_agent.caching import QUERY_EMBEDDING_CACHE
+from voice_agent.embedding_cache import EmbeddingCache
+
+
+class FakeEmbedServer:
+    """An /api/embed handler for httpx.MockTransport that answers with ``statuses`` in turn."""
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request)
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status == 'reset':
+            raise httpx.ConnectError("connection reset")
+        if status != 200:
+            return httpx.Response(status, text="busy")
+        return httpx.Response(200, json={'embeddings': [[0.25, 0.5]]})
+
+
+class AsyncQueryEmbeddingTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache = EmbeddingCache(os.path.join(directory.name, 'cache.sqlite3'))
+        for patcher in (mock.patch.object(async_views, 'EMBEDDING_CACHE', cache),
+                        mock.patch('voice_agent.embeddings.random.random', return_value=0.0)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        QUERY_EMBEDDING_CACHE.invalidate()
+        self.addCleanup(QUERY_EMBEDDING_CACHE.invalidate)
+
+    def embed(self, server, query):
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(server)) as client:
+                with mock.patch.object(async_views, 'get_async_client', return_value=client):
+                    return await async_views.aget_query_embedding(query)
+
+        return asyncio.run(run())
+
+    def test_retries_with_backoff_and_caches(self):
+        server = FakeEmbedServer(503)
+        self.assertEqual(self.embed(server, "What is the budget?"), [0.25, 0.5])
+        self.assertEqual(len(server.requests), 2)
+        self.assertEqual(self.embed(server, "  What is  the budget?"), [0.25, 0.5])
+        self.assertEqual(len(server.requests), 2)
+
+    def test_request_matches_the_sync_pipeline(self):
+        server = FakeEmbedServer()
+        self.embed(server, " Pumps ")
+        url, body = embeddings._embed_request(["Pumps"])
+        self.assertEqual(str(server.requests[0].url), url)
+        self.assertEqual(server.requests[0].read(), httpx.Request('POST', url, json=body).read())
+
+
+class AsyncEmbedBatchTests(SimpleTestCase):
+
+    def embed_batch(self, server, **options):
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(server)) as client:
+                return await embeddings.aembed_batch(client, ["pumps"], backoff=0, **options)
+
+        return asyncio.run(run())
+
+    def test_retries_connection_errors(self):
+        server = FakeEmbedServer('reset', 502)
+        self.assertEqual(self.embed_batch(server), [[0.25, 0.5]])
+        self.assertEqual(len(server.requests), 3)
+
+    def test_gives_up_after_max_retries(self):
+        server = FakeEmbedServer(503, 503, 503)
+        with self.assertRaises(embeddings.EmbeddingError):
+            self.embed_batch(server, max_retries=1)
+        self.assertEqual(len(server.requests), 2)
+
+    def test_client_errors_are_not_retried(self):
+        server = FakeEmbedServer(400)
+        with self.assertRaises(httpx.HTTPStatusError):
+            self.embed_batch(server)
+        self.assertEqual(len(server.requests), 1)
+
+
+class AsyncVoiceInputTests(SimpleTestCase):
+
+    def test_missing_ffmpeg(self):
+        upload = SimpleUploadedFile('clip.webm', b'\x1aE\xdf\xa3 not really webm', content_type='audio/webm')
+        with mock.patch.object(audio, 'ffmpeg_pcm_command', return_value=['/nonexistent/ffmpeg']):
+            response = self.client.post('/api/async/voice-input/', {'audio': upload})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json(), {'error': 'Audio conversion service not available'})
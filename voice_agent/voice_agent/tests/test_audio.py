@@ -0,0 +1,91 @@
+import asyncio
+import io
+import wave
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from voice_agent import audio
+from voice_agent.audio import SAMPLE_RATE, AudioConversionError, _wav_to_pcm, adecode_to_pcm, decode_to_pcm
+
+
+def wav_file(samples, rate, width=2):
+    """WAV bytes of float ``samples`` in [-1, 1), shaped (frames,) or (frames, channels)."""
+    samples = np.asarray(samples, dtype='float64')
+    channels = 1 if samples.ndim == 1 else samples.shape[1]
+    if width == 1:
+        frames = (samples * 128 + 128).astype('u1').tobytes()
+    elif width == 3:
+        values = (samples * 2 ** 23).astype('<i4').reshape(-1, 1).view('u1')
+        frames = values[:, :3].tobytes()
+    else:
+        frames = (samples * 2 ** (8 * width - 1)).astype(f'<i{width}').tobytes()
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(width)
+        wav.setframerate(rate)
+        wav.writeframes(frames)
+    return buffer.getvalue()
+
+
+def tone(rate, seconds=0.5, amplitude=0.25):
+    t = np.arange(int(rate * seconds)) / rate
+    return amplitude * np.sin(2 * np.pi * 300 * t)
+
+
+class WavToPcmTests(SimpleTestCase):
+
+    def assertTone(self, pcm, seconds=0.5, amplitude=0.25):
+        samples = np.frombuffer(pcm, dtype='<i2') / 32768
+        self.assertAlmostEqual(len(samples), SAMPLE_RATE * seconds, delta=1)
+        expected = tone(SAMPLE_RATE, seconds, amplitude)[:len(samples)]
+        # Linear interpolation is a few percent off at 8 kHz
+        self.assertLess(np.abs(samples - expected).max(), 0.05)
+
+    def test_target_format_passes_through(self):
+        data = wav_file(tone(SAMPLE_RATE), SAMPLE_RATE)
+        self.assertEqual(_wav_to_pcm(data), data[44:])
+
+    def test_sample_widths(self):
+        for width in (1, 2, 3, 4):
+            with self.subTest(width=width):
+                self.assertTone(_wav_to_pcm(wav_file(tone(SAMPLE_RATE), SAMPLE_RATE, width)))
+
+    def test_resampling(self):
+        for rate in (8000, 22050, 44100, 48000):
+            with self.subTest(rate=rate):
+                self.assertTone(_wav_to_pcm(wav_file(tone(rate), rate)))
+
+    def test_stereo_is_averaged(self):
+        left = tone(44100, amplitude=0.5)
+        self.assertTone(_wav_to_pcm(wav_file(np.stack([left, np.zeros_like(left)], axis=1), 44100)))
+
+    def test_unsupported_input_needs_ffmpeg(self):
+        self.assertIsNone(_wav_to_pcm(b'RIFF....WAVEnot a wav file'))
+        self.assertIsNone(_wav_to_pcm(wav_file(np.zeros((100, 4)), SAMPLE_RATE)))
+
+    def test_decode_to_pcm_handles_wav_in_process(self):
+        self.assertTone(decode_to_pcm(wav_file(tone(48000), 48000)))
+
+
+class AsyncDecodeTests(SimpleTestCase):
+
+    def decode(self, data, command):
+        with mock.patch.object(audio, 'ffmpeg_pcm_command', return_value=command):
+            return asyncio.run(adecode_to_pcm(data))
+
+    def test_wav_is_converted_in_process(self):
+        data = wav_file(tone(SAMPLE_RATE), SAMPLE_RATE)
+        self.assertEqual(self.decode(data, ['/nonexistent/ffmpeg']), decode_to_pcm(data))
+
+    def test_other_formats_are_piped_through_a_subprocess(self):
+        # cat stands in for ffmpeg: the upload comes back on stdout
+        self.assertEqual(self.decode(b'OggS encoded audio', ['cat']), b'OggS encoded audio')
+
+    def test_ffmpeg_errors(self):
+        with self.assertRaisesMessage(AudioConversionError, 'Invalid data'):
+            self.decode(b'OggS', ['sh', '-c', 'cat >/dev/null; echo Invalid data >&2; exit 1'])
+        with self.assertRaises(FileNotFoundError):
+            self.decode(b'OggS', ['/nonexistent/ffmpeg'])
@@ -0,0 +1,73 @@
+import tempfile
+import time
+from unittest import mock
+
+import faiss
+import numpy as np
+from django.test import SimpleTestCase
+
+from voice_agent import documents, embeddings
+from voice_agent.caching import QUERY_EMBEDDING_CACHE, SEARCH_RESULT_CACHE, TTLCache
+from voice_agent.index_store import IndexStore
+
+CHUNKS = ["Pumps need oil.", "Valves leak.", "Turbines spin."]
+VECTORS = np.eye(3, dtype='float32')
+
+
+class TTLCacheTests(SimpleTestCase):
+
+    def test_least_recently_used_entry_is_dropped(self):
+        cache = TTLCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+    def test_entries_expire(self):
+        cache = TTLCache(ttl=60)
+        cache.set('a', 1)
+        with mock.patch('voice_agent.caching.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_invalidate_by_key(self):
+        cache = TTLCache()
+        cache.set((1, 'q'), 'one')
+        cache.set((2, 'q'), 'two')
+        cache.invalidate(lambda key: key[0] == 1)
+        self.assertEqual((cache.get((1, 'q')), cache.get((2, 'q'))), (None, 'two'))
+        self.assertEqual(cache.stats()['hit_rate'], 0.5)
+
+
+class QueryCachingTests(SimpleTestCase):
+
+    def setUp(self):
+        for cache in (QUERY_EMBEDDING_CACHE, SEARCH_RESULT_CACHE):
+            cache.invalidate()
+            self.addCleanup(cache.invalidate)
+
+    def test_query_embedding_is_fetched_once_per_normalized_query(self):
+        with mock.patch.object(embeddings, 'get_embedding_ollama', return_value=[1.0, 0.0]) as fetch:
+            embeddings.get_query_embedding("Which pump?")
+            embeddings.get_query_embedding("  Which   pump? ")
+        fetch.assert_called_once_with("Which pump?")
+
+    def test_search_hits_are_memoized_until_reindexed(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = IndexStore(directory.name)
+        index = faiss.IndexFlatL2(3)
+        index.add(VECTORS)
+        version = store.save(7, index, CHUNKS, VECTORS).version
+        with mock.patch.object(documents, 'get_query_embedding', return_value=[0.0, 1.0, 0.0]) as embed:
+            self.assertEqual(documents.search_faiss("leaks", index, CHUNKS, top_k=1, document_id=7, version=version),
+                             ["Valves leak."])
+            self.assertEqual(documents.search_faiss("leaks ", index, CHUNKS, top_k=1, document_id=7, version=version),
+                             ["Valves leak."])
+            self.assertEqual(embed.call_count, 1)
+            # Saving the document again drops its memoized hits
+            store.save(7, index, CHUNKS, VECTORS)
+            self.assertIsNone(SEARCH_RESULT_CACHE.get((7, version, "leaks", 1)))
+            documents.search_faiss("leaks", index, CHUNKS, top_k=1, document_id=7, version=version)
+            self.assertEqual(embed.call_count, 2)
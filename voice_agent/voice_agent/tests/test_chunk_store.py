@@ -0,0 +1,38 @@
+import tempfile
+
+from django.test import SimpleTestCase
+
+from voice_agent.chunk_store import ChunkStore
+
+TEXTS = ["Pumps need oil.", "Überdruckventil öffnen", "", "涡轮机 spins 🚀"]
+
+
+class ChunkStoreTests(SimpleTestCase):
+
+    def write(self, store):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store.write_blob(f'{directory.name}/chunks.bin')
+        store.write_offsets(f'{directory.name}/chunk_offsets.npy')
+        return ChunkStore.open(directory.name)
+
+    def test_round_trip_through_memory_mapped_files(self):
+        store = self.write(ChunkStore.from_texts(TEXTS))
+        self.assertEqual(list(store), TEXTS)
+        self.assertEqual(len(store), 4)
+        self.assertEqual(store.nbytes, sum(len(text.encode('utf-8')) for text in TEXTS))
+
+    def test_indexing(self):
+        store = self.write(ChunkStore.from_texts(TEXTS))
+        self.assertEqual(store[-1], TEXTS[-1])
+        self.assertEqual(store[1:3], TEXTS[1:3])
+        self.assertEqual(bytes(store.raw(1)), TEXTS[1].encode('utf-8'))
+        with self.assertRaises(IndexError):
+            store[4]
+
+    def test_empty_store(self):
+        store = self.write(ChunkStore.from_texts([]))
+        self.assertEqual(len(store), 0)
+        self.assertEqual(list(store), [])
+        store = self.write(ChunkStore.from_texts([""]))
+        self.assertEqual(list(store), [""])
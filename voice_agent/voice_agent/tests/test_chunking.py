@@ -0,0 +1,69 @@
+from django.test import SimpleTestCase
+
+from voice_agent.chunking import _iter_units, iter_chunks, strategy_for
+
+
+class IterUnitsTests(SimpleTestCase):
+
+    def test_sentence_is_carried_across_pages(self):
+        pages = ["First sentence here. Second one is here.\nThird goes on", "and ends here. Fourth.\n"]
+        self.assertEqual(list(_iter_units(pages)), [
+            ('sentence', "First sentence here."),
+            ('sentence', "Second one is here."),
+            ('sentence', "Third goes on and ends here."),
+            ('sentence', "Fourth."),
+        ])
+
+    def test_blank_line_at_end_of_page_ends_the_paragraph(self):
+        for pages in (["Key findings\n\n", "Revenue grew.\n"],
+                      ["Key findings\n", "\n", "Revenue grew.\n"],
+                      ["Key findings\n\n \n", "Revenue grew.\n"]):
+            with self.subTest(pages=pages):
+                self.assertEqual(list(_iter_units(pages)),
+                                 [('sentence', "Key findings"), ('sentence', "Revenue grew.")])
+
+    def test_headings(self):
+        self.assertEqual(list(_iter_units(["# Intro\nAlpha one.\n## Details ##\nGamma.\n"])), [
+            ('heading', "Intro"),
+            ('sentence', "Alpha one."),
+            ('heading', "Details"),
+            ('sentence', "Gamma."),
+        ])
+
+
+class IterChunksTests(SimpleTestCase):
+    PAGES = ["First sentence here. Second one is here.\nThird goes on", "and ends here. Fourth.\n"]
+
+    def test_sentences_are_packed_without_overlap(self):
+        self.assertEqual(list(iter_chunks(self.PAGES, chunk_size=14, overlap=0)),
+                         ["First sentence here. Second one is here.", "Third goes on and ends here. Fourth."])
+
+    def test_overlap_repeats_trailing_sentences(self):
+        self.assertEqual(list(iter_chunks(self.PAGES, chunk_size=14, overlap=6)), [
+            "First sentence here. Second one is here.",
+            "Second one is here. Third goes on and ends here.",
+            "Fourth.",
+        ])
+
+    def test_heading_strategy_starts_and_labels_sections(self):
+        pages = ["# Intro\nAlpha one. Beta two.\n## Details\nGamma three.\n"]
+        self.assertEqual(list(iter_chunks(pages, strategy='heading', chunk_size=6, overlap=0)),
+                         ["Intro\nAlpha one.", "Intro\nBeta two.", "Details\nGamma three."])
+
+    def test_token_windows(self):
+        chunks = list(iter_chunks(["a b c d e f g h i j"], strategy='token', chunk_size=4, overlap=1))
+        self.assertEqual(chunks, ["a b c d", "d e f g", "g h i j"])
+
+    def test_oversized_sentence_is_split(self):
+        chunks = list(iter_chunks(["word " * 20], chunk_size=5, overlap=0))
+        self.assertEqual(chunks, ["word word word word word"] * 4)
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            list(iter_chunks(self.PAGES, strategy='paragraph'))
+
+    def test_strategy_for(self):
+        self.assertEqual(strategy_for('report.DOCX', 'auto'), 'heading')
+        self.assertEqual(strategy_for('notes.md', 'auto'), 'heading')
+        self.assertEqual(strategy_for('report.pdf', 'auto'), 'sentence')
+        self.assertEqual(strategy_for('report.pdf', 'token'), 'token')
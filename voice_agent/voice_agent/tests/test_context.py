@@ -0,0 +1,35 @@
+from django.test import SimpleTestCase
+
+from voice_agent.context import count_tokens, iter_sentences, pack_context
+
+
+class CountTokensTests(SimpleTestCase):
+
+    def test_words_and_punctuation(self):
+        self.assertEqual(count_tokens("Hello, world!"), 6)
+        self.assertEqual(count_tokens(""), 0)
+
+
+class IterSentencesTests(SimpleTestCase):
+
+    def test_abbreviations_do_not_end_sentences(self):
+        self.assertEqual(list(iter_sentences("Dr. Smith arrived. He left e.g. early. Done")),
+                         ["Dr. Smith arrived.", "He left e.g. early.", "Done"])
+
+
+class PackContextTests(SimpleTestCase):
+    CHUNKS = ["Revenue grew by 4%. Costs fell.", "Costs fell. Margins improved."]
+
+    def test_skips_sentences_already_packed(self):
+        self.assertEqual(pack_context(self.CHUNKS, 100), "Revenue grew by 4%. Costs fell.\n\nMargins improved.")
+
+    def test_cuts_at_a_sentence_boundary(self):
+        packed = pack_context(self.CHUNKS, 9)
+        self.assertEqual(packed, "Revenue grew by 4%.")
+        self.assertLessEqual(count_tokens(packed), 9)
+
+    def test_clips_a_first_sentence_over_budget(self):
+        self.assertEqual(pack_context(["word " * 50], 5), "word word word word word")
+
+    def test_no_chunks(self):
+        self.assertEqual(pack_context([], 5), "")
@@ -0,0 +1,95 @@
+import json
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from voice_agent import discussion
+from voice_agent.discussion import DiscussionOrchestrator
+
+
+def parse_events(stream):
+    events = []
+    for block in ''.join(stream).strip().split('\n\n'):
+        event, data = block.split('\n', 1)
+        events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+class DiscussionViewTests(SimpleTestCase):
+
+    def post(self, **data):
+        body = {'document_id': 1, 'message': "Hello", **data}
+        return self.client.post('/api/discussion/', json.dumps(body), content_type='application/json')
+
+    def test_rejects_malformed_input(self):
+        for data in ({'agents': [{'model': 'critical'}]},
+                     {'agents': [{'id': 'two'}]},
+                     {'agents': ['1']},
+                     {'agents': {'id': 1}},
+                     {'discussion_limit': 'lots'}):
+            with self.subTest(data=data):
+                response = self.post(**data)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+    def test_rejects_missing_message(self):
+        self.assertEqual(self.post(message='').status_code, 400)
+
+
+class DiscussionOrchestratorTests(SimpleTestCase):
+
+    def test_options(self):
+        orchestrator = DiscussionOrchestrator({'agents': [{'id': '2', 'model': 'creative'}, {'id': 1}],
+                                               'discussion_limit': '40'})
+        self.assertEqual(orchestrator.agent_models, {2: 'creative', 1: 'critical'})
+        self.assertEqual(orchestrator.limit, discussion.DISCUSSION_MAX_LIMIT)
+
+    def run_discussion(self, route, run_turn, **data):
+        orchestrator = DiscussionOrchestrator({'document_id': 1, 'message': "Go", **data})
+        with mock.patch.object(discussion, 'route_discussion', return_value=route), \
+                mock.patch.object(discussion, 'run_turn', side_effect=run_turn):
+            return parse_events(orchestrator.events())
+
+    def test_independent_turns_stream_as_done_but_record_in_order(self):
+        agent_1_may_finish = threading.Event()
+
+        def run_turn(request):
+            if request['agent_id'] == 1:
+                agent_1_may_finish.wait(5)
+            else:
+                agent_1_may_finish.set()
+            return {'response': f"answer {request['agent_id']}"}
+
+        route = {'discussion_required': False, 'initiator_agent_id': 1, 'responding_agent_ids': [1, 2],
+                 'revised_prompt': {'1': "Summarize", '2': "Critique"}}
+        events = self.run_discussion(route, run_turn)
+        self.assertEqual([(name, data.get('agent_id')) for name, data in events],
+                         [('route', None), ('turn', 2), ('turn', 1), ('done', None)])
+        self.assertEqual(events[-1][1]['discussion_history'], ["User: Go", "Agent 1: answer 1", "Agent 2: answer 2"])
+
+    def test_discussion_turns_alternate_and_end_with_a_summary(self):
+        requests = []
+
+        def run_turn(request):
+            requests.append(request)
+            return {'response': f"turn {len(requests)}"}
+
+        route = {'discussion_required': True, 'initiator_agent_id': 2, 'responding_agent_ids': [2, 1],
+                 'revised_prompt': "Debate the budget"}
+        events = self.run_discussion(route, run_turn, discussion_limit=4)
+        turns = [data for name, data in events if name == 'turn']
+        self.assertEqual([turn['agent_id'] for turn in turns], [2, 1, 2, 2])
+        self.assertTrue(turns[-1]['is_final_summary'])
+        self.assertEqual(requests[0]['message'], "Debate the budget")
+        # Each turn sees the ones before it
+        self.assertIn("Agent 2: turn 1", requests[1]['message'])
+
+    def test_turn_error_ends_the_stream(self):
+        def run_turn(request):
+            raise discussion.TurnError({'error': "Document not found"}, status=404)
+
+        route = {'discussion_required': False, 'initiator_agent_id': 1, 'responding_agent_ids': [1],
+                 'revised_prompt': "Hi"}
+        events = self.run_discussion(route, run_turn)
+        self.assertEqual(events[-1], ('error', {'error': "Document not found", 'status': 404}))
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from voice_agent.embedding_cache import EmbeddingCache
+
+
+class EmbeddingCacheTests(SimpleTestCase):
+
+    def cache(self, **options):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return EmbeddingCache(os.path.join(directory.name, 'cache.sqlite3'), **options)
+
+    def statements(self, cache):
+        """Record the SQL run on this thread's connection to ``cache``."""
+        statements = []
+        cache._connection().set_trace_callback(statements.append)
+        return statements
+
+    def test_round_trip_by_content_and_model(self):
+        cache = self.cache()
+        cache.put_many(["pumps", "valves"], [[0.5, 1.0], [2.0, -1.0]], 'nomic')
+        self.assertEqual(cache.get_many(["valves", "turbines", "pumps"], 'nomic'), {0: [2.0, -1.0], 2: [0.5, 1.0]})
+        self.assertEqual(cache.get_many(["pumps"], 'other-model'), {})
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def test_hits_only_touch_old_entries(self):
+        cache = self.cache(touch_interval=3600)
+        cache.put_many(["pumps"], [[1.0]], 'nomic')
+        statements = self.statements(cache)
+        cache.get_many(["pumps"], 'nomic')
+        self.assertFalse([sql for sql in statements if sql.startswith('UPDATE')])
+        cache._connection().execute('UPDATE embeddings SET last_used = ?', (time.time() - 7200,))
+        cache.get_many(["pumps"], 'nomic')
+        self.assertEqual(len([sql for sql in statements if sql.startswith('UPDATE embeddings SET last_used')]), 2)
+
+    def test_rows_are_not_counted_on_every_insert(self):
+        cache = self.cache(max_entries=1000)
+        statements = self.statements(cache)
+        for number in range(50):
+            cache.put_many([f"text {number}"], [[float(number)]], 'nomic')
+        # Once at the first insert, then every tenth of the cap
+        self.assertEqual(len([sql for sql in statements if 'COUNT(*)' in sql]), 1 + 50 // 100)
+
+    def test_evicts_least_recently_used(self):
+        cache = self.cache(max_entries=100)
+        for number in range(120):
+            cache.put_many([f"text {number}"], [[float(number)]], 'nomic')
+            # Stamp the new row with its insertion order, so older texts are less recently used
+            cache._connection().execute('UPDATE embeddings SET last_used = ? WHERE last_used > ?',
+                                        (number, number))
+        entries = cache.stats()['entries']
+        self.assertLessEqual(entries, 100)
+        self.assertGreater(cache.evictions, 0)
+        self.assertEqual(cache.get_many(["text 0"], 'nomic'), {})
+        self.assertEqual(cache.get_many(["text 119"], 'nomic'), {0: [119.0]})
@@ -0,0 +1,125 @@
+import asyncio
+import os
+import tempfile
+from unittest import mock
+
+import httpx
+import numpy as np
+import requests
+from django.test import SimpleTestCase
+
+from voice_agent import embeddings
+from voice_agent.embedding_cache import EmbeddingCache
+from voice_agent.embeddings import EmbeddingError, EmbeddingPipeline
+
+
+def vector(text):
+    return [float(len(text)), float(ord(text[0]))]
+
+
+class FakeOllama:
+    """Stands in for the shared requests session; ``failures`` are returned before answering."""
+
+    def __init__(self, failures=(), legacy=False):
+        self.failures = list(failures)
+        self.legacy = legacy
+        self.requests = []
+
+    def response(self, status_code, body=None):
+        response = mock.Mock(status_code=status_code, text=str(body))
+        response.json.return_value = body
+        response.raise_for_status.side_effect = (
+            requests.HTTPError(str(status_code)) if status_code >= 400 else None)
+        return response
+
+    def post(self, url, json=None, timeout=None):
+        self.requests.append((url.rsplit('/', 1)[-1], json))
+        if self.failures:
+            failure = self.failures.pop(0)
+            if isinstance(failure, Exception):
+                raise failure
+            return self.response(failure, "busy")
+        if url.endswith('/embed'):
+            if self.legacy:
+                return self.response(404, "404 page not found")
+            return self.response(200, {'embeddings': [vector(text) for text in json['input']]})
+        return self.response(200, {'embedding': vector(json['prompt'])})
+
+
+class EmbeddingPipelineTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(embeddings, '_use_legacy_endpoint', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def pipeline(self, server, cache=None, **options):
+        return EmbeddingPipeline(batch_size=2, concurrency=2, backoff=0, session=server, cache=cache, **options)
+
+    def test_results_keep_input_order(self):
+        server = FakeOllama()
+        chunks = ["alpha", "be", "gamma ray", "d", "epsilon"]
+        matrix = self.pipeline(server).run(chunks)
+        self.assertEqual(matrix.dtype, np.float32)
+        np.testing.assert_array_equal(matrix, [vector(chunk) for chunk in chunks])
+        self.assertEqual([name for name, body in server.requests], ['embed'] * 3)
+
+    def test_cached_and_repeated_chunks_are_not_sent(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache = EmbeddingCache(os.path.join(directory.name, 'cache.sqlite3'))
+        cache.put_many(["alpha"], [vector("alpha")], embeddings.EMBEDDING_MODEL)
+        server = FakeOllama()
+        pipeline = self.pipeline(server, cache=cache)
+        matrix = pipeline.run(["alpha", "beta", "beta", "gamma"])
+        np.testing.assert_array_equal(matrix[2], vector("beta"))
+        self.assertEqual([body['input'] for name, body in server.requests], [["beta", "gamma"]])
+        self.assertEqual((pipeline.stats.chunks, pipeline.stats.cached), (4, 1))
+        self.assertEqual(cache.get_many(["gamma"], embeddings.EMBEDDING_MODEL), {0: vector("gamma")})
+
+    def test_failed_batches_are_retried_on_their_own(self):
+        server = FakeOllama(failures=[503, requests.ConnectionError("reset")])
+        pipeline = self.pipeline(server)
+        pipeline.run(["alpha", "beta"])
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(pipeline.stats.retries, 2)
+
+    def test_gives_up_after_max_retries(self):
+        server = FakeOllama(failures=[503, 503])
+        with self.assertRaises(EmbeddingError):
+            self.pipeline(server, max_retries=1).run(["alpha"])
+
+    def test_falls_back_to_the_legacy_endpoint(self):
+        server = FakeOllama(legacy=True)
+        matrix = self.pipeline(server).run(["alpha", "beta"])
+        np.testing.assert_array_equal(matrix, [vector("alpha"), vector("beta")])
+        self.assertEqual(server.requests, [('embed', {'model': embeddings.EMBEDDING_MODEL, 'input': ["alpha", "beta"]}),
+                                           ('embeddings', {'model': embeddings.EMBEDDING_MODEL, 'prompt': "alpha"}),
+                                           ('embeddings', {'model': embeddings.EMBEDDING_MODEL, 'prompt': "beta"})])
+        self.assertTrue(embeddings._use_legacy_endpoint)
+        # Later batches go straight to the endpoint that works
+        self.pipeline(server).run(["gamma"])
+        self.assertEqual(server.requests[-1][0], 'embeddings')
+        self.assertEqual(len(server.requests), 4)
+
+    def test_missing_model_does_not_switch_endpoints(self):
+        server = FakeOllama(failures=[404, 404])
+        with self.assertRaises(requests.HTTPError):
+            self.pipeline(server).run(["alpha"])
+        self.assertFalse(embeddings._use_legacy_endpoint)
+
+
+class AsyncLegacyFallbackTests(SimpleTestCase):
+
+    def test_falls_back_to_the_legacy_endpoint(self):
+        def handler(request):
+            if request.url.path == '/api/embed':
+                return httpx.Response(404, text="404 page not found")
+            return httpx.Response(200, json={'embedding': [1.0, 2.0]})
+
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                return await embeddings.aembed_batch(client, ["alpha", "beta"], api_url='http://ollama.test/api')
+
+        with mock.patch.object(embeddings, '_use_legacy_endpoint', False):
+            self.assertEqual(asyncio.run(run()), [[1.0, 2.0], [1.0, 2.0]])
@@ -0,0 +1,85 @@
+import os
+import tempfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from voice_agent import extraction
+from voice_agent.extraction import iter_document_pages, sniff_encoding
+from voice_agent.management.commands.benchmark_extraction import write_docx, write_pdf
+
+
+class BrokenPool:
+    def submit(self, *args):
+        future = Future()
+        future.set_exception(BrokenProcessPool("worker died"))
+        return future
+
+
+class ExtractionTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def small_pool_ranges(self):
+        for name, value in (('PDF_PARALLEL_MIN_PAGES', 2), ('PDF_PAGES_PER_TASK', 2)):
+            patcher = mock.patch.object(extraction, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_pdf_pages_from_the_pool_match_in_process_extraction(self):
+        self.small_pool_ranges()
+        self.addCleanup(extraction._reset_pdf_pool)
+        write_pdf(self.path('report.pdf'), pages=7, lines_per_page=5)
+        serial = list(iter_document_pages(self.path('report.pdf'), pdf_workers=1))
+        self.assertEqual(len(serial), 7)
+        self.assertTrue(all(page.strip() for page in serial))
+        self.assertEqual(list(iter_document_pages(self.path('report.pdf'), pdf_workers=2)), serial)
+
+    def test_broken_pool_falls_back_to_in_process_extraction(self):
+        self.small_pool_ranges()
+        write_pdf(self.path('report.pdf'), pages=5, lines_per_page=5)
+        serial = list(iter_document_pages(self.path('report.pdf'), pdf_workers=1))
+        with mock.patch.object(extraction, '_get_pdf_pool', return_value=BrokenPool()), \
+                mock.patch.object(extraction, '_reset_pdf_pool') as reset:
+            self.assertEqual(list(iter_document_pages(self.path('report.pdf'), pdf_workers=2)), serial)
+        reset.assert_called_once_with()
+
+    def test_docx_headings_become_markdown(self):
+        write_docx(self.path('notes.docx'), pages=2, paragraphs_per_page=2)
+        pages = list(iter_document_pages(self.path('notes.docx')))
+        self.assertEqual(pages[0], "## Section 1\n")
+        self.assertTrue(pages[1].endswith("\n\n"))
+        self.assertIn("## Section 2\n", pages)
+
+    def test_text_blocks_end_on_line_boundaries(self):
+        text = ''.join(f"Line {number} about pumps and valves.\n" for number in range(200))
+        with open(self.path('notes.txt'), 'w', encoding='utf-8') as f:
+            f.write(text)
+        with mock.patch.object(extraction, 'TEXT_BLOCK_SIZE', 100):
+            blocks = list(iter_document_pages(self.path('notes.txt')))
+        self.assertGreater(len(blocks), 10)
+        self.assertTrue(all(block.endswith("\n") for block in blocks))
+        self.assertEqual(''.join(blocks), text)
+
+    def test_legacy_encoding_is_sniffed_from_a_prefix(self):
+        text = "Le café du matin est prêt à servir, très chaud et très fort.\n" * 50
+        with open(self.path('notes.txt'), 'w', encoding='cp1252') as f:
+            f.write(text)
+        with mock.patch.object(extraction, 'ENCODING_SNIFF_BYTES', 512), \
+                mock.patch.object(extraction.chardet, 'detect', wraps=extraction.chardet.detect) as detect:
+            self.assertEqual(''.join(iter_document_pages(self.path('notes.txt'))), text)
+        self.assertEqual(len(detect.call_args.args[0]), 512)
+
+    def test_sniff_encoding(self):
+        self.assertEqual(sniff_encoding(b'\xef\xbb\xbfHello'), 'utf-8-sig')
+        self.assertEqual(sniff_encoding(b'\xff\xfeH\x00'), 'utf-16')
+        # A multi-byte character cut off by the prefix is still UTF-8
+        self.assertEqual(sniff_encoding("Straße".encode('utf-8')[:-3]), 'utf-8')
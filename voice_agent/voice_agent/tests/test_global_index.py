@@ -0,0 +1,69 @@
+import tempfile
+from unittest import mock
+
+import faiss
+import numpy as np
+from django.test import SimpleTestCase
+
+from voice_agent import vector_index
+from voice_agent.global_index import GlobalVectorIndex, split_vector_id, vector_id
+
+
+def vectors(count, seed):
+    return np.random.default_rng(seed).random((count, 8), dtype='float32')
+
+
+class GlobalVectorIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        patcher = mock.patch.object(vector_index, 'ANN_FLAT_MAX_VECTORS', 100)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_vector_ids_round_trip(self):
+        self.assertEqual(split_vector_id(vector_id(42, 7)), (42, 7))
+
+    def test_search_restricted_to_documents(self):
+        index = GlobalVectorIndex(self.root, shard_count=2)
+        first, second, third = vectors(10, 1), vectors(10, 2), vectors(10, 3)
+        index.add_document(1, first)
+        index.add_document(2, second)
+        index.add_document(3, third)
+        self.assertEqual(index.search(second[4], top_k=1), [(0.0, 2, 4)])
+        hits = index.search(second[4], top_k=3, document_ids=[1, 3])
+        self.assertEqual(len(hits), 3)
+        self.assertTrue(all(document_id in (1, 3) for distance, document_id, ordinal in hits))
+        self.assertEqual(index.remove_document(2), 10)
+        self.assertNotIn(2, [document_id for distance, document_id, ordinal in index.search(second[4], top_k=30)])
+
+    def test_other_workers_see_saved_shards(self):
+        GlobalVectorIndex(self.root, shard_count=1).add_document(5, vectors(10, 1))
+        self.assertEqual(GlobalVectorIndex(self.root, shard_count=1).stats()['vectors'], 10)
+
+    def test_flat_shard_becomes_ivf_and_is_retrained_as_it_grows(self):
+        index = GlobalVectorIndex(self.root, shard_count=1)
+        index.add_document(1, vectors(200, 1))
+        ivf = faiss.try_extract_index_ivf(index._get_shard(0))
+        self.assertIsNotNone(ivf)
+        trained_nlist = ivf.nlist
+        # Still within GLOBAL_INDEX_RETRAIN_GROWTH times the training size: centroids are kept
+        index.add_document(2, vectors(300, 2))
+        self.assertEqual(faiss.try_extract_index_ivf(index._get_shard(0)).nlist, trained_nlist)
+        index.add_document(3, vectors(400, 3))
+        shard = index._get_shard(0)
+        self.assertEqual(shard.ntotal, 900)
+        self.assertEqual(faiss.try_extract_index_ivf(shard).nlist, vector_index.ivf_nlist(900))
+        self.assertGreater(vector_index.ivf_nlist(900), trained_nlist)
+        # The rebuilt shard kept every vector under its global id
+        second = vectors(300, 2)
+        self.assertEqual(index.search(second[17], top_k=1, document_ids=[2]), [(0.0, 2, 17)])
+        self.assertEqual(index.remove_document(1), 200)
+
+    def test_training_size_inverts_nlist(self):
+        for n_vectors in (200, 5_000, 30_000, 400_000):
+            nlist = vector_index.ivf_nlist(n_vectors)
+            self.assertEqual(vector_index.ivf_nlist(vector_index.ivf_training_size(nlist)), nlist)
+            self.assertLessEqual(vector_index.ivf_training_size(nlist), n_vectors)
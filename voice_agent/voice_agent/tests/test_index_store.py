@@ -0,0 +1,70 @@
+import os
+import tempfile
+
+import faiss
+import numpy as np
+from django.test import SimpleTestCase
+
+from voice_agent.index_store import EMBEDDING_STORAGE_DTYPE, META_FILENAME, IndexStore
+
+
+class IndexStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.store = IndexStore(self.root, max_documents=2)
+
+    def save(self, store, document_id, chunks=("Pumps need oil.", "Valves leak.")):
+        embeddings = np.random.default_rng(document_id).standard_normal((len(chunks), 8)).astype('float32')
+        index = faiss.IndexFlatL2(8)
+        index.add(embeddings)
+        return store.save(document_id, index, list(chunks), embeddings)
+
+    def test_round_trip_from_disk(self):
+        saved = self.save(self.store, 1)
+        loaded = IndexStore(self.root).get(1)
+        self.assertEqual(list(loaded.chunks), ["Pumps need oil.", "Valves leak."])
+        self.assertEqual(loaded.index.ntotal, 2)
+        np.testing.assert_array_equal(loaded.embeddings, saved.embeddings)
+        self.assertEqual(loaded.lexical.search("valves")[0][0], 1)
+        self.assertEqual(loaded.metadata['chunk_count'], 2)
+
+    def test_embeddings_are_one_compact_memory_mapped_matrix(self):
+        saved = self.save(self.store, 1, chunks=("a", "b", "c"))
+        loaded = IndexStore(self.root).get(1)
+        self.assertIsInstance(loaded.embeddings, np.memmap)
+        self.assertEqual(loaded.embeddings.dtype, np.dtype(EMBEDDING_STORAGE_DTYPE))
+        self.assertEqual(loaded.embeddings.shape, (3, 8))
+        self.assertFalse(loaded.embeddings.flags.writeable)
+        np.testing.assert_allclose(loaded.embeddings, saved.embeddings)
+        # The FAISS index keeps full precision
+        np.testing.assert_allclose(loaded.index.reconstruct_n(0, 3), saved.embeddings, rtol=1e-3)
+
+    def test_lru_keeps_max_documents_in_memory(self):
+        for document_id in (1, 2, 3):
+            self.save(self.store, document_id)
+        self.assertEqual(list(self.store._cache), [2, 3])
+        # Evicted documents are reloaded from disk
+        self.assertIsNotNone(self.store.get(1))
+        self.assertEqual(list(self.store._cache), [3, 1])
+
+    def test_get_reloads_after_another_worker_reindexes(self):
+        self.save(self.store, 1)
+        other_worker = IndexStore(self.root)
+        self.assertEqual(len(other_worker.get(1).chunks), 2)
+        self.save(self.store, 1, chunks=("Only one chunk now.",))
+        self.assertEqual(list(other_worker.get(1).chunks), ["Only one chunk now."])
+
+    def test_incomplete_write_is_ignored(self):
+        self.save(self.store, 1)
+        os.unlink(os.path.join(self.root, '1', META_FILENAME))
+        self.assertNotIn(1, self.store)
+        self.assertIsNone(self.store.get(1))
+
+    def test_delete(self):
+        self.save(self.store, 1)
+        self.store.delete(1)
+        self.assertNotIn(1, self.store)
+        self.assertFalse(os.path.exists(os.path.join(self.root, '1')))
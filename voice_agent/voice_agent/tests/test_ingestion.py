@@ -0,0 +1,95 @@
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from voice_agent import ingestion
+from voice_agent.models import Document, IngestionJob
+
+
+def make_job(test, **fields):
+    with override_settings(MEDIA_ROOT=test.media_root):
+        document = Document.objects.create(file=ContentFile(b"Pumps need oil.", name='notes.txt'),
+                                           filename='notes.txt', content_type='text/plain')
+    job = IngestionJob.objects.create(document=document)
+    if fields:
+        IngestionJob.objects.filter(id=job.id).update(**fields)
+        job.refresh_from_db()
+    return job
+
+
+class MediaRootMixin:
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = directory.name
+
+
+class ResumeIfStaleTests(MediaRootMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(ingestion, '_executor')
+        self.executor = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.long_ago = timezone.now() - timedelta(seconds=ingestion.INGESTION_STALE_AFTER + 60)
+
+    def test_stale_job_is_requeued(self):
+        job = make_job(self, stage=IngestionJob.STAGE_EMBEDDING, updated_at=self.long_ago)
+        self.assertTrue(ingestion.resume_if_stale(job))
+        job.refresh_from_db()
+        self.assertEqual((job.stage, job.attempts, job.progress), (IngestionJob.STAGE_QUEUED, 2, 0))
+        self.executor.submit.assert_called_once_with(ingestion._run_ingestion, job.id, job.document_id, 2)
+        # A second worker holding the old row loses the claim
+        self.assertFalse(ingestion.resume_if_stale(IngestionJob(id=job.id, document_id=job.document_id,
+                                                                stage=IngestionJob.STAGE_EMBEDDING,
+                                                                updated_at=self.long_ago, attempts=1)))
+
+    def test_job_fails_after_max_attempts(self):
+        job = make_job(self, stage=IngestionJob.STAGE_CHUNKING, updated_at=self.long_ago,
+                       attempts=ingestion.INGESTION_MAX_ATTEMPTS)
+        self.assertTrue(ingestion.resume_if_stale(job))
+        job.refresh_from_db()
+        self.assertEqual(job.stage, IngestionJob.STAGE_FAILED)
+        self.assertIn("server restart", job.error)
+        self.executor.submit.assert_not_called()
+
+    def test_recent_and_finished_jobs_are_left_alone(self):
+        recent = make_job(self, stage=IngestionJob.STAGE_EMBEDDING)
+        done = make_job(self, stage=IngestionJob.STAGE_DONE, updated_at=self.long_ago)
+        self.assertFalse(ingestion.resume_if_stale(recent))
+        self.assertFalse(ingestion.resume_if_stale(done))
+        self.executor.submit.assert_not_called()
+
+    def test_superseded_run_cannot_update_the_job(self):
+        job = make_job(self, attempts=2)
+        with self.assertRaises(ingestion._Superseded):
+            ingestion._update_job(job.id, 1, progress=50)
+        ingestion._update_job(job.id, 2, progress=50)
+        job.refresh_from_db()
+        self.assertEqual(job.progress, 50)
+
+
+class HeartbeatTests(MediaRootMixin, TransactionTestCase):
+
+    def test_running_job_stays_fresh(self):
+        job = make_job(self, stage=IngestionJob.STAGE_EXTRACTING,
+                       updated_at=timezone.now() - timedelta(seconds=ingestion.INGESTION_STALE_AFTER + 60))
+        with ingestion._Heartbeat(job.id, job.attempts, interval=0.05):
+            time.sleep(0.3)
+        job.refresh_from_db()
+        self.assertFalse(ingestion._is_stale(job))
+
+    def test_heartbeat_of_a_superseded_run_does_nothing(self):
+        stale = timezone.now() - timedelta(seconds=ingestion.INGESTION_STALE_AFTER + 60)
+        job = make_job(self, stage=IngestionJob.STAGE_EXTRACTING, updated_at=stale, attempts=2)
+        with ingestion._Heartbeat(job.id, 1, interval=0.05):
+            time.sleep(0.3)
+        job.refresh_from_db()
+        self.assertTrue(ingestion._is_stale(job))
@@ -0,0 +1,60 @@
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from voice_agent.lexical import MAX_TOKEN_LENGTH, BM25Index, reciprocal_rank_fusion, tokenize
+
+TEXTS = [
+    "The XJ-42 pump failed during the pressure test.",
+    "Quarterly revenue grew while maintenance costs fell.",
+    "Replace the XJ-42 valve and rerun the pressure test on the XJ-42.",
+    "Safety incidents went down after the sensor rollout.",
+]
+
+
+class TokenizeTests(SimpleTestCase):
+
+    def test_keeps_codes_and_drops_stopwords(self):
+        self.assertEqual(tokenize("What is the XJ-42 rated at, v3.5 or api_key?"),
+                         ['xj-42', 'rated', 'v3.5', 'api_key'])
+
+    def test_drops_overlong_tokens(self):
+        digest = 'a' * (MAX_TOKEN_LENGTH + 1)
+        self.assertEqual(tokenize(f"checksum {digest} matches"), ['checksum', 'matches'])
+
+
+class BM25IndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.index = BM25Index.from_texts(TEXTS)
+
+    def test_ranks_by_term_frequency(self):
+        results = self.index.search("XJ-42 pressure")
+        self.assertEqual([chunk_id for chunk_id, _ in results], [2, 0])
+        self.assertGreater(results[0][1], results[1][1])
+
+    def test_top_k_and_no_match(self):
+        self.assertEqual(len(self.index.search("the XJ-42 revenue safety", top_k=2)), 2)
+        self.assertEqual(self.index.search("turbine"), [])
+        self.assertEqual(BM25Index.from_texts([]).search("pump"), [])
+
+    def test_terms_stay_narrow(self):
+        index = BM25Index.from_texts(TEXTS + ['x' * 5000])
+        self.assertLessEqual(index.terms.dtype.itemsize // 4, MAX_TOKEN_LENGTH)
+
+    def test_write_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bm25.npz')
+            self.index.write(path)
+            loaded = BM25Index.load(path)
+        self.assertEqual(loaded.search("maintenance costs"), self.index.search("maintenance costs"))
+
+
+class ReciprocalRankFusionTests(SimpleTestCase):
+
+    def test_items_in_both_rankings_come_first(self):
+        self.assertEqual(reciprocal_rank_fusion([3, 1, 2], [1, 4]), [1, 3, 4, 2])
+
+    def test_single_ranking_is_unchanged(self):
+        self.assertEqual(reciprocal_rank_fusion([5, 2, 9]), [5, 2, 9])
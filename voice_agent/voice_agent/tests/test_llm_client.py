@@ -0,0 +1,136 @@
+import asyncio
+import time
+from unittest import mock
+
+import httpx
+import requests
+from django.test import SimpleTestCase
+
+from voice_agent.llm_client import CircuitBreaker, CircuitOpenError, LLMClient, LLMError
+
+COMPLETION = {'choices': [{'message': {'content': "Hi"}}], 'usage': {'prompt_tokens': 3, 'completion_tokens': 1}}
+
+
+def fake_response(status_code, body=None, headers=None):
+    response = mock.Mock(status_code=status_code, text=str(body), headers=headers or {})
+    response.json.return_value = body
+    return response
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def open_breaker(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        breaker.record_failure()
+        return breaker
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = self.open_breaker()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_half_open_lets_a_single_trial_through(self):
+        breaker = self.open_breaker()
+        breaker.opened_at = time.monotonic() - 31
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+
+    def test_failed_trial_reopens(self):
+        breaker = self.open_breaker()
+        breaker.opened_at = time.monotonic() - 31
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+        breaker.opened_at = time.monotonic() - 31
+        self.assertTrue(breaker.allow())
+
+
+class LLMClientTests(SimpleTestCase):
+
+    def llm_client(self, responses, **options):
+        client = LLMClient('http://llm.test/v1/chat/completions', 'key', backoff=0, **options)
+        patcher = mock.patch.object(client.session, 'post', side_effect=responses)
+        self.post = patcher.start()
+        self.addCleanup(patcher.stop)
+        return client
+
+    def test_retries_retryable_statuses_and_connection_errors(self):
+        client = self.llm_client([fake_response(503, "busy"), requests.ConnectionError("reset"),
+                                  fake_response(200, COMPLETION)])
+        self.assertEqual(client.chat({'messages': []}, label='answer'), COMPLETION)
+        self.assertEqual(self.post.call_count, 3)
+        stats = client.metrics.snapshot()['answer']
+        self.assertEqual((stats['calls'], stats['retries'], stats['prompt_tokens']), (1, 2, 3))
+
+    def test_rejected_request_is_not_retried(self):
+        client = self.llm_client([fake_response(400, "bad request")])
+        with self.assertRaises(LLMError) as raised:
+            client.chat({'messages': []})
+        self.assertEqual(raised.exception.status_code, 400)
+        self.assertEqual(self.post.call_count, 1)
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_gives_up_after_max_retries(self):
+        client = self.llm_client([fake_response(500, "down")] * 3, max_retries=2)
+        with self.assertRaises(LLMError):
+            client.chat({'messages': []})
+        self.assertEqual(self.post.call_count, 3)
+
+    def test_open_circuit_fails_fast(self):
+        client = self.llm_client([fake_response(500, "down")] * 2, max_retries=5,
+                                 breaker=CircuitBreaker(failure_threshold=2))
+        with self.assertRaises(LLMError):
+            client.chat({'messages': []})
+        # The circuit opened on the second failure, so the call stopped retrying there
+        self.assertEqual(self.post.call_count, 2)
+        with self.assertRaises(CircuitOpenError):
+            client.chat({'messages': []})
+        self.assertEqual(self.post.call_count, 2)
+
+
+class AsyncChatTests(SimpleTestCase):
+
+    def achat(self, handler, **options):
+        client = LLMClient('http://llm.test/v1/chat/completions', 'key', backoff=0, **options)
+
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http_client:
+                return await client.achat(http_client, {'messages': []}, label='router')
+
+        return client, asyncio.run(run())
+
+    def test_shares_the_retry_policy(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            if len(calls) == 1:
+                raise httpx.ConnectError("refused")
+            if len(calls) == 2:
+                return httpx.Response(429, text="slow down", headers={'Retry-After': '0'})
+            return httpx.Response(200, json=COMPLETION)
+
+        client, result = self.achat(handler)
+        self.assertEqual(result, COMPLETION)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(client.metrics.snapshot()['router']['retries'], 2)
+
+    def test_rejected_request_raises_llm_error(self):
+        with self.assertRaises(LLMError) as raised:
+            self.achat(lambda request: httpx.Response(401, text="no key"))
+        self.assertEqual(raised.exception.status_code, 401)
+
+    def test_programming_errors_are_not_swallowed(self):
+        def handler(request):
+            raise KeyError('bug')
+
+        with self.assertRaises(KeyError):
+            self.achat(handler)
@@ -0,0 +1,72 @@
+import io
+import json
+import wave
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from voice_agent import async_views, views
+from voice_agent.tts import Speech, TTSError, TTSPool
+
+SCRIPT = """Podcast: Pumps
+
+Agent 1: Welcome back.
+Agent 2: Thanks.
+Narrator: not a turn
+Agent 1:
+Agent 1: Let us talk pumps.
+"""
+
+
+def read_wav(content):
+    with wave.open(io.BytesIO(content), 'rb') as wav:
+        return wav.getframerate(), wav.readframes(wav.getnframes())
+
+
+class PodcastAssemblyTests(SimpleTestCase):
+
+    def test_parse_script(self):
+        self.assertEqual(views.parse_podcast_script(SCRIPT),
+                         [('Agent 1', "Welcome back."), ('Agent 2', "Thanks."), ('Agent 1', "Let us talk pumps.")])
+
+    def test_turns_are_joined_in_order_with_pauses(self):
+        speeches = [Speech(bytes([value]) * 200, 100, 2, 1) for value in (1, 2, 3)]
+        rate, frames = read_wav(views.assemble_podcast(speeches))
+        pause = bytes(int(100 * views.PODCAST_PAUSE_SECONDS) * 2)
+        self.assertEqual(rate, 100)
+        self.assertEqual(frames, speeches[0].pcm + pause + speeches[1].pcm + pause + speeches[2].pcm)
+
+    def test_mixed_formats_are_rejected(self):
+        with self.assertRaises(TTSError):
+            views.assemble_podcast([Speech(b'\x00' * 4, 100, 2, 1), Speech(b'\x00' * 4, 200, 2, 1)])
+
+
+class PodcastViewTests(SimpleTestCase):
+    """Both podcast endpoints on a pool of stub engines, which render 0.05s of tone per character."""
+
+    def setUp(self):
+        pool = TTSPool(workers=2, backend='stub')
+        self.addCleanup(pool.shutdown)
+        for module in (views, async_views):
+            patcher = mock.patch.object(module, 'TTS_POOL', pool)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, path, script):
+        return self.client.post(path, json.dumps({'script': script}), content_type='application/json')
+
+    def test_script_is_narrated_turn_by_turn(self):
+        texts = [text for agent, text in views.parse_podcast_script(SCRIPT)]
+        expected_seconds = 0.05 * sum(len(text) for text in texts) + views.PODCAST_PAUSE_SECONDS * (len(texts) - 1)
+        for path in ('/api/podcast-tts/', '/api/async/podcast-tts/'):
+            with self.subTest(path=path):
+                response = self.post(path, SCRIPT)
+                self.assertEqual(response.status_code, 200)
+                rate, frames = read_wav(response.content)
+                self.assertAlmostEqual(len(frames) / (rate * 2), expected_seconds, places=2)
+
+    def test_script_without_turns(self):
+        for path in ('/api/podcast-tts/', '/api/async/podcast-tts/'):
+            with self.subTest(path=path):
+                self.assertEqual(self.post(path, "").status_code, 400)
+                self.assertEqual(self.post(path, "Narrator: hello").status_code, 400)
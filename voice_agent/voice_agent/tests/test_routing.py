@@ -0,0 +1,74 @@
+from django.test import SimpleTestCase
+
+from voice_agent.routing import _match_route, parse_router_output, route_cache_key, router_context
+
+
+class MatchRouteTests(SimpleTestCase):
+
+    def assertRoute(self, message, discussion, initiator, responders, prompt):
+        self.assertEqual(_match_route(message), {
+            'discussion_required': discussion,
+            'initiator_agent_id': initiator,
+            'responding_agent_ids': responders,
+            'revised_prompt': prompt,
+        })
+
+    def test_plain_question_goes_to_agent_1(self):
+        self.assertRoute("What is the revenue?", False, 1, [1], "What is the revenue?")
+
+    def test_group_question(self):
+        self.assertRoute("Both agents, what do you think?", False, 1, [1, 2], "Both agents, what do you think?")
+
+    def test_group_discussion(self):
+        self.assertRoute("Can both of you discuss the risks?", True, 1, [1, 2], "Can both of you discuss the risks?")
+
+    def test_single_agent_instruction(self):
+        self.assertRoute("Agent 2 explain the chart", False, 2, [2], "Explain the chart")
+        self.assertRoute("Please Agent 1, summarize section 3", False, 1, [1], "Summarize section 3")
+
+    def test_joint_discussion(self):
+        self.assertRoute("Agent 1 and Agent 2 discuss the budget", True, 1, [1, 2], "Discuss the budget")
+
+    def test_one_agent_addresses_the_other(self):
+        self.assertRoute("Agent 2 ask Agent 1 about the margins", True, 2, [2, 1], "Ask Agent 1 about the margins")
+        self.assertRoute("Agent 1, start a discussion with Agent 2 on pricing", True, 1, [1, 2],
+                         "Start a discussion with Agent 2 on pricing")
+
+    def test_separate_instructions(self):
+        self.assertRoute("Agent 1 summarize the report and Agent 2 critique it", False, 1, [1, 2],
+                         {'1': "Summarize the report", '2': "Critique it"})
+        self.assertRoute("Agent 1 answer, then Agent 2 ask a question", False, 1, [1, 2],
+                         {'1': "Answer", '2': "Ask a question"})
+
+    def test_ambiguous_prompts_go_to_the_router_llm(self):
+        for message in (
+            "Start a discussion about risks",
+            "Agent 3 explain",
+            "Tell Agent 1 that Agent 2 is wrong",
+            "Agent 1's answer was wrong",
+            "Agent 1",
+            "Agent 1 discuss this",
+            "Agent 1 ask Agent 1 about it",
+        ):
+            with self.subTest(message=message):
+                self.assertIsNone(_match_route(message))
+
+
+class RouterLLMTests(SimpleTestCase):
+
+    def test_parse_router_output(self):
+        self.assertEqual(parse_router_output('Sure:\n{"discussion_required": false}\nDone'),
+                         {'discussion_required': False})
+        self.assertIsNone(parse_router_output("no JSON here"))
+        self.assertIsNone(parse_router_output("{not json}"))
+
+    def test_cache_key_depends_on_context(self):
+        history = [{'agent': 'Agent 1', 'text': 'The margins fell.'}]
+        with_history = route_cache_key("Why?", router_context(history))
+        self.assertEqual(with_history, route_cache_key("  Why? ", router_context(history)))
+        self.assertNotEqual(with_history, route_cache_key("Why?", router_context([])))
+
+    def test_cache_key_depends_on_document_in_full_mode(self):
+        first = route_cache_key("Why?", router_context([], document_content='Report A', mode='full'))
+        second = route_cache_key("Why?", router_context([], document_content='Report B', mode='full'))
+        self.assertNotEqual(first, second)
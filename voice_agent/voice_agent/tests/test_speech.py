@@ -0,0 +1,119 @@
+import asyncio
+import json
+from unittest import mock
+
+import speech_recognition as sr
+from django.test import SimpleTestCase
+
+from voice_agent import speech, voice_stream
+from voice_agent.audio import SAMPLE_RATE, SAMPLE_WIDTH
+from voice_agent.tests.test_vad import recording
+
+SILENCE = bytes(SAMPLE_RATE * SAMPLE_WIDTH)
+
+
+def pieces(pcm, seconds=0.25):
+    size = int(seconds * SAMPLE_RATE) * SAMPLE_WIDTH
+    return [pcm[i:i + size] for i in range(0, len(pcm), size)]
+
+
+class StubBackendMixin:
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(speech, 'SPEECH_BACKEND', 'stub')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class SpeechBackendTests(StubBackendMixin, SimpleTestCase):
+
+    def test_stub_transcribes_audio_and_rejects_silence(self):
+        self.assertEqual(speech.transcribe(recording(2, [(0, 2)])), "stub transcript of 2.0 seconds")
+        with self.assertRaises(sr.UnknownValueError):
+            speech.transcribe(SILENCE)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            speech.get_recognizer('nonexistent')
+
+    def test_stream_emits_partials_while_audio_arrives(self):
+        stream = speech.get_recognizer().stream()
+        partials = [stream.accept(piece) for piece in pieces(recording(2.5, [(0, 2.5)]))]
+        self.assertEqual(partials[0], '')
+        self.assertEqual(partials[3], "stub transcript of 1.0 seconds")
+        self.assertEqual(partials[-1], "stub transcript of 2.0 seconds")
+        self.assertEqual(stream.finish(), "stub transcript of 2.5 seconds")
+
+    def test_utterances_are_joined_in_order_without_the_silent_ones(self):
+        utterances = [recording(1, [(0, 1)]), SILENCE, recording(2, [(0, 2)])]
+        self.assertEqual(speech.transcribe_utterances(utterances),
+                         "stub transcript of 1.0 seconds stub transcript of 2.0 seconds")
+        with self.assertRaises(sr.UnknownValueError):
+            speech.transcribe_utterances([SILENCE, SILENCE])
+
+
+class VoiceStreamViewTests(StubBackendMixin, SimpleTestCase):
+
+    def start(self, **data):
+        return self.client.post('/api/voice-stream/', json.dumps(data), content_type='application/json')
+
+    def send(self, stream_id, pcm, step='audio'):
+        return self.client.post(f'/api/voice-stream/{stream_id}/{step}/', pcm, content_type='application/octet-stream')
+
+    def test_partials_then_final_transcript(self):
+        stream_id = self.start(format='pcm').json()['stream_id']
+        audio = recording(2.5, [(0.5, 2.5)])
+        partials = [self.send(stream_id, piece).json()['partial'] for piece in pieces(audio)]
+        self.assertEqual(partials[0], '')
+        self.assertTrue(partials[-1].startswith("stub transcript of"))
+        self.assertEqual(self.send(stream_id, b'', 'finish').json(), {'text': "stub transcript of 2.2 seconds"})
+        # Finishing closes the stream
+        self.assertEqual(self.send(stream_id, b'').status_code, 404)
+
+    def test_silence_is_rejected(self):
+        stream_id = self.start().json()['stream_id']
+        self.send(stream_id, SILENCE)
+        response = self.send(stream_id, b'', 'finish')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Could not understand audio', response.json()['error'])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.start(format='mp3').status_code, 400)
+        self.assertEqual(self.send('missing', SILENCE).status_code, 404)
+
+
+class VoiceWebSocketTests(StubBackendMixin, SimpleTestCase):
+
+    def run_socket(self, messages, query=b'format=pcm'):
+        sent = []
+
+        async def run():
+            incoming = asyncio.Queue()
+            for message in [{'type': 'websocket.connect'}, *messages]:
+                incoming.put_nowait(message)
+
+            async def send(message):
+                sent.append(message)
+
+            await voice_stream.voice_websocket({'type': 'websocket', 'query_string': query}, incoming.get, send)
+
+        asyncio.run(run())
+        return sent
+
+    def test_partials_then_final_transcript(self):
+        audio = recording(2.5, [(0, 2.5)])
+        sent = self.run_socket([{'type': 'websocket.receive', 'bytes': piece} for piece in pieces(audio)]
+                               + [{'type': 'websocket.receive', 'text': json.dumps({'type': 'end'})}])
+        self.assertEqual(sent[0], {'type': 'websocket.accept'})
+        texts = [json.loads(message['text']) for message in sent if message['type'] == 'websocket.send']
+        self.assertEqual({text['type'] for text in texts[:-1]}, {'partial'})
+        # Unchanged partials are not sent again
+        self.assertEqual(len(texts[:-1]), len({text['text'] for text in texts[:-1]}))
+        self.assertEqual(texts[-1], {'type': 'final', 'text': "stub transcript of 2.5 seconds"})
+        self.assertEqual(sent[-1], {'type': 'websocket.close', 'code': 1000})
+
+    def test_bad_format_closes_with_an_error(self):
+        sent = self.run_socket([], query=b'format=mp3')
+        self.assertEqual(json.loads(sent[1]['text'])['type'], 'error')
+        self.assertEqual(sent[-1], {'type': 'websocket.close', 'code': 1011})
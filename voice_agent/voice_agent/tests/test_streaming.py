@@ -0,0 +1,99 @@
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from voice_agent import views
+from voice_agent.llm_client import LLMError
+
+
+class FakeStream:
+    """A streamed Groq chat completion delivering ``tokens`` as SSE data lines."""
+
+    def __init__(self, tokens, fail_after=None):
+        self.tokens = tokens
+        self.fail_after = fail_after
+        self.closed = False
+
+    def iter_lines(self, decode_unicode=False):
+        for number, token in enumerate(self.tokens):
+            if number == self.fail_after:
+                raise ConnectionError("stream reset")
+            yield 'data: ' + json.dumps({'choices': [{'delta': {'content': token}}]})
+            yield ''
+        yield 'data: [DONE]'
+
+    def close(self):
+        self.closed = True
+
+
+def plan(format_output=True):
+    return {'message': "Question", 'label': 'agent', 'model': 'm', 'messages': [], 'temperature': 0.4,
+            'top_p': 0.8, 'format_output': format_output, 'persist_agent_id': None, 'extra': {}}
+
+
+def parse_events(stream):
+    events = []
+    for block in stream:
+        event, data = block.strip().split('\n', 1)
+        events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+class StreamMessageEventsTests(SimpleTestCase):
+
+    def stream(self, response, format_output=True):
+        patcher = mock.patch.object(views.GROQ_CLIENT, 'post_chat', return_value=response)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return views._stream_message_events(plan(format_output))
+
+    def test_tokens_then_done(self):
+        response = FakeStream(["Hel", "lo", " there"])
+        events = parse_events(self.stream(response, format_output=False))
+        self.assertEqual(events[:-1], [('token', {'text': "Hel"}), ('token', {'text': "lo"}),
+                                       ('token', {'text': " there"})])
+        self.assertEqual(events[-1][0], 'done')
+        self.assertEqual(events[-1][1]['response'], "Hello there")
+        self.assertIn('time_to_first_token', events[-1][1]['timings'])
+        self.assertTrue(response.closed)
+
+    def test_formatting_matches_the_whole_answer(self):
+        answer = "Intro with **bold**.\n\n- one\n- two\n\n```\ncode\n\nmore code\n```\n\nEnd."
+        tokens = [answer[i:i + 3] for i in range(0, len(answer), 3)]
+        events = parse_events(self.stream(FakeStream(tokens)))
+        streamed = ''.join(data['text'] for name, data in events if name == 'token')
+        self.assertEqual(events[-1][1]['response'], views.format_response(answer))
+        # Only blank lines between paragraphs may differ from the done event's text
+        self.assertEqual([line for line in streamed.splitlines() if line],
+                         [line for line in events[-1][1]['response'].splitlines() if line])
+        self.assertNotIn('```', streamed)
+
+    def test_response_is_closed_when_the_client_disconnects(self):
+        response = FakeStream(["a", "b", "c"])
+        events = self.stream(response, format_output=False)
+        next(events)
+        events.close()
+        self.assertTrue(response.closed)
+
+    def test_response_is_closed_on_errors(self):
+        response = FakeStream(["a", "b", "c"], fail_after=1)
+        events = parse_events(self.stream(response, format_output=False))
+        self.assertEqual(events[-1][0], 'error')
+        self.assertIn("stream reset", events[-1][1]['error'])
+        self.assertTrue(response.closed)
+
+    def test_request_error(self):
+        patcher = mock.patch.object(views.GROQ_CLIENT, 'post_chat', side_effect=LLMError("Service unavailable", 503))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        events = parse_events(views._stream_message_events(plan()))
+        self.assertEqual(events, [('error', views._message_error_payload(LLMError("Service unavailable"), "Question"))])
+
+
+class SplitCompleteBlocksTests(SimpleTestCase):
+
+    def test_keeps_open_code_fences_pending(self):
+        self.assertEqual(views._split_complete_blocks("One.\n\nTwo"), ("One.", "Two"))
+        self.assertEqual(views._split_complete_blocks("One.\n\n```\nx\n\ny"), ("One.", "```\nx\n\ny"))
+        self.assertEqual(views._split_complete_blocks("No break yet"), ("", "No break yet"))
@@ -0,0 +1,78 @@
+import hashlib
+import importlib
+import os
+import tempfile
+from unittest import mock
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+
+from voice_agent import text_cache
+from voice_agent.models import Document
+
+TEXT = b"Pumps need oil.\n" * 10000
+
+backfill_content_hash = importlib.import_module(
+    'voice_agent.migrations.0013_backfill_document_content_hash').backfill_content_hash
+
+
+class TextCacheTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_root = override_settings(MEDIA_ROOT=directory.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        patcher = mock.patch.object(text_cache, 'TEXT_CACHE_ROOT', os.path.join(directory.name, 'extracted_text'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(text_cache.DOCUMENT_TEXT_CACHE.invalidate)
+
+    def document(self, content=TEXT, **fields):
+        return Document.objects.create(file=ContentFile(content, name='notes.txt'), filename='notes.txt',
+                                       content_type='text/plain', **fields)
+
+    def test_backfill_migration_hashes_existing_files(self):
+        document = self.document()
+        missing = self.document()
+        os.unlink(missing.file.path)
+        backfill_content_hash(apps, None)
+        document.refresh_from_db()
+        missing.refresh_from_db()
+        self.assertEqual(document.content_hash, hashlib.sha256(TEXT).hexdigest())
+        self.assertEqual(missing.content_hash, '')
+
+    def test_first_read_hashes_and_extracts_later_reads_use_the_sidecar(self):
+        document = self.document()
+        self.assertEqual(''.join(text_cache.iter_document_text(document)), TEXT.decode())
+        document.refresh_from_db()
+        self.assertEqual(document.content_hash, hashlib.sha256(TEXT).hexdigest())
+        self.assertTrue(os.path.exists(text_cache.sidecar_path(document.content_hash)))
+        self.assertGreater(len(document.page_offsets), 1)
+        with mock.patch.object(text_cache, 'iter_document_pages') as extract:
+            self.assertEqual(''.join(text_cache.iter_document_text(document)), TEXT.decode())
+        extract.assert_not_called()
+
+    def test_identical_upload_reuses_the_sidecar(self):
+        first = self.document()
+        text_cache.load_document_text(first)
+        first.refresh_from_db()
+        second = self.document(content_hash=first.content_hash)
+        with mock.patch.object(text_cache, 'iter_document_pages') as extract:
+            self.assertEqual(text_cache.load_document_text(second), TEXT.decode())
+        extract.assert_not_called()
+        second.refresh_from_db()
+        self.assertEqual(second.page_offsets, first.page_offsets)
+        # The sidecar stays while another document still uses it
+        text_cache.remove_document_text(second)
+        self.assertTrue(os.path.exists(text_cache.sidecar_path(first.content_hash)))
+
+    def test_partial_read_leaves_no_sidecar(self):
+        document = self.document()
+        pages = text_cache.iter_document_text(document)
+        next(pages)
+        pages.close()
+        self.assertFalse(os.path.exists(text_cache.sidecar_path(document.content_hash)))
+        self.assertEqual(Document.objects.get(id=document.id).page_offsets, [])
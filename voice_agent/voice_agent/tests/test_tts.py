@@ -0,0 +1,93 @@
+import io
+import json
+import os
+import signal
+import wave
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from voice_agent import async_views, views
+from voice_agent.tts import Speech, TTSError, TTSPool, TTSTimeoutError
+
+
+class SpeechTests(SimpleTestCase):
+
+    def test_wav_bytes(self):
+        speech = Speech(b'\x00\x01' * 22050, 22050, 2, 1)
+        self.assertEqual(speech.duration, 1.0)
+        with wave.open(io.BytesIO(speech.wav_bytes()), 'rb') as wav:
+            self.assertEqual((wav.getframerate(), wav.getsampwidth(), wav.getnchannels(), wav.getnframes()),
+                             (22050, 2, 1, 22050))
+
+
+class TTSPoolTests(SimpleTestCase):
+    """Runs real worker processes with the stub engine, which renders 0.05s of tone per character."""
+
+    def pool(self, workers=1, backend='stub'):
+        pool = TTSPool(workers=workers, backend=backend)
+        self.addCleanup(pool.shutdown)
+        return pool
+
+    def test_synthesize(self):
+        speech = self.pool().synthesize("Hello there", voice=2)
+        self.assertEqual((speech.sample_rate, speech.sample_width, speech.channels), (22050, 2, 1))
+        self.assertAlmostEqual(speech.duration, 0.55, places=3)
+
+    def test_concurrent_jobs_keep_their_results(self):
+        pool = self.pool(workers=2)
+        texts = ["a" * length for length in range(1, 9)]
+        futures = [pool.submit(text, voice=1 + number % 2) for number, text in enumerate(texts)]
+        durations = [round(future.result(timeout=30).duration, 3) for future in futures]
+        self.assertEqual(durations, [round(0.05 * len(text), 3) for text in texts])
+        self.assertEqual(pool.stats()['alive'], 2)
+
+    def test_killed_worker_is_replaced(self):
+        pool = self.pool()
+        pool.synthesize("warm up")
+        os.kill(pool._workers[0].process.pid, signal.SIGKILL)
+        self.assertAlmostEqual(pool.synthesize("after").duration, 0.25, places=3)
+
+    def test_stuck_worker_times_out_and_is_replaced(self):
+        pool = self.pool()
+        pool.synthesize("warm up")
+        stuck = pool._workers[0].process
+        os.kill(stuck.pid, signal.SIGSTOP)
+        with self.assertRaises(TTSTimeoutError):
+            pool.synthesize("never", timeout=0.5)
+        self.assertFalse(stuck.is_alive())
+        self.assertAlmostEqual(pool.synthesize("after").duration, 0.25, places=3)
+
+    def test_engine_that_cannot_start(self):
+        with self.assertRaisesMessage(TTSError, "TTS engine failed to start"):
+            self.pool(backend='missing').synthesize("Hello")
+
+
+class VoiceResponseViewTests(SimpleTestCase):
+    """The sync and async voice-response endpoints on a stub worker pool."""
+
+    def setUp(self):
+        pool = TTSPool(workers=1, backend='stub')
+        self.addCleanup(pool.shutdown)
+        for module in (views, async_views):
+            patcher = mock.patch.object(module, 'TTS_POOL', pool)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, path, **data):
+        return self.client.post(path, json.dumps(data), content_type='application/json')
+
+    def test_agent_id_is_coerced(self):
+        for path in ('/api/voice-response/', '/api/async/voice-response/'):
+            with self.subTest(path=path):
+                response = self.post(path, text="Hi", agent_id="2")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], 'audio/wav')
+
+    def test_invalid_agent_id(self):
+        for path in ('/api/voice-response/', '/api/async/voice-response/'):
+            for agent_id in ("two", None, [2]):
+                with self.subTest(path=path, agent_id=agent_id):
+                    response = self.post(path, text="Hi", agent_id=agent_id)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn('agent_id', response.json()['error'])
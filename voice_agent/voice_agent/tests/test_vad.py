@@ -0,0 +1,50 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from voice_agent.audio import SAMPLE_RATE, SAMPLE_WIDTH
+from voice_agent.vad import detect_utterances, has_speech, split_utterances
+
+FRAME_SECONDS = 0.03
+
+
+def recording(seconds, speech=()):
+    """Low background noise with a loud 200 Hz tone over each (start, end) second range of ``speech``."""
+    samples = np.random.default_rng(0).normal(0, 30, int(seconds * SAMPLE_RATE))
+    for start, end in speech:
+        t = np.arange(int(start * SAMPLE_RATE), int(end * SAMPLE_RATE))
+        samples[t] += 6000 * np.sin(2 * np.pi * 200 * t / SAMPLE_RATE)
+    return samples.astype('<i2').tobytes()
+
+
+def seconds(utterances):
+    return [(start / (SAMPLE_RATE * SAMPLE_WIDTH), end / (SAMPLE_RATE * SAMPLE_WIDTH)) for start, end in utterances]
+
+
+class DetectUtterancesTests(SimpleTestCase):
+
+    def assertSpans(self, pcm, expected):
+        spans = seconds(detect_utterances(pcm))
+        self.assertEqual(len(spans), len(expected), spans)
+        for span, expected_span in zip(spans, expected):
+            for value, expected_value in zip(span, expected_span):
+                self.assertAlmostEqual(value, expected_value, delta=FRAME_SECONDS)
+
+    def test_short_pauses_merge_and_long_ones_split(self):
+        # 0.3s pause is merged, 1.5s pause splits; each utterance is padded by 0.2s
+        self.assertSpans(recording(6, [(0.5, 1.5), (1.8, 2.5), (4.0, 5.0)]), [(0.3, 2.7), (3.8, 5.2)])
+
+    def test_clicks_are_dropped(self):
+        self.assertSpans(recording(2, [(0.5, 0.55), (1.0, 1.5)]), [(0.8, 1.7)])
+
+    def test_long_speech_is_cut(self):
+        self.assertSpans(recording(70, [(0, 70)]), [(0, 30.2), (29.8, 60.2), (59.8, 70)])
+
+    def test_silence(self):
+        self.assertEqual(detect_utterances(recording(2)), [])
+        self.assertFalse(has_speech(recording(2)))
+        self.assertEqual(detect_utterances(b''), [])
+
+    def test_split_utterances_returns_pcm(self):
+        pcm = recording(6, [(0.5, 1.5), (4.0, 5.0)])
+        self.assertEqual(split_utterances(pcm), [pcm[start:end] for start, end in detect_utterances(pcm)])
+        self.assertEqual(split_utterances(recording(1)), [])
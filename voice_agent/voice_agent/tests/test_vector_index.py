@@ -0,0 +1,65 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from voice_agent import vector_index
+from voice_agent.vector_index import build_index, choose_index_type, ivf_nlist, pq_subquantizers
+
+
+class ChooseIndexTypeTests(SimpleTestCase):
+
+    def test_auto_by_corpus_size(self):
+        self.assertEqual(choose_index_type(100, 'auto'), 'flat')
+        self.assertEqual(choose_index_type(vector_index.ANN_FLAT_MAX_VECTORS, 'auto'), 'flat')
+        self.assertEqual(choose_index_type(vector_index.ANN_FLAT_MAX_VECTORS + 1, 'auto'),
+                         vector_index.ANN_MIDSIZE_TYPE)
+        self.assertEqual(choose_index_type(vector_index.ANN_PQ_MIN_VECTORS, 'auto'), 'ivfpq')
+
+    def test_forced_type(self):
+        self.assertEqual(choose_index_type(10, 'hnsw'), 'hnsw')
+        self.assertEqual(choose_index_type(10 ** 7, 'flat'), 'flat')
+
+    def test_ivf_nlist_leaves_enough_training_points(self):
+        self.assertEqual(ivf_nlist(10), 1)
+        self.assertEqual(ivf_nlist(10_000), 256)
+        self.assertEqual(ivf_nlist(1_000_000), 4000)
+
+    def test_pq_subquantizers_divide_the_dimension(self):
+        self.assertEqual(pq_subquantizers(768), 32)
+        self.assertEqual(pq_subquantizers(100, 32), 25)
+        self.assertEqual(pq_subquantizers(8, 32), 8)
+
+
+class BuildIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.vectors = np.random.default_rng(0).standard_normal((2_000, 16)).astype('float32')
+
+    def assertFindsItself(self, index, ids=None):
+        _, found = index.search(self.vectors[:20], 1)
+        expected = np.arange(20) if ids is None else ids[:20]
+        self.assertGreaterEqual(np.mean(found[:, 0] == expected), 0.9)
+
+    def test_each_index_type(self):
+        for index_type, class_name in (('flat', 'IndexFlatL2'), ('ivf', 'IndexIVFFlat'), ('hnsw', 'IndexHNSWFlat')):
+            with self.subTest(index_type=index_type):
+                index = build_index(self.vectors, index_type=index_type, nprobe=64)
+                self.assertEqual(type(index).__name__, class_name)
+                self.assertEqual(index.ntotal, len(self.vectors))
+                self.assertFindsItself(index)
+
+    def test_ivfpq(self):
+        # Training 8-bit product quantizers needs a few thousand points
+        vectors = np.random.default_rng(0).standard_normal((10_000, 4)).astype('float32')
+        index = build_index(vectors, index_type='ivfpq')
+        self.assertEqual(type(index).__name__, 'IndexIVFPQ')
+        self.assertEqual(index.ntotal, len(vectors))
+
+    def test_ids(self):
+        ids = np.arange(len(self.vectors)) + 1_000
+        for index_type in ('flat', 'ivf'):
+            with self.subTest(index_type=index_type):
+                self.assertFindsItself(build_index(self.vectors, index_type=index_type, ids=ids), ids)
+
+    def test_too_few_vectors_to_train_fall_back_to_flat(self):
+        index = build_index(self.vectors[:30], index_type='ivf')
+        self.assertEqual(type(index).__name__, 'IndexFlatL2')
@@ -0,0 +1,146 @@
+"""Extracted document text, stored once per file content.
+
+The first extraction of a file is written, gzip-compressed, to a sidecar
+under TEXT_CACHE_ROOT named by the SHA-256 of the file, and the Document
+records the hash, the character offset of each page and some extraction
+metadata. Later chat messages and re-indexing read the sidecar instead of
+parsing the PDF/DOCX again; identical re-uploads share one sidecar.
+"""
+import gzip
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from .caching import TTLCache
+from .extraction import iter_document_pages
+from .models import Document
+
+logger = logging.getLogger(__name__)
+
+TEXT_CACHE_ROOT = getattr(settings, 'TEXT_CACHE_ROOT', os.path.join(settings.MEDIA_ROOT, 'extracted_text'))
+# Recently used full texts kept in memory for the unindexed chat path
+DOCUMENT_TEXT_CACHE = TTLCache(
+    maxsize=getattr(settings, 'DOCUMENT_TEXT_CACHE_SIZE', 16),
+    ttl=getattr(settings, 'DOCUMENT_TEXT_CACHE_TTL', 600),
+)
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_chunks(chunks):
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_file(file_path):
+    with open(file_path, 'rb') as f:
+        return hash_chunks(iter(lambda: f.read(HASH_BLOCK_SIZE), b''))
+
+
+def sidecar_path(content_hash):
+    return os.path.join(TEXT_CACHE_ROOT, content_hash[:2], f'{content_hash}.txt.gz')
+
+
+def _content_hash(document):
+    if not document.content_hash:
+        # Uploaded before hashes were recorded
+        document.content_hash = hash_file(document.file.path)
+        Document.objects.filter(id=document.id).update(content_hash=document.content_hash)
+    return document.content_hash
+
+
+def _iter_sidecar_pages(path, page_offsets):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for start, end in zip(page_offsets, page_offsets[1:] + [None]):
+            yield f.read(end - start) if end is not None else f.read()
+
+
+def _extract_to_sidecar(document, content_hash):
+    """Yield pages from the extractor while writing them to the sidecar.
+
+    The sidecar and the Document's page map are only committed once every page
+    has been read; a consumer that stops early leaves no partial cache behind.
+    """
+    path = sidecar_path(content_hash)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    page_offsets = []
+    characters = 0
+    seconds = 0.0
+    pages = iter_document_pages(document.file.path)
+    try:
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            while True:
+                # Time only the extractor, not the consumer between pages
+                start = time.perf_counter()
+                page = next(pages, None)
+                seconds += time.perf_counter() - start
+                if page is None:
+                    break
+                page_offsets.append(characters)
+                characters += len(page)
+                f.write(page)
+                yield page
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    extraction = {
+        'format': os.path.splitext(document.file.name)[1].lower().lstrip('.'),
+        'pages': len(page_offsets),
+        'characters': characters,
+        'compressed_bytes': os.path.getsize(path),
+        'seconds': round(seconds, 3),
+        'extracted_at': time.time(),
+    }
+    document.page_offsets = page_offsets
+    document.extraction = extraction
+    Document.objects.filter(id=document.id).update(page_offsets=page_offsets, extraction=extraction)
+    logger.info(f"Cached extracted text of document {document.id} ({characters} characters, "
+                f"{len(page_offsets)} pages) in {extraction['seconds']}s")
+
+
+def iter_document_text(document):
+    """Yield a document's pages, from the sidecar when it exists, else by extracting (and caching) them."""
+    content_hash = _content_hash(document)
+    path = sidecar_path(content_hash)
+    if os.path.exists(path):
+        page_offsets = document.page_offsets
+        if not page_offsets:
+            # Same content as an earlier upload: reuse its page map
+            twin = (Document.objects.filter(content_hash=content_hash).exclude(page_offsets=[])
+                    .exclude(id=document.id).values('page_offsets', 'extraction').first())
+            if twin is not None:
+                document.page_offsets, document.extraction = twin['page_offsets'], twin['extraction']
+                Document.objects.filter(id=document.id).update(**twin)
+                page_offsets = document.page_offsets
+        if page_offsets:
+            return _iter_sidecar_pages(path, page_offsets)
+    return _extract_to_sidecar(document, content_hash)
+
+
+def load_document_text(document):
+    """Return a document's full extracted text."""
+    text = DOCUMENT_TEXT_CACHE.get(document.id)
+    if text is None:
+        text = ''.join(iter_document_text(document))
+        DOCUMENT_TEXT_CACHE.set(document.id, text)
+    return text
+
+
+def remove_document_text(document):
+    """Delete a document's sidecar unless another Document has the same content."""
+    DOCUMENT_TEXT_CACHE.invalidate(lambda key: key == document.id)
+    if not document.content_hash:
+        return
+    if Document.objects.filter(content_hash=document.content_hash).exclude(id=document.id).exists():
+        return
+    try:
+        os.unlink(sidecar_path(document.content_hash))
+    except FileNotFoundError:
+        pass
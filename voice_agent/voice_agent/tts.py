@@ -0,0 +1,313 @@
+"""Pool of long-lived text-to-speech worker processes.
+
+pyttsx3 is slow to initialise and not thread-safe, so each worker process
+owns one engine, created once with its voice list loaded. Jobs go through a
+shared queue; one dispatcher thread per worker sends a job to its process and
+waits for the PCM with a per-job timeout. A worker that times out is killed
+and restarted, and the job fails. A worker that crashes is restarted and the
+job is retried up to TTS_MAX_RETRIES times. Callers get a Future, so they can
+synthesize several texts at once.
+
+pyttsx3 can only render to a file, so the worker renders into a private
+directory (on /dev/shm when available) and reads the frames straight back.
+Callers only ever see PCM.
+
+Backends: ``pyttsx3`` (eSpeak/SAPI5/NSSpeechSynthesizer), or ``stub``, which
+renders a tone as long as the text for tests and machines without a speech
+engine.
+"""
+import atexit
+import io
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+import numpy as np
+from django.conf import settings
+
+from .llm_client import LLMMetrics
+
+logger = logging.getLogger(__name__)
+
+TTS_BACKEND = getattr(settings, 'TTS_BACKEND', 'pyttsx3')
+TTS_WORKERS = getattr(settings, 'TTS_WORKERS', 2)
+TTS_JOB_TIMEOUT = getattr(settings, 'TTS_JOB_TIMEOUT', 60)
+TTS_START_TIMEOUT = getattr(settings, 'TTS_START_TIMEOUT', 30)
+TTS_MAX_RETRIES = getattr(settings, 'TTS_MAX_RETRIES', 1)
+
+# Queue wait, synthesis latency, timeouts, crashes and restarts
+TTS_METRICS = LLMMetrics()
+
+
+class TTSError(Exception):
+    pass
+
+
+class TTSTimeoutError(TTSError):
+    pass
+
+
+@dataclass
+class Speech:
+    """Synthesized audio as raw PCM frames."""
+    pcm: bytes
+    sample_rate: int
+    sample_width: int
+    channels: int
+
+    @property
+    def duration(self):
+        return len(self.pcm) / (self.sample_rate * self.sample_width * self.channels)
+
+    def wav_bytes(self):
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wav:
+            wav.setnchannels(self.channels)
+            wav.setsampwidth(self.sample_width)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes(self.pcm)
+        return buffer.getvalue()
+
+
+class _Pyttsx3Engine:
+
+    def __init__(self):
+        import pyttsx3
+        self.engine = pyttsx3.init()
+        self.voices = [voice.id for voice in self.engine.getProperty('voices')]
+        self.workdir = tempfile.mkdtemp(prefix='tts-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+
+    def synthesize(self, text, voice):
+        path = os.path.join(self.workdir, 'speech.wav')
+        if self.voices:
+            # Voices are numbered from 1 like the agents, cycling through what is installed
+            self.engine.setProperty('voice', self.voices[(voice - 1) % len(self.voices)])
+        self.engine.save_to_file(text, path)
+        self.engine.runAndWait()
+        try:
+            with wave.open(path, 'rb') as wav:
+                frames = wav.readframes(wav.getnframes())
+                result = (frames, wav.getframerate(), wav.getsampwidth(), wav.getnchannels())
+        finally:
+            if os.path.exists(path):
+                os.unlink(path)
+        if not frames:
+            raise TTSError("Generated audio is empty")
+        return result
+
+    def close(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class _StubEngine:
+    SAMPLE_RATE = 22050
+    voices = ['stub-low', 'stub-high']
+
+    def synthesize(self, text, voice):
+        seconds = min(0.05 * len(text), 30.0)
+        t = np.arange(int(seconds * self.SAMPLE_RATE)) / self.SAMPLE_RATE
+        pitch = 160 if voice % 2 else 220
+        samples = (6000 * np.sin(2 * np.pi * pitch * t)).astype('<i2')
+        return samples.tobytes(), self.SAMPLE_RATE, 2, 1
+
+    def close(self):
+        pass
+
+
+ENGINES = {'pyttsx3': _Pyttsx3Engine, 'stub': _StubEngine}
+
+
+def _worker_main(conn, backend):
+    """Entry point of a worker process: start one engine, then answer jobs until the pipe closes."""
+    try:
+        engine = ENGINES[backend]()
+    except Exception as e:
+        conn.send(('error', f"{type(e).__name__}: {str(e)}"))
+        return
+    conn.send(('ready', len(engine.voices)))
+    try:
+        while True:
+            try:
+                text, voice = conn.recv()
+            except EOFError:
+                return
+            try:
+                conn.send(('ok', engine.synthesize(text, voice)))
+            except Exception as e:
+                conn.send(('error', f"{type(e).__name__}: {str(e)}"))
+    finally:
+        engine.close()
+
+
+class _WorkerCrashed(Exception):
+    pass
+
+
+class _Worker:
+    """One engine process and the pipe to it, driven by a single dispatcher thread."""
+
+    def __init__(self, name, backend, context):
+        self.name = name
+        self.backend = backend
+        self.context = context
+        self.process = None
+        self.conn = None
+
+    def start(self):
+        parent_conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(target=_worker_main, args=(child_conn, self.backend),
+                                            name=self.name, daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        start = time.perf_counter()
+        if not self.conn.poll(TTS_START_TIMEOUT):
+            self.stop()
+            raise TTSError(f"TTS engine did not start within {TTS_START_TIMEOUT}s")
+        try:
+            status, payload = self.conn.recv()
+        except EOFError:
+            self.stop()
+            raise TTSError("TTS engine process exited during start-up")
+        if status != 'ready':
+            self.stop()
+            raise TTSError(f"TTS engine failed to start: {payload}")
+        logger.info(f"Started {self.name} ({self.backend}, {payload} voices) in {time.perf_counter() - start:.2f}s")
+
+    def stop(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.process is not None:
+            if self.process.is_alive():
+                self.process.kill()
+            self.process.join()
+            self.process = None
+
+    def replace(self):
+        """Start a fresh process after a crash or timeout, before the next job needs it."""
+        TTS_METRICS.record('tts', restarts=1)
+        try:
+            self.start()
+        except TTSError as e:
+            # Tried again when the next job arrives
+            logger.error(f"Could not restart {self.name}: {str(e)}")
+
+    def run(self, text, voice, timeout):
+        if self.process is not None and not self.process.is_alive():
+            TTS_METRICS.record('tts', crashes=1)
+            self.stop()
+        if self.process is None:
+            self.start()
+        try:
+            self.conn.send((text, voice))
+            if not self.conn.poll(timeout):
+                # Stuck in the engine: the only way out is a new process
+                TTS_METRICS.record('tts', timeouts=1)
+                self.stop()
+                raise TTSTimeoutError(f"Speech synthesis took longer than {timeout}s")
+            status, payload = self.conn.recv()
+        except (EOFError, BrokenPipeError, ConnectionResetError) as e:
+            TTS_METRICS.record('tts', crashes=1)
+            self.stop()
+            raise _WorkerCrashed(str(e))
+        if status != 'ok':
+            raise TTSError(payload)
+        return Speech(*payload)
+
+
+class TTSPool:
+    """Fixed set of TTS worker processes fed from one job queue."""
+
+    def __init__(self, workers=2, backend='pyttsx3'):
+        self.size = workers
+        self.backend = backend
+        self._jobs = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._started = False
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._started:
+                return
+            # spawn, not fork: engines must not inherit the server's threads and locks
+            context = multiprocessing.get_context('spawn')
+            for number in range(self.size):
+                worker = _Worker(f'tts-worker-{number}', self.backend, context)
+                self._workers.append(worker)
+                threading.Thread(target=self._dispatch, args=(worker,), daemon=True,
+                                 name=f'tts-dispatch-{number}').start()
+            self._started = True
+
+    def _dispatch(self, worker):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                worker.stop()
+                return
+            future, text, voice, timeout, queued_at = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            TTS_METRICS.record('tts_queue', latency=time.perf_counter() - queued_at)
+            start = time.perf_counter()
+            for attempt in range(TTS_MAX_RETRIES + 1):
+                try:
+                    speech = worker.run(text, voice, timeout)
+                except _WorkerCrashed as e:
+                    logger.warning(f"{worker.name} crashed ({str(e) or 'pipe closed'}), attempt {attempt + 1}")
+                    if attempt < TTS_MAX_RETRIES:
+                        continue
+                    future.set_exception(TTSError("TTS engine crashed while synthesizing"))
+                    worker.replace()
+                except TTSTimeoutError as e:
+                    TTS_METRICS.record('tts', latency=time.perf_counter() - start, calls=1, failures=1)
+                    future.set_exception(e)
+                    worker.replace()
+                except Exception as e:
+                    TTS_METRICS.record('tts', latency=time.perf_counter() - start, calls=1, failures=1)
+                    future.set_exception(e)
+                else:
+                    TTS_METRICS.record('tts', latency=time.perf_counter() - start, calls=1,
+                                       characters=len(text), audio_ms=round(speech.duration * 1000))
+                    future.set_result(speech)
+                break
+
+    def submit(self, text, voice=1, timeout=None):
+        """Queue ``text`` for synthesis with voice number ``voice``; returns a Future of Speech."""
+        self._ensure_started()
+        future = Future()
+        self._jobs.put((future, text, voice, timeout or TTS_JOB_TIMEOUT, time.perf_counter()))
+        return future
+
+    def synthesize(self, text, voice=1, timeout=None):
+        return self.submit(text, voice, timeout).result()
+
+    def stats(self):
+        return {
+            'backend': self.backend,
+            'workers': self.size,
+            'alive': sum(1 for worker in self._workers if worker.process is not None and worker.process.is_alive()),
+            'queued': self._jobs.qsize(),
+            'calls': TTS_METRICS.snapshot(),
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if not self._started:
+                return
+            for _ in self._workers:
+                self._jobs.put(None)
+            self._started = False
+
+
+TTS_POOL = TTSPool(workers=TTS_WORKERS, backend=TTS_BACKEND)
+atexit.register(TTS_POOL.shutdown)
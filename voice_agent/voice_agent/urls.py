@@ -17,14 +17,28 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 from django.views.generic import TemplateView
-from . import views
+from . import async_views, discussion, views, voice_stream
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', TemplateView.as_view(template_name='index.html')),
     path('api/upload/', views.upload_document, name='upload_document'),
+    path('api/ingestion-jobs/<int:job_id>/', views.ingestion_job_status, name='ingestion_job_status'),
     path('api/process-message/', views.process_message, name='process_message'),
+    path('api/process-message/stream/', views.process_message_stream, name='process_message_stream'),
+    path('api/discussion/', discussion.discussion, name='discussion'),
     path('api/voice-input/', views.process_voice_input, name='process_voice_input'),
+    path('api/voice-stream/', voice_stream.voice_stream_start, name='voice_stream_start'),
+    path('api/voice-stream/<str:stream_id>/audio/', voice_stream.voice_stream_audio, name='voice_stream_audio'),
+    path('api/voice-stream/<str:stream_id>/finish/', voice_stream.voice_stream_finish, name='voice_stream_finish'),
     path('api/voice-response/', views.generate_voice_response, name='generate_voice_response'),
     path('api/podcast-tts/', views.podcast_tts, name='podcast-tts'),
+    path('api/search/', views.search, name='search'),
+    path('api/metrics/', views.metrics, name='metrics'),
+    # asyncio views, for deployments running voice_agent.asgi under an ASGI server
+    path('api/async/upload/', async_views.upload_document, name='async_upload_document'),
+    path('api/async/process-message/', async_views.process_message, name='async_process_message'),
+    path('api/async/voice-input/', async_views.process_voice_input, name='async_process_voice_input'),
+    path('api/async/voice-response/', async_views.generate_voice_response, name='async_generate_voice_response'),
+    path('api/async/podcast-tts/', async_views.podcast_tts, name='async_podcast_tts'),
 ]
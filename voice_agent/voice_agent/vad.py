@@ -0,0 +1,106 @@
+"""Voice activity detection on 16 kHz mono PCM.
+
+Frames are classified in one vectorized pass. A frame is speech when its RMS
+energy clears a threshold set from the clip's own noise floor (and never
+below VAD_MIN_ENERGY). Quieter frames count too when their zero-crossing
+rate marks them as unvoiced consonants (s, f, th), which energy alone would
+cut off. Speech runs shorter than VAD_MIN_SPEECH_MS are dropped as clicks.
+Runs separated by less than VAD_MIN_SILENCE_MS are merged into one
+utterance, up to VAD_MAX_UTTERANCE_MS, and each utterance keeps
+VAD_PADDING_MS of context on both sides.
+"""
+import logging
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .audio import SAMPLE_RATE, SAMPLE_WIDTH
+from .speech import SPEECH_METRICS
+
+logger = logging.getLogger(__name__)
+
+VAD_FRAME_MS = getattr(settings, 'VAD_FRAME_MS', 30)
+# Minimum RMS (of 32768) for speech, however quiet the recording's noise floor
+VAD_MIN_ENERGY = getattr(settings, 'VAD_MIN_ENERGY', 300)
+# Speech must be this many times louder than the noise floor (10th percentile frame energy)
+VAD_NOISE_RATIO = getattr(settings, 'VAD_NOISE_RATIO', 3.0)
+# Unvoiced consonants: above half the threshold with at least this zero-crossing rate
+VAD_FRICATIVE_ZCR = getattr(settings, 'VAD_FRICATIVE_ZCR', 0.25)
+VAD_MIN_SPEECH_MS = getattr(settings, 'VAD_MIN_SPEECH_MS', 150)
+VAD_MIN_SILENCE_MS = getattr(settings, 'VAD_MIN_SILENCE_MS', 600)
+VAD_PADDING_MS = getattr(settings, 'VAD_PADDING_MS', 200)
+# Longer speech is cut into pieces; online recognizers reject clips of about a minute
+VAD_MAX_UTTERANCE_MS = getattr(settings, 'VAD_MAX_UTTERANCE_MS', 30_000)
+
+
+def _frames(pcm):
+    samples = np.frombuffer(pcm, dtype='<i2')
+    frame_length = SAMPLE_RATE * VAD_FRAME_MS // 1000
+    count = len(samples) // frame_length
+    return samples[:count * frame_length].reshape(count, frame_length).astype(np.float32), frame_length
+
+
+def _runs(mask):
+    """(start, end) frame indices of the True runs in a boolean array."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def speech_frames(pcm):
+    """Return a boolean speech mask with one entry per VAD_FRAME_MS frame, and the frame length."""
+    frames, frame_length = _frames(pcm)
+    if not len(frames):
+        return np.zeros(0, dtype=bool), frame_length
+    energy = np.sqrt(np.mean(frames * frames, axis=1))
+    zcr = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+    floor, peak = np.percentile(energy, [10, 90])
+    # Capped below the loud frames so a clip with no pauses is not judged against its own speech
+    threshold = max(VAD_MIN_ENERGY, min(VAD_NOISE_RATIO * float(floor), 0.5 * float(peak)))
+    mask = (energy >= threshold) | ((energy >= threshold / 2) & (zcr >= VAD_FRICATIVE_ZCR))
+
+    starts, ends = _runs(mask)
+    min_speech = max(1, VAD_MIN_SPEECH_MS // VAD_FRAME_MS)
+    for start, end in zip(starts, ends):
+        if end - start < min_speech:
+            mask[start:end] = False
+    return mask, frame_length
+
+
+def detect_utterances(pcm):
+    """Return (start, end) byte offsets of each utterance in ``pcm``, padded and merged across short pauses."""
+    mask, frame_length = speech_frames(pcm)
+    starts, ends = _runs(mask)
+    if not len(starts):
+        return []
+    min_gap = VAD_MIN_SILENCE_MS // VAD_FRAME_MS
+    padding = VAD_PADDING_MS // VAD_FRAME_MS
+    max_frames = VAD_MAX_UTTERANCE_MS // VAD_FRAME_MS
+    utterances = []
+    for start, end in zip(starts, ends):
+        if utterances and start - utterances[-1][1] < min_gap and end - utterances[-1][0] <= max_frames:
+            utterances[-1][1] = end
+        else:
+            # A single run with no pause long enough to split at is cut every max_frames
+            utterances.extend([piece, min(piece + max_frames, end)] for piece in range(start, end, max_frames))
+    frame_bytes = frame_length * SAMPLE_WIDTH
+    return [(int(max(0, start - padding) * frame_bytes), int(min(len(pcm), (end + padding) * frame_bytes)))
+            for start, end in utterances]
+
+
+def has_speech(pcm):
+    mask, _ = speech_frames(pcm)
+    return bool(mask.any())
+
+
+def split_utterances(pcm):
+    """Trim silence from ``pcm`` and split it into utterances; an empty list means no speech."""
+    start = time.perf_counter()
+    utterances = [pcm[begin:end] for begin, end in detect_utterances(pcm)]
+    total_ms = round(len(pcm) / (SAMPLE_RATE * SAMPLE_WIDTH) * 1000)
+    kept_ms = round(sum(len(u) for u in utterances) / (SAMPLE_RATE * SAMPLE_WIDTH) * 1000)
+    SPEECH_METRICS.record('vad', latency=time.perf_counter() - start, calls=1, audio_ms_in=total_ms,
+                          audio_ms_kept=kept_ms, utterances=len(utterances), rejected=int(not utterances))
+    logger.info(f"VAD kept {kept_ms} of {total_ms}ms in {len(utterances)} utterance(s) "
+                f"in {time.perf_counter() - start:.4f}s")
+    return utterances
@@ -0,0 +1,127 @@
+"""FAISS index construction sized to the corpus.
+
+Small corpora use an exact flat index. Larger ones switch to approximate
+indexes: IVF (trained k-means centroids) or HNSW, and IVF-PQ when the raw
+vectors would no longer fit comfortably in memory. ``nprobe`` and
+``efSearch`` trade recall for latency and can be changed without rebuilding.
+"""
+import logging
+import math
+import time
+
+import faiss
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+FLAT = 'flat'
+IVF = 'ivf'
+HNSW = 'hnsw'
+IVFPQ = 'ivfpq'
+INDEX_TYPES = (FLAT, IVF, HNSW, IVFPQ)
+
+# 'auto' picks by corpus size; any of INDEX_TYPES forces that type
+ANN_INDEX_TYPE = getattr(settings, 'ANN_INDEX_TYPE', 'auto')
+ANN_FLAT_MAX_VECTORS = getattr(settings, 'ANN_FLAT_MAX_VECTORS', 5_000)
+ANN_PQ_MIN_VECTORS = getattr(settings, 'ANN_PQ_MIN_VECTORS', 500_000)
+# Approximate type used between the flat and PQ thresholds
+ANN_MIDSIZE_TYPE = getattr(settings, 'ANN_MIDSIZE_TYPE', IVF)
+ANN_IVF_NPROBE = getattr(settings, 'ANN_IVF_NPROBE', 16)
+ANN_HNSW_M = getattr(settings, 'ANN_HNSW_M', 32)
+ANN_HNSW_EF_CONSTRUCTION = getattr(settings, 'ANN_HNSW_EF_CONSTRUCTION', 80)
+ANN_HNSW_EF_SEARCH = getattr(settings, 'ANN_HNSW_EF_SEARCH', 64)
+ANN_PQ_M = getattr(settings, 'ANN_PQ_M', 32)
+ANN_PQ_NBITS = getattr(settings, 'ANN_PQ_NBITS', 8)
+
+# k-means wants a few dozen training points per centroid; more only slows training
+MIN_POINTS_PER_CENTROID = 39
+MAX_POINTS_PER_CENTROID = 256
+
+
+def choose_index_type(n_vectors, index_type=None):
+    """Return the index type to build for a corpus of ``n_vectors``."""
+    index_type = index_type or ANN_INDEX_TYPE
+    if index_type in INDEX_TYPES:
+        return index_type
+    if n_vectors <= ANN_FLAT_MAX_VECTORS:
+        return FLAT
+    if n_vectors >= ANN_PQ_MIN_VECTORS:
+        return IVFPQ
+    return ANN_MIDSIZE_TYPE
+
+
+def ivf_nlist(n_vectors):
+    """Number of IVF centroids: about 4*sqrt(n), capped so k-means has enough points."""
+    nlist = int(4 * math.sqrt(n_vectors))
+    return max(1, min(nlist, n_vectors // MIN_POINTS_PER_CENTROID))
+
+
+def ivf_training_size(nlist):
+    """Smallest corpus ivf_nlist() gives ``nlist`` centroids, i.e. the size an IVF index was trained for."""
+    return max(math.ceil((nlist / 4) ** 2), nlist * MIN_POINTS_PER_CENTROID)
+
+
+def pq_subquantizers(dimension, requested=None):
+    """Largest sub-quantizer count <= requested that divides the dimension."""
+    m = min(requested or ANN_PQ_M, dimension)
+    while dimension % m:
+        m -= 1
+    return m
+
+
+def _training_sample(vectors, nlist, seed=0):
+    limit = nlist * MAX_POINTS_PER_CENTROID
+    if len(vectors) <= limit:
+        return vectors
+    rows = np.random.default_rng(seed).choice(len(vectors), size=limit, replace=False)
+    return vectors[np.sort(rows)]
+
+
+def build_index(vectors, index_type=None, nprobe=None, ef_search=None, ids=None):
+    """Build and fill a FAISS index for ``vectors`` (an (n, d) float32 array).
+
+    With ``ids`` the vectors are added under those int64 ids; flat and HNSW
+    indexes are wrapped in an IndexIDMap2 for that.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    n_vectors, dimension = vectors.shape
+    index_type = choose_index_type(n_vectors, index_type)
+    start = time.perf_counter()
+    if index_type in (IVF, IVFPQ) and ivf_nlist(n_vectors) < 2:
+        # Too few vectors to train centroids
+        index_type = FLAT
+
+    if index_type == FLAT:
+        index = faiss.IndexFlatL2(dimension)
+    elif index_type == HNSW:
+        index = faiss.IndexHNSWFlat(dimension, ANN_HNSW_M)
+        index.hnsw.efConstruction = ANN_HNSW_EF_CONSTRUCTION
+    else:
+        nlist = ivf_nlist(n_vectors)
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == IVFPQ:
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_subquantizers(dimension), ANN_PQ_NBITS)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        index.train(_training_sample(vectors, nlist))
+    if ids is None:
+        index.add(vectors)
+    else:
+        if index_type in (FLAT, HNSW):
+            index = faiss.IndexIDMap2(index)
+        index.add_with_ids(vectors, np.ascontiguousarray(ids, dtype='int64'))
+    configure_search(index, nprobe=nprobe, ef_search=ef_search)
+    logger.info(f"Built {index_type} index ({type(index).__name__}) over {n_vectors} vectors "
+                f"in {time.perf_counter() - start:.3f}s")
+    return index
+
+
+def configure_search(index, nprobe=None, ef_search=None):
+    """Apply the recall/latency knobs to an index; a no-op for exact indexes."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe or ANN_IVF_NPROBE, ivf.nlist)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search or ANN_HNSW_EF_SEARCH
+    return index
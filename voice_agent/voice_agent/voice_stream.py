@@ -0,0 +1,284 @@
+"""Streaming voice input with partial transcripts.
+
+Audio is sent while the user is still speaking, either over a WebSocket
+(``/ws/voice/``, when served through voice_agent.asgi) or as a series of
+HTTP POSTs to ``/api/voice-stream/``. Each piece returns the partial
+transcript so far, and the final transcript arrives when the client ends the
+stream. Audio is raw 16 kHz mono s16le PCM (``format=pcm``) or an encoded
+recording such as MediaRecorder's WebM (``format=webm``), which one ffmpeg
+process decodes as it arrives.
+
+Leading silence never reaches the recognizer, and a stream with no speech
+in it is rejected without a recognizer call (see vad.py).
+
+When the stream names a ``document_id``, partial transcripts start retrieval
+in the background. That loads the document's index and fills the query
+embedding and search caches, so the ``process_message`` call that follows
+the final transcript finds them warm.
+
+HTTP stream ids live in this worker's memory, so deployments with several
+workers need sticky sessions for ``/api/voice-stream/``.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import speech_recognition as sr
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import JsonResponse
+from rest_framework.decorators import api_view
+
+from .audio import FFMPEG_DECODER, SAMPLE_RATE, SAMPLE_WIDTH, AudioConversionError
+from .documents import search_hybrid
+from .index_store import INDEX_STORE
+from .speech import SPEECH_METRICS, get_recognizer
+from .vad import VAD_PADDING_MS, has_speech
+
+logger = logging.getLogger(__name__)
+
+VOICE_STREAM_FORMATS = ('pcm', 'webm')
+# HTTP streams with no audio for this many seconds are dropped
+VOICE_STREAM_IDLE_TIMEOUT = getattr(settings, 'VOICE_STREAM_IDLE_TIMEOUT', 60)
+# Partials shorter than this are not worth a retrieval
+VOICE_PREFETCH_MIN_WORDS = getattr(settings, 'VOICE_PREFETCH_MIN_WORDS', 3)
+
+# Leading audio gathered before asking the VAD whether speech has started
+VAD_PROBE_BYTES = SAMPLE_RATE * SAMPLE_WIDTH * 3 // 10
+VAD_PADDING_BYTES = SAMPLE_RATE * SAMPLE_WIDTH * VAD_PADDING_MS // 1000
+
+_prefetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='voice-prefetch')
+
+
+def _prefetch(document_id, text):
+    try:
+        indexed_document = INDEX_STORE.get(document_id)
+        if indexed_document is not None:
+            search_hybrid(text, indexed_document)
+    except Exception as e:
+        logger.warning(f"Retrieval prefetch for document {document_id} failed: {str(e)}")
+    finally:
+        close_old_connections()
+
+
+class VoiceStream:
+    """Recognition of one utterance fed in pieces."""
+
+    def __init__(self, audio_format='pcm', document_id=None):
+        if audio_format not in VOICE_STREAM_FORMATS:
+            raise ValueError(f"Unsupported audio format: {audio_format}")
+        self.document_id = int(document_id) if document_id else None
+        self.recognition = get_recognizer().stream()
+        self.decoder = FFMPEG_DECODER.open_stream() if audio_format != 'pcm' else None
+        self.partial = ''
+        self.audio_bytes = 0
+        self.speech_started = False
+        self._pending = bytearray()
+        self.last_activity = time.monotonic()
+        self._prefetched = ''
+        self._prefetch = None
+        self._lock = threading.Lock()
+
+    def feed(self, data):
+        """Add the next piece of audio and return the partial transcript."""
+        with self._lock:
+            self.last_activity = time.monotonic()
+            pcm = self.decoder.feed(data) if self.decoder else data
+            self._accept(pcm)
+            self._maybe_prefetch()
+            return self.partial
+
+    def _accept(self, pcm):
+        self.audio_bytes += len(pcm)
+        if not self.speech_started:
+            # Hold audio back from the recognizer until the VAD hears speech, keeping
+            # only the padding tail of the silence before it
+            self._pending.extend(pcm)
+            if len(self._pending) < VAD_PROBE_BYTES or not has_speech(bytes(self._pending)):
+                if len(self._pending) >= VAD_PROBE_BYTES:
+                    del self._pending[:-VAD_PADDING_BYTES]
+                return
+            self.speech_started = True
+            pcm = bytes(self._pending)
+            self._pending.clear()
+        if pcm:
+            self.partial = self.recognition.accept(pcm)
+
+    def _maybe_prefetch(self):
+        text = self.partial
+        if (not self.document_id or text == self._prefetched
+                or len(text.split()) < VOICE_PREFETCH_MIN_WORDS
+                or (self._prefetch is not None and not self._prefetch.done())):
+            return
+        self._prefetched = text
+        self._prefetch = _prefetch_executor.submit(_prefetch, self.document_id, text)
+
+    def finish(self):
+        """End the audio and return the final transcript."""
+        with self._lock:
+            if self.decoder:
+                self._accept(self.decoder.finish())
+            if not self.speech_started and not has_speech(bytes(self._pending)):
+                SPEECH_METRICS.record('vad', calls=1, rejected=1,
+                                      audio_ms_in=round(self.audio_bytes / (SAMPLE_RATE * SAMPLE_WIDTH) * 1000))
+                raise sr.UnknownValueError()
+            if self._pending:
+                self.recognition.accept(bytes(self._pending))
+                self._pending.clear()
+            text = self.recognition.finish()
+            self.partial = text
+            self._maybe_prefetch()
+            logger.info(f"Streamed recognition finished after {self.audio_bytes / (SAMPLE_RATE * SAMPLE_WIDTH):.1f}s of audio: {text}")
+            return text
+
+    def close(self):
+        if self.decoder:
+            self.decoder.close()
+
+
+_streams = {}
+_streams_lock = threading.Lock()
+
+
+def _expire_idle_streams():
+    cutoff = time.monotonic() - VOICE_STREAM_IDLE_TIMEOUT
+    with _streams_lock:
+        expired = [stream_id for stream_id, stream in _streams.items() if stream.last_activity < cutoff]
+        streams = [_streams.pop(stream_id) for stream_id in expired]
+    for stream in streams:
+        stream.close()
+
+
+def _recognition_error(e):
+    """Map a recognition failure to the same responses as process_voice_input."""
+    if isinstance(e, ValueError):
+        # Bad stream parameters
+        return {'error': str(e)}, 400
+    if isinstance(e, sr.UnknownValueError):
+        return {'error': 'Could not understand audio. Please try speaking more clearly.'}, 400
+    if isinstance(e, sr.RequestError):
+        logger.error(f"Could not request results from speech recognition service: {str(e)}")
+        return {'error': 'Speech recognition service error. Please try again.'}, 500
+    if isinstance(e, AudioConversionError):
+        logger.error(f"FFmpeg conversion error: {str(e)}")
+        return {'error': 'Failed to convert audio format'}, 500
+    if isinstance(e, FileNotFoundError):
+        logger.error("FFmpeg not found. Please install FFmpeg.")
+        return {'error': 'Audio conversion service not available'}, 500
+    logger.error(f"Error processing voice stream: {str(e)}", exc_info=True)
+    return {'error': f'Error processing voice input: {str(e)}'}, 500
+
+
+@api_view(['POST'])
+def voice_stream_start(request):
+    """Open a voice stream. Body: ``{"format": "pcm"|"webm", "document_id": ...}``."""
+    _expire_idle_streams()
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    try:
+        stream = VoiceStream(data.get('format', 'pcm'), data.get('document_id'))
+    except Exception as e:
+        payload, status = _recognition_error(e)
+        return JsonResponse(payload, status=status)
+    stream_id = uuid.uuid4().hex
+    with _streams_lock:
+        _streams[stream_id] = stream
+    return JsonResponse({'stream_id': stream_id, 'sample_rate': SAMPLE_RATE}, status=201)
+
+
+@api_view(['POST'])
+def voice_stream_audio(request, stream_id):
+    """Append the raw audio in the request body and return the partial transcript."""
+    with _streams_lock:
+        stream = _streams.get(stream_id)
+    if stream is None:
+        return JsonResponse({'error': 'Unknown or expired stream'}, status=404)
+    try:
+        return JsonResponse({'partial': stream.feed(request.body)})
+    except Exception as e:
+        with _streams_lock:
+            _streams.pop(stream_id, None)
+        stream.close()
+        payload, status = _recognition_error(e)
+        return JsonResponse(payload, status=status)
+
+
+@api_view(['POST'])
+def voice_stream_finish(request, stream_id):
+    """End a stream and return its final transcript."""
+    with _streams_lock:
+        stream = _streams.pop(stream_id, None)
+    if stream is None:
+        return JsonResponse({'error': 'Unknown or expired stream'}, status=404)
+    try:
+        if request.body:
+            stream.feed(request.body)
+        return JsonResponse({'text': stream.finish()})
+    except Exception as e:
+        payload, status = _recognition_error(e)
+        return JsonResponse(payload, status=status)
+    finally:
+        stream.close()
+
+
+def _is_end_message(text):
+    text = (text or '').strip()
+    if text == 'end':
+        return True
+    try:
+        return json.loads(text).get('type') == 'end'
+    except (ValueError, AttributeError):
+        return False
+
+
+async def voice_websocket(scope, receive, send):
+    """ASGI WebSocket handler for ``/ws/voice/?format=pcm&document_id=...``.
+
+    Binary frames carry audio and are answered with ``{"type": "partial"}``
+    messages; a text frame ``end`` (or ``{"type": "end"}``) is answered with
+    ``{"type": "final", "text": ...}`` and closes the socket.
+    """
+    query = parse_qs(scope.get('query_string', b'').decode())
+    stream = None
+    sent_partial = ''
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.connect':
+                try:
+                    stream = await sync_to_async(VoiceStream, thread_sensitive=False)(
+                        query.get('format', ['pcm'])[0], query.get('document_id', [None])[0])
+                except Exception as e:
+                    payload, _ = _recognition_error(e)
+                    await send({'type': 'websocket.accept'})
+                    await send({'type': 'websocket.send', 'text': json.dumps({'type': 'error', **payload})})
+                    await send({'type': 'websocket.close', 'code': 1011})
+                    return
+                await send({'type': 'websocket.accept'})
+            elif message['type'] == 'websocket.receive':
+                if message.get('bytes'):
+                    partial = await sync_to_async(stream.feed, thread_sensitive=False)(message['bytes'])
+                    if partial != sent_partial:
+                        sent_partial = partial
+                        await send({'type': 'websocket.send', 'text': json.dumps({'type': 'partial', 'text': partial})})
+                elif _is_end_message(message.get('text')):
+                    text = await sync_to_async(stream.finish, thread_sensitive=False)()
+                    await send({'type': 'websocket.send', 'text': json.dumps({'type': 'final', 'text': text})})
+                    await send({'type': 'websocket.close', 'code': 1000})
+                    return
+            elif message['type'] == 'websocket.disconnect':
+                return
+    except Exception as e:
+        payload, _ = _recognition_error(e)
+        await send({'type': 'websocket.send', 'text': json.dumps({'type': 'error', **payload})})
+        await send({'type': 'websocket.close', 'code': 1011})
+    finally:
+        if stream is not None:
+            await sync_to_async(stream.close, thread_sensitive=False)()
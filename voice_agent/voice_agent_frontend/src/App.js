@@ -586,6 +586,22 @@ function App() {
         throw new Error(data.error || 'Failed to upload document');
       }
 
+      // Indexing runs in the background; poll the job until it finishes
+      if (data.job_id) {
+        let job = null;
+        do {
+          await new Promise(resolve => setTimeout(resolve, 1000));
+          const jobResponse = await fetch(`http://127.0.0.1:8000/api/ingestion-jobs/${data.job_id}/`);
+          job = await jobResponse.json();
+          if (!jobResponse.ok) {
+            throw new Error(job.error || 'Failed to check indexing status');
+          }
+        } while (!job.finished);
+        if (job.stage === 'failed') {
+          throw new Error(job.error || 'Failed to index document');
+        }
+      }
+
       setCurrentDocument(data);
       // Only ask to reset context if it's not the initial document upload and there's context to reset
       if (hasInitialDocument && (discussionHistory.length > 0 || lastUserPrompt || agents.some(agent => agent.messages.length > 0))) {